@@ -82,26 +82,10 @@ def run_analysis(input_file: Path, psl_file: Path):
         psl_io.write(psl)
         psl_io.seek(0)
 
-        # Deployment data
-        nel_analysis.nel_deployment(input_file, date, ANALYSIS_OUTPUT_DIR)
-
-        # Domain deployment stats data
-        nel_analysis.nel_domain_resource_monitoring_stats(input_file, date, ANALYSIS_OUTPUT_DIR)
-
-        # Collector data
+        # All metrics are computed during a single pass over the crawled data file
         # (no months to aggregate collector providers over, just passing emtpy array as the aggregated value)
         collector_providers_so_far = np.empty(0, dtype=str)
-        nel_analysis.nel_collector_provider_usage(input_file, collector_providers_so_far, date, psl_io,
-                                                  ANALYSIS_OUTPUT_DIR)
-
-        # Domain configuration data
-        nel_analysis.nel_config(input_file, date, ANALYSIS_OUTPUT_DIR)
-
-        # Resource configuration data
-        nel_analysis.nel_resource_config_variability(input_file, date, ANALYSIS_OUTPUT_DIR)
-
-        # Resource type data
-        nel_analysis.nel_monitored_resource_types(input_file, date, ANALYSIS_OUTPUT_DIR)
+        nel_analysis.analyze_month(input_file, date, collector_providers_so_far, psl_io, ANALYSIS_OUTPUT_DIR)
 
     logger.info("Done. Exiting...")
 
@@ -11,17 +11,19 @@ description:    Analyzes the downloaded raw HTTP Archive data from the Google Cl
 purpose:        Prepares the downloaded raw NEL data to be later visualized by per-metric visualization scripts.
 """
 
+import argparse
 import gc
-import io
 import logging
 import pathlib
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from typing import List
 
-import numpy as np
-
 import src.nel_analyis as nel_analysis
-from src import psl_utils
+from src import nel_dataset, psl_utils
+from src.classes.AnalysisManifest import AnalysisManifest, FileFingerprint
+from src.classes.CollectorProviderIndex import CollectorProviderIndex
 
 # LOGGING
 logging.basicConfig(stream=sys.stdout, level=logging.INFO,
@@ -34,10 +36,23 @@ logger = logging.getLogger(__name__)
 
 # Download directory structure
 NEL_DATA_DIR_PATH = "data/httparchive_raw"
+# Hive-partitioned NEL dataset (used instead of the month data files in NEL_DATA_DIR_PATH when it contains any months)
+NEL_DATASET_DIR_PATH = "data/httparchive_dataset"
 PSL_DIR_PATH = "resources/public_suffix_lists"
+# Merged & compiled PSLs (one for each combination of a historic & the current PSL file)
+PSL_CACHE_DIR_PATH = "data/psl_cache"
 
 ANALYSIS_OUTPUT_DIR = "data/httparchive_metrics/"
 
+# First values of the domain-level columns for each url_domain of a month (shared by all the domain metrics)
+DOMAIN_TABLE_DIR_PATH = "data/httparchive_domain_tables"
+
+# Records what each metric result was computed from - only stale results are recomputed on subsequent runs
+ANALYSIS_MANIFEST_PATH = f"{ANALYSIS_OUTPUT_DIR}/analysis_manifest.json"
+
+# Ordered collector providers found throughout the analyzed months (with the month each provider was first seen in)
+COLLECTOR_PROVIDER_INDEX_PATH = f"{ANALYSIS_OUTPUT_DIR}/collector_provider_index.parquet"
+
 # True:
 #   Use the pre-computed "registrable domain name" columns from BigQuery HttpArchive data (use "data download time" PSL)
 # False:
@@ -48,9 +63,23 @@ APP_IGNORE_LOCAL_PSL_FILES = False  # Default = False
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Analyze the downloaded HTTP Archive NEL data")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of months to analyze in parallel (separate processes). Default = 1 (serial run)")
+    parser.add_argument("--force", action="store_true",
+                        help="Recompute every metric for every month, even the ones that are up-to-date")
+    parser.add_argument("--months", nargs="+", metavar="YYYY-MM",
+                        help="Analyze only the given months (the previous months have to be analyzed already)")
+    args = parser.parse_args()
+
     nel_data_dir = pathlib.Path(NEL_DATA_DIR_PATH)
     nel_data_dir.mkdir(exist_ok=True, parents=True)
-    input_files = list(nel_data_dir.glob("nel_data_*.parquet"))
+    # Collector providers are aggregated throughout the months - make sure the months are processed in order
+    input_files = nel_dataset.month_partition_dirs(NEL_DATASET_DIR_PATH)
+    if len(input_files) > 0:
+        logger.info(f"Using the month partitions of the NEL dataset in ---{NEL_DATASET_DIR_PATH}---")
+    else:
+        input_files = sorted(nel_data_dir.glob("nel_data_*.parquet"))
 
     psl_dir = pathlib.Path(PSL_DIR_PATH)
     psl_dir.mkdir(exist_ok=True, parents=True)
@@ -65,66 +94,214 @@ def main():
     if len(input_files) < 1:
         logger.error("No input files found")
     else:
-        run_analysis(input_files, psl_files)
+        run_analysis(input_files, psl_files, args.workers, args.force, args.months)
+
+
+@dataclass
+class MonthPlan:
+    input_file: pathlib.Path
+    date: str
+    input_fingerprint: FileFingerprint
+    psl_files: List[pathlib.Path]
+    psl_digest: str | None
+    stale_metrics: List[str]
+
+
+def run_analysis(input_files: List[pathlib.Path], psl_files: List[pathlib.Path], workers: int = 1,
+                 force: bool = False, selected_months: List[str] | None = None):
+    """
+    Analyze all the month data files.
+
+    Only the metric results that are stale (missing, computed from a different input, PSL or metric implementation)
+    are computed - see the analysis manifest.
+
+    Every month is analyzed independently (optionally in parallel processes). The only state aggregated throughout
+    the months - collector providers found so far - is kept in the collector provider index. The index is updated
+    month by month in the original order, so the results of a parallel run are identical to the results of a serial one.
+
+    :param input_files: Month data files ordered by their date
+    :param psl_files: Available Public Suffix List files
+    :param workers: Number of processes to analyze the months with
+    :param force: Recompute all the metrics regardless of the manifest
+    :param selected_months: Analyze only these months (YYYY-MM). All the months by default
+    """
+    manifest = AnalysisManifest.load(ANALYSIS_MANIFEST_PATH)
+    provider_index = CollectorProviderIndex.load(COLLECTOR_PROVIDER_INDEX_PATH)
+
+    month_plans = [plan_month(input_file, psl_files, manifest, force) for input_file in input_files]
+
+    # Months whose data files are gone must not contribute collector providers anymore
+    available_dates = [plan.date for plan in month_plans]
+    for registered_date in provider_index.get_registered_months():
+        if registered_date not in available_dates:
+            provider_index.unregister_month(registered_date)
+
+    # Collector provider usage depends on the providers found in all the previous months - once it gets recomputed
+    # for a month (or the providers registered before the month change), it must be recomputed for every subsequent
+    # month too
+    collector_metric_name = nel_analysis.CollectorProviderUsageMetric.name
+    previous_months_changed = False
+    for plan in month_plans:
+        if (not provider_index.is_registered(plan.date)
+                or manifest.get_state(plan.date, collector_metric_name, "aggregated_providers_sha256")
+                != provider_index.providers_before_digest(plan.date)):
+            previous_months_changed = True
+
+        if collector_metric_name in plan.stale_metrics:
+            previous_months_changed = True
+        elif previous_months_changed:
+            plan.stale_metrics.append(collector_metric_name)
+
+    if selected_months is not None:
+        month_plans = select_month_plans(month_plans, selected_months, provider_index)
+
+    months_to_analyze = [plan for plan in month_plans if len(plan.stale_metrics) > 0]
+
+    logger.info(f"{len(months_to_analyze)} out of {len(month_plans)} months have stale metrics to compute")
+
+    if workers > 1:
+        logger.info(f"Analyzing {len(months_to_analyze)} months using {workers} worker processes")
+        executor = ProcessPoolExecutor(max_workers=workers)
+        month_results = executor.map(analyze_month_file,
+                                     [plan.input_file for plan in months_to_analyze],
+                                     [psl_files] * len(months_to_analyze),
+                                     [plan.stale_metrics for plan in months_to_analyze])
+    else:
+        executor = None
+        month_results = (analyze_month_file(plan.input_file, psl_files, plan.stale_metrics)
+                         for plan in months_to_analyze)
+
+    try:
+        # Ordered reduction (map() yields the results in the order of the input files)
+        for plan in months_to_analyze:
+            collector_provider_usage = next(month_results)
+
+            if collector_provider_usage is not None:
+                # Collector data (aggregate unique collector providers throughout the analyzed months)
+                provider_index.register_month(plan.date, collector_provider_usage.month_providers)
+                nel_analysis.save_collector_provider_usage(collector_provider_usage,
+                                                           provider_index.providers_before(plan.date),
+                                                           ANALYSIS_OUTPUT_DIR)
+                provider_index.save(COLLECTOR_PROVIDER_INDEX_PATH)
+
+            # Popular Collector data (same as above but use TRANCO list of popular domains for current date)
+            # popular_collector_providers_so_far = \
+            #     nel_analysis.nel_popular_domain_collector_provider_usage(input_file,
+            #                                                              popular_collector_providers_so_far, date,
+            #                                                              psl_io, ANALYSIS_OUTPUT_DIR)
+
+            for metric_name in plan.stale_metrics:
+                if metric_name == collector_metric_name:
+                    state = {
+                        "aggregated_providers_sha256": provider_index.providers_before_digest(plan.date),
+                    }
+                else:
+                    state = {}
+                if metric_name in nel_analysis.PSL_DEPENDENT_METRICS:
+                    psl_files_used, psl_digest = plan.psl_files, plan.psl_digest
+                else:
+                    psl_files_used, psl_digest = [], None
+
+                manifest.record(plan.date, metric_name, nel_analysis.METRIC_VERSIONS[metric_name],
+                                plan.input_fingerprint, psl_files_used, psl_digest, **state)
+
+            # Save after each month - an interrupted run does not have to start over
+            manifest.save()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    logger.info("Done. Exiting...")
 
 
-def run_analysis(input_files: List[pathlib.Path], psl_files: List[pathlib.Path]):
-    # Initialize data to be aggregated throughout the months
-    collector_providers_so_far = np.empty(0, dtype=str)
-    # popular_collector_providers_so_far = np.empty(0, dtype=str)
+def select_month_plans(month_plans: List[MonthPlan], selected_months: List[str],
+                       provider_index: CollectorProviderIndex) -> List[MonthPlan]:
+    """
+    Keep only the plans of the selected months.
 
-    # Monthly analysis loop
-    for input_file in input_files:
-        logger.info(f"---{input_file.name.upper()}---")
+    The collector provider usage of a selected month can only be computed if all the previous months
+    are already registered in the collector provider index.
+    """
+    collector_metric_name = nel_analysis.CollectorProviderUsageMetric.name
+    selected_plans = []
 
-        # Convention: nel_data_YYYY_MM.parquet
-        month, year = input_file.stem.split("_")[::-1][:2]  # Reverse and take last 2 values
-        date = f"{year}-{month}"
+    for plan_idx, plan in enumerate(month_plans):
+        if plan.date not in selected_months:
+            continue
 
-        if not APP_IGNORE_LOCAL_PSL_FILES:
-            psl = psl_utils.get_psl_for_specific_date(year, month, PSL_DIR_PATH, psl_files)
+        unregistered_previous_months = [previous_plan.date for previous_plan in month_plans[:plan_idx]
+                                        if not provider_index.is_registered(previous_plan.date)]
+        if collector_metric_name in plan.stale_metrics and len(unregistered_previous_months) > 0:
+            logger.warning(f"Skipping {collector_metric_name} for {plan.date} - previous months "
+                           f"{', '.join(unregistered_previous_months)} are not in the collector provider index yet")
+            plan.stale_metrics.remove(collector_metric_name)
 
-            # The used PSL library needs the PSL as file-like type to read from
-            # So to avoid saving temporary files to disk, StringIO() is used
-            psl_io = io.StringIO()
-            psl_io.write(psl)
-            psl_io.seek(0)
-        else:
-            psl_io = None
+        selected_plans.append(plan)
 
-        # Deployment data
-        nel_analysis.nel_deployment(input_file, date, ANALYSIS_OUTPUT_DIR)
+    return selected_plans
 
-        # Domain deployment stats data
-        nel_analysis.nel_domain_resource_monitoring_stats(input_file, date, ANALYSIS_OUTPUT_DIR)
 
-        # Collector data (aggregate unique collector providers throughout the analyzed months)
-        collector_providers_so_far = \
-            nel_analysis.nel_collector_provider_usage(input_file,
-                                                      collector_providers_so_far, date, psl_io, ANALYSIS_OUTPUT_DIR)
+def plan_month(input_file: pathlib.Path, psl_files: List[pathlib.Path], manifest: AnalysisManifest,
+               force: bool) -> MonthPlan:
+    """Determine which metrics of a month are stale and have to be computed"""
+    # Convention: nel_data_YYYY_MM.parquet (or month=YYYY-MM partition directories of the NEL dataset)
+    date = nel_dataset.month_date(input_file)
+    year, month = date.split("-")
 
-        # Popular Collector data (same as above but use TRANCO list of popular domains for current date)
-        # popular_collector_providers_so_far = \
-        #     nel_analysis.nel_popular_domain_collector_provider_usage(input_file,
-        #                                                              popular_collector_providers_so_far, date, psl_io,
-        #                                                              ANALYSIS_OUTPUT_DIR)
+    input_fingerprint = manifest.fingerprint(input_file)
 
-        # Domain configuration data
-        nel_analysis.nel_config(input_file, date, ANALYSIS_OUTPUT_DIR)
+    if not APP_IGNORE_LOCAL_PSL_FILES:
+        month_psl_files = psl_utils.get_psl_files_for_specific_date(year, month, PSL_DIR_PATH, psl_files)
+        psl_digest = AnalysisManifest.files_digest(month_psl_files)
+    else:
+        month_psl_files = []
+        psl_digest = None
 
-        # Resource configuration data
-        nel_analysis.nel_resource_config_variability(input_file, date, ANALYSIS_OUTPUT_DIR)
+    stale_metrics = []
+    for metric_class in [*nel_analysis.MONTH_INDEPENDENT_METRICS, nel_analysis.CollectorProviderUsageMetric]:
+        output_files = [pathlib.Path(ANALYSIS_OUTPUT_DIR) / output_file.format(date=date)
+                        for output_file in metric_class.output_files]
+        used_psl_digest = psl_digest if metric_class.name in nel_analysis.PSL_DEPENDENT_METRICS else None
 
-        # Resource type data
-        nel_analysis.nel_monitored_resource_types(input_file, date, ANALYSIS_OUTPUT_DIR)
+        if force or manifest.is_stale(date, metric_class.name, metric_class.version, input_fingerprint,
+                                      used_psl_digest, output_files):
+            stale_metrics.append(metric_class.name)
 
-        if psl_io is not None:
-            psl_io.close()
-        gc.collect()
+    return MonthPlan(input_file, date, input_fingerprint, month_psl_files, psl_digest, stale_metrics)
 
-        print()
 
-    logger.info("Done. Exiting...")
+def analyze_month_file(input_file: pathlib.Path, psl_files: List[pathlib.Path],
+                       metric_names: List[str]) -> nel_analysis.CollectorProviderUsageMetric | None:
+    """
+    Analyze a single month data file - compute & save the requested metrics that do not depend on the other months
+
+    :return: Collector provider usage metric of the month to be saved once the previous months are analyzed
+             (None if it was not requested)
+    """
+    logger.info(f"---{input_file.name.upper()}--- computing: {', '.join(metric_names)}")
+
+    # Convention: nel_data_YYYY_MM.parquet (or month=YYYY-MM partition directories of the NEL dataset)
+    date = nel_dataset.month_date(input_file)
+    year, month = date.split("-")
+
+    if not APP_IGNORE_LOCAL_PSL_FILES:
+        # Merged & compiled PSL for the month (cached - compiled only once per combination of the PSL files)
+        psl_resolver = psl_utils.load_psl_resolver_for_specific_date(year, month, PSL_DIR_PATH, psl_files,
+                                                                     PSL_CACHE_DIR_PATH)
+    else:
+        psl_resolver = None
+
+    # All the metrics are computed during a single pass over the month data file
+    collector_provider_usage = \
+        nel_analysis.analyze_month_independent_metrics(input_file, date, psl_resolver, ANALYSIS_OUTPUT_DIR,
+                                                       metric_names, DOMAIN_TABLE_DIR_PATH)
+
+    if collector_provider_usage is not None:
+        # The PSL is not needed anymore (no need to pass it back from a worker process)
+        collector_provider_usage.used_psl = None
+    gc.collect()
+
+    return collector_provider_usage
 
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+"""
+Additional standalone script to benchmark the memory & time a DomainLinkTree of a link-dense domain takes
+
+The links mimic a news portal - section/year/month/day/article paths, where most of the labels repeat across the tree.
+"""
+
+import gc
+import logging
+import random
+import sys
+import time
+import tracemalloc
+from typing import List
+
+from src.classes.DomainLinkTree import DomainLinkTree
+
+
+# LOGGING
+logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                    format='%(asctime)s:%(levelname)s\t- %(message)s')
+logger = logging.getLogger(__name__)
+
+
+###############################
+# CONFIGURE THESE BEFORE USE: #
+###############################
+BENCHMARK_LINKS = 100_000
+BENCHMARK_LINKS_PER_PAGE = 500  # Links added at once (the links found on a single crawled page)
+BENCHMARK_SEED = 42
+
+
+def news_portal_links(links_count: int, seed: int) -> List[str]:
+    rnd = random.Random(seed)
+    sections = ["news", "sport", "culture", "business", "tech", "travel", "opinion", "video"]
+
+    return [f"{rnd.choice(sections)}/{rnd.randint(2015, 2024)}/{rnd.randint(1, 12):02}/{rnd.randint(1, 28):02}/"
+            f"article-{rnd.randint(0, 10 * links_count)}" for _ in range(links_count)]
+
+
+def benchmark_domain_link_tree(links: List[str], links_per_page: int):
+    gc.collect()
+    tracemalloc.start()
+
+    start_time = time.monotonic()
+    link_tree = DomainLinkTree("news.example.com")
+    for page_start in range(0, len(links), links_per_page):
+        link_tree.add(links[page_start:page_start + links_per_page])
+    add_seconds = time.monotonic() - start_time
+
+    tree_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start_time = time.monotonic()
+    while link_tree.get_next() is not None:
+        pass
+    drain_seconds = time.monotonic() - start_time
+
+    logger.info(f"{len(links)} links: {tree_memory / 2 ** 20:.1f} MB ({tree_memory / len(links):.0f} B per link), "
+                f"added in {add_seconds:.2f} s, drained in {drain_seconds:.2f} s "
+                f"({link_tree.get_visited_links_count()} links visited)")
+
+
+if __name__ == '__main__':
+    benchmark_domain_link_tree(news_portal_links(BENCHMARK_LINKS, BENCHMARK_SEED), BENCHMARK_LINKS_PER_PAGE)
@@ -16,19 +16,21 @@ import gc
 import logging
 import re
 import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import List
 
 import asyncio
 import pandas as pd
 import playwright._impl._errors as playwright_errors
 import tqdm
-from playwright.async_api import async_playwright, Playwright
+from playwright.async_api import async_playwright, BrowserContext
 
 from merge_crawled_and_save import merge_crawled_and_save
-from src import crawling_utils
+from src import crawl_scheduler, crawling_utils
+from src.classes.BrowserPool import BrowserPool
 from src.classes.DomainNelDataRegistry import DomainNelDataRegistry
 from src.classes.DomainLinkTree import DomainLinkTree
+from src.classes.WorkerRecyclingPolicy import WorkerRecyclingPolicy
 from src.crawling_utils import ResponseData
 
 
@@ -49,7 +51,10 @@ CRAWL_DOMAINS_LIST_FILEPATH = "data/domains_to_crawl.parquet"
 CRAWL_PAGES_PER_DOMAIN = 20
 
 CRAWL_ASYNC_WORKERS = 6                     # How many asyncio tasks to deploy
-CRAWL_ASYNC_WORKER_LIFETIME_WORKLOAD = 40   # How many domains to assign to a single asyncio task to complete
+
+CRAWL_BROWSER_POOL_SIZE = 2                 # How many browser processes the asyncio tasks share
+CRAWL_BROWSER_MAX_PAGES = 500               # Pages opened in a browser before it is recycled
+CRAWL_BROWSER_MAX_RSS = 2 * 2 ** 30         # Memory (bytes) of a browser's processes before it is recycled (or None)
 
 CRAWL_ASYNC_PAGE_LOAD_FAILSAFE_TIMEOUT = 120_000  # milliseconds (Some pages load their scripts for way too long)
 
@@ -62,33 +67,35 @@ def noop_logger_callback(_):
     pass
 
 
-async def crawl_task(pw: Playwright, domain_queue: List[str], progressbar: tqdm.tqdm):
-    chromium = pw.chromium
-    browser = await chromium.launch(headless=True)
-    ctx = await browser.new_context()
-    ctx.on("weberror", noop_logger_callback)
-
-    while len(domain_queue) > 0:
-        # Domain vars
-        domain_name = domain_queue.pop(0)
-        domain_url_pattern = re.compile(fr"https?://{domain_name}")
-
-        # Check if the domain data is already crawled
-        path_to_save = Path(f"{CRAWL_DATA_RAW_STORAGE_PATH}/{domain_name}.parquet")
-        if path_to_save.exists():
-            logger.warning(f"SKIP - Domain data already crawled in '{CRAWL_DATA_RAW_STORAGE_PATH}' ({domain_name})")
-            progressbar.update()
-            continue
-
-        # Prepare to intercept responses for current domain (set the callback for each domain)
-        domain_response_dataset = []
-        page = await ctx.new_page()
-        page.on("response", lambda response: domain_response_dataset.append(
-            ResponseData(url=response.url, status=response.status, headers=response.headers))
-        )
-        # Also log page crashes
-        page.on('crash', lambda ex: crash_logger_callback(domain_name, ex))
+@asynccontextmanager
+async def domain_context(browser_pool: BrowserPool):
+    """A fresh context of a pooled browser for crawling a single domain (no cookies nor cache of other domains)"""
+    async with browser_pool.context() as ctx:
+        ctx.on("weberror", noop_logger_callback)
+        yield ctx
+
+
+async def crawl_domain(ctx: BrowserContext, domain_name: str, progressbar: tqdm.tqdm):
+    # Domain vars
+    domain_url_pattern = re.compile(fr"https?://{domain_name}")
+
+    # Check if the domain data is already crawled
+    path_to_save = Path(f"{CRAWL_DATA_RAW_STORAGE_PATH}/{domain_name}.parquet")
+    if path_to_save.exists():
+        logger.warning(f"SKIP - Domain data already crawled in '{CRAWL_DATA_RAW_STORAGE_PATH}' ({domain_name})")
+        progressbar.update()
+        return
+
+    # Prepare to intercept responses for current domain (set the callback for each domain)
+    domain_response_dataset = []
+    page = await ctx.new_page()
+    page.on("response", lambda response: domain_response_dataset.append(
+        ResponseData(url=response.url, status=response.status, headers=response.headers))
+    )
+    # Also log page crashes
+    page.on('crash', lambda ex: crash_logger_callback(domain_name, ex))
 
+    try:
         # Crawling infrastructure for the current domain
         domain_nel_data_registry = DomainNelDataRegistry()
         domain_link_tree = DomainLinkTree(domain_name)
@@ -133,33 +140,11 @@ async def crawl_task(pw: Playwright, domain_queue: List[str], progressbar: tqdm.
         domain_nel_data_registry.save_raw(path_to_save)
         progressbar.update()
 
+    finally:
         # Make sure not to hold on to any redundant data that uses RAM
         await page.close()
-        await ctx.clear_cookies()
-        del domain_nel_data_registry
-        del domain_link_tree
-        del domain_next_link
         gc.collect()
 
-    # Crawler task finished the whole domain workload
-    await ctx.close()
-    await browser.close()
-    gc.collect()
-
-
-def domain_workload_generator(domains: List[str]):
-    generated_index_range = CRAWL_ASYNC_WORKER_LIFETIME_WORKLOAD
-
-    for index_range_start in range(0, len(domains), generated_index_range):
-        if (index_range_start + generated_index_range) <= len(domains) - 1:
-            yield domains[index_range_start:index_range_start + generated_index_range]
-        else:
-            yield domains[index_range_start:]
-
-    while True:
-        # Keep generating no workload infinitely when all the domains have already been generated
-        yield []
-
 
 async def main():
     crawl_data_raw_path = Path(CRAWL_DATA_RAW_STORAGE_PATH)
@@ -185,38 +170,23 @@ async def main():
     # OR THE WHOLE SET OF DOMAINS
     domains = eligible_domains['url_domain'].tolist()
 
-    domain_workload_pool = domain_workload_generator(domains)
-
     logger.info(f"Beginning to crawl {len(domains)} domains")
 
-    async with async_playwright() as pw:
+    async with async_playwright() as pw, \
+            BrowserPool(lambda: pw.chromium.launch(headless=True), CRAWL_BROWSER_POOL_SIZE,
+                        max_pages=CRAWL_BROWSER_MAX_PAGES, max_rss=CRAWL_BROWSER_MAX_RSS) as browser_pool:
         with tqdm.tqdm(total=len(domains)) as progressbar:
-            pending = set()
-            for i in range(CRAWL_ASYNC_WORKERS):
-                task_domain_pool = next(domain_workload_pool)
-                if len(task_domain_pool) > 0:
-                    pending.add(asyncio.create_task(crawl_task(pw, task_domain_pool, progressbar)))
-                else:
-                    break
-
             try:
-                should_generate_more_tasks = True
-                while pending:
-                    done, pending = await asyncio.wait(
-                        pending,
-                        return_when=asyncio.FIRST_COMPLETED
-                    )
-                    logger.debug("A task has been completed and closed")
-
-                    if should_generate_more_tasks:
-                        next_task_domain_pool = next(domain_workload_pool)
-                        if len(next_task_domain_pool) > 0:
-                            logger.debug("Spawning a new Task")
-                            pending.add(asyncio.ensure_future(crawl_task(pw, next_task_domain_pool, progressbar)))
-                        else:
-                            should_generate_more_tasks = False
-
-                    # crawling_utils.log_all_tasks_stack_trace()
+                # The workers pull single domains from a shared queue - a slow domain holds up only its own worker.
+                # Every domain is crawled in its own context (recycled after a single domain) of a pooled browser
+                await crawl_scheduler.crawl_domains(
+                    domains, CRAWL_ASYNC_WORKERS,
+                    open_session=lambda: domain_context(browser_pool),
+                    crawl_domain=lambda ctx, domain_name: crawl_domain(ctx, domain_name, progressbar),
+                    recycling_policy=WorkerRecyclingPolicy(max_domains=1)
+                )
+
+                # crawling_utils.log_all_tasks_stack_trace()
 
             except Exception as ex:
                 logger.exception(f"Error occurred during the async crawl: \n{ex}")
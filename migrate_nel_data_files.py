@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""
+Additional standalone script to migrate the downloaded NEL data files to the v2 data schema (see data_schemas)
+
+Files are rewritten in place, one row group at a time. Files already in the v2 schema are skipped.
+"""
+
+import logging
+import os
+import pathlib
+import sys
+import time
+
+from src.schema_migration import migrate_month_file
+
+
+# LOGGING
+logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                    format='%(asctime)s:%(levelname)s\t- %(message)s')
+logger = logging.getLogger(__name__)
+
+
+###############################
+# CONFIGURE THESE BEFORE USE: #
+###############################
+NEL_DATA_DIR_PATH = "data/httparchive_raw"
+
+
+def migrate_nel_data_files(nel_data_dir: str):
+    input_files = sorted(pathlib.Path(nel_data_dir).glob("nel_data_*.parquet"))
+
+    if len(input_files) < 1:
+        logger.warning("No NEL data files found. Aborting...")
+        return
+
+    for input_file in input_files:
+        start_time = time.monotonic()
+        original_size = os.path.getsize(input_file)
+
+        if not migrate_month_file(input_file):
+            logger.info(f"{input_file.name} already uses the v2 schema, skipping")
+            continue
+
+        logger.info(f"{input_file.name} migrated in {time.monotonic() - start_time:.1f} seconds "
+                    f"({original_size / 2 ** 20:.1f} MB -> {os.path.getsize(input_file) / 2 ** 20:.1f} MB)")
+
+
+if __name__ == '__main__':
+    migrate_nel_data_files(NEL_DATA_DIR_PATH)
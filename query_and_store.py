@@ -47,12 +47,18 @@ description:    Query the Google Cloud Platform's BigQuery for HTTP Archive data
                 Inner works:
                 For each entry in config file:
                     1. Query BigQuery for NEL Data
-                    2. Store the data in a temporary table managed automatically by this script (see config section)
+                    2. Store the data in a temporary table of the month managed automatically by this script
+                       (see config section)
                     3. Export that temporary table to Google Cloud Storage bucket
                        (creates many small Parquet files --- blobs --- compressed using SNAPPY).
                     4. Download all blobs from the Google Cloud Storage bucket
+                       (each blob is sorted by url_domain as soon as it is downloaded)
                     5. Make a single Parquet file from all those blobs
+                       (the sorted blobs are merged once the last one is sorted - every part of them merged already
+                       is removed right away, so the disk holds the month about once)
                     6. Persist the file locally
+                Steps 1-3 of the next entries (in BigQuery) run while steps 4-6 of the current entry (on this device)
+                are running - see PIPELINE_DEPTH in the config section.
 
 
 
@@ -66,26 +72,42 @@ import json
 import logging
 import os
 import pathlib
+import shutil
 import sys
 import time
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
 
 import google.api_core.exceptions
+import pyarrow as pa
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
 from google.cloud import bigquery
 from google.cloud import storage
 from google.oauth2 import service_account
 
+from src import psl_utils
 from src.bq_parametrized_queries import \
     QUERY_NEL_DATA_HEADER_1_DESKTOP, \
     QUERY_NEL_DATA_HEADER_1_DESKTOP_1_MOBILE, \
     QUERY_NEL_DATA_HEADER_2_DESKTOP_1_MOBILE, \
     QUERY_NEL_DATA_HEADER_2_DESKTOP_2_MOBILE, \
     QUERY_NEL_DATA_BODY
+from src.blob_download import DOWNLOAD_WORKERS, PARTIAL_DOWNLOAD_SUFFIX, download_blobs, file_md5_hash
+from src.classes.LocalBigQueryClient import LocalBigQueryClient
+from src.classes.LocalStorageClient import LocalStorageClient
+from src.classes.PslResolver import PslResolver
 from src.data_schemas import \
-    PYARROW_MERGE_WRITE_SCHEMA, \
+    PYARROW_MERGE_WRITE_SCHEMA_V2, \
     PYARROW_MERGE_READ_SCHEMA, \
     BIGQUERY_NEL_DATA_SCHEMA
+from src.gc_clients import BigQueryClient, StorageClient
+from src.month_sort import DOMAIN_SORTED_ROW_GROUP_SIZE, merge_sorted_runs, sort_by_domain, sorted_run_segments, \
+    write_sorted_run
+from src.month_totals import MONTH_TOTALS_COLUMNS, month_totals_from_table, with_month_totals
+from src.nel_dataset import month_date, month_partition_dir, write_month_partition
+from src.schema_migration import to_schema_v2
+from src.staged_pipeline import run_overlapped
 
 
 # LOGGING
@@ -102,8 +124,8 @@ ONE_DAY_IN_MS = 1000 * 60 * 60 * 24
 # CONFIGURE THESE BEFORE USE: #
 ###############################
 GC_PROJECT_NAME = 'nel-analysis'                # Google Cloud Project Name
-GC_BQ_DATASET_NAME = 'httparchive_fetch_temp'   # Google Cloud BigQuery Dataset - to hold a temporary table for the data
-GC_BQ_TEMP_TABLE_NAME = 'nel_data'              # Google Cloud BigQuery Table - that temporary table for the data
+GC_BQ_DATASET_NAME = 'httparchive_fetch_temp'   # Google Cloud BigQuery Dataset - to hold temporary tables for the data
+GC_BQ_TEMP_TABLE_NAME = 'nel_data'              # Google Cloud BigQuery Table - name prefix of the per-month temp tables
 
 GC_TABLE_LOCATION = "US"  # This should be good AS IS
 
@@ -118,33 +140,73 @@ DATA_EXPORT_BUCKET_NAME = "downloadable-nel-analysis-data"
 DOWNLOAD_OUTPUT_DIR_PATH = "data/httparchive_raw"
 DOWNLOAD_TEMP_BLOBS_DIR_PATH = f"{DOWNLOAD_OUTPUT_DIR_PATH}/blobs"
 
+# Output layout of the downloaded data:
+#   "files"   - a single nel_data_YYYY_MM.parquet file per month (in DOWNLOAD_OUTPUT_DIR_PATH)
+#   "dataset" - hive-partitioned dataset month=YYYY-MM/domain_bucket=N/ (in DOWNLOAD_DATASET_DIR_PATH)
+DOWNLOAD_OUTPUT_LAYOUT = "files"  # Default = "files"
+DOWNLOAD_DATASET_DIR_PATH = "data/httparchive_dataset"
+DOWNLOAD_DATASET_DOMAIN_BUCKETS = 16
+
+# Merge of the downloaded blobs into a single file
+MERGE_DECODE_WORKERS = 2                        # Blobs decoded & sorted at once (bounds the memory used)
+MERGE_READ_BATCH_SIZE = 64 * 1024               # Rows of a blob decoded at once
+MERGE_ROW_GROUP_SIZE = DOMAIN_SORTED_ROW_GROUP_SIZE
+MERGE_COMPRESSION = "snappy"                    # Compression codec of the resulting file (e.g. "snappy", "zstd")
+SORTED_RUN_SUFFIX = ".sorted"                   # Sorted run (directory) of a blob = <blob name><SORTED_RUN_SUFFIX>
+SORTED_RUN_BLOB_METADATA_KEY = "nel_blob"       # Sorted run metadata - the size & MD5 checksum of its blob
+
+# Months queried & exported in BigQuery ahead of the month being downloaded & merged (0 = one month at a time)
+PIPELINE_DEPTH = 1
+
 # Download config
 DOWNLOAD_CONFIG_PATH = "config/httparchive_download_config.json"
 
-
-def prepare_nel_data_table():
+# Backend of the BigQuery & Google Cloud Storage clients:
+#   "gcp"   - Google Cloud (billed, uses the credentials above)
+#   "local" - offline emulator: the NEL data query runs locally (see src/nel_extraction.py) on the summary_requests
+#             samples in LOCAL_BACKEND_TABLES_DIR_PATH (<table id>.parquet, e.g.
+#             httparchive.summary_requests.2018_09_01_desktop.parquet) and the bucket is a local directory.
+#             The latency & bandwidth of Google Cloud are simulated - a reproducible benchmark of the whole pipeline
+GC_BACKEND = "gcp"  # Default = "gcp"
+LOCAL_BACKEND_TABLES_DIR_PATH = "data/local_gcp/tables"
+LOCAL_BACKEND_STORAGE_DIR_PATH = "data/local_gcp/storage"
+LOCAL_BACKEND_PSL_FILE_PATH = "resources/public_suffix_lists/psl_current.dat"  # NET.REG_DOMAIN emulation
+LOCAL_BACKEND_LATENCY = 0.5                 # Seconds of every BigQuery job & Cloud Storage request
+LOCAL_BACKEND_BANDWIDTH = 20 * 2 ** 20      # Bytes per second of every blob download
+LOCAL_BACKEND_EXPORT_BLOB_ROWS = 64 * 1024  # Max. rows of an exported blob
+LOCAL_BACKEND_WORKERS = os.cpu_count() or 1  # Threads running the query
+
+
+def prepare_nel_data_table(client: BigQueryClient):
     """
-    Prepare required infrastructure inside BigQuery. Create a temporary dataset and a temporary table inside of it.
-    This temporary table will then hold the data from the sequentially ran queries to get NEL data from BigQuery.
+    Prepare required infrastructure inside BigQuery. Create a temporary dataset to hold the temporary tables
+    of the months (see _temp_table_name) populated by the queries to get NEL data from BigQuery.
+
+    :param client: BigQuery client able to handle infrastructure administration
     """
     logger.info("##### Preparing temporary infrastructure for NEL analysis data")
 
-    # Build a BigQuery infrastructure administration client instance
-    client = _bq_infrastructure_administration_client()
-
     # Prepare infrastructure for working NEL data
     _create_temp_dataset(client)
-    _create_temp_table(client)
 
 
-def _bq_infrastructure_administration_client() -> bigquery.Client:
+def _bq_infrastructure_administration_client() -> BigQueryClient:
     """
     Create a simple BigQuery client able to handle infrastructure administration.
     Note that the client needs valid credentials with just enough privileges to create datasets,
     tables and execute query jobs.
+    With the "local" GC_BACKEND, the offline emulator of BigQuery is used instead.
 
     :return: BigQuery client meant to handle infrastructure administration
     """
+    if GC_BACKEND == "local":
+        psl_path = pathlib.Path(LOCAL_BACKEND_PSL_FILE_PATH)
+        psl_resolver = PslResolver(psl_utils.get_psl_by_path(psl_path).split("\n")) if psl_path.is_file() else None
+
+        return LocalBigQueryClient(GC_PROJECT_NAME, LOCAL_BACKEND_TABLES_DIR_PATH, LOCAL_BACKEND_STORAGE_DIR_PATH,
+                                   latency=LOCAL_BACKEND_LATENCY, export_blob_rows=LOCAL_BACKEND_EXPORT_BLOB_ROWS,
+                                   psl_resolver=psl_resolver, workers=LOCAL_BACKEND_WORKERS)
+
     credentials = service_account.Credentials.from_service_account_file(
         GC_PATH_TO_CREDENTIALS_FILE,
         scopes=["https://www.googleapis.com/auth/cloud-platform"]
@@ -173,15 +235,25 @@ def _create_temp_dataset(client):
         logger.info(f"Dataset '{client.project}.{dataset.dataset_id}' already exists. Proceeding to use it")
 
 
-def _create_temp_table(client: bigquery.Client):
+def _temp_table_name(output_filename: str) -> str:
+    """
+    Name of the temporary table of a month - every month has its own temporary table, so a month can be queried
+    while the previous one is still being exported or downloaded
     """
-    Create a temporary BigQuery table for storing query results of data for the NEL analysis.
-    If the temporary table already exists, delete all it's contents before using it.
+    return f"{GC_BQ_TEMP_TABLE_NAME}_{output_filename}"
+
+
+def _create_temp_table(client: BigQueryClient, output_filename: str) -> str:
+    """
+    Create a temporary BigQuery table for storing query results of data of a month for the NEL analysis.
+    If the temporary table already exists (e.g. left over by an interrupted run), it is re-created empty.
 
     :param client: Basic Google Cloud BigQuery API client with credentials and project ID
                    already provided
+    :param output_filename: Name of the output file of the month
+    :return: ID of the temporary table
     """
-    table_id = f"{GC_PROJECT_NAME}.{GC_BQ_DATASET_NAME}.{GC_BQ_TEMP_TABLE_NAME}"
+    table_id = f"{GC_PROJECT_NAME}.{GC_BQ_DATASET_NAME}.{_temp_table_name(output_filename)}"
 
     table = bigquery.Table(table_id, schema=BIGQUERY_NEL_DATA_SCHEMA)
 
@@ -190,15 +262,14 @@ def _create_temp_table(client: bigquery.Client):
         logger.info(f"Created temporary table '{table.project}.{table.dataset_id}.{table.table_id}'")
 
     except google.api_core.exceptions.Conflict:
-        logger.info(f"Temporary table '{table.project}.{table.dataset_id}.{table.table_id}' already exists")
-
-        # NOTE: billing needs to be enabled for the project in order for the DELETE OP to work
-        delete_table_contents_query = f"DELETE FROM `{table_id}` WHERE 1=1;"
-        client.query_and_wait(delete_table_contents_query)
-
         # No problem here, still using a warning to be careful when handling large data
         # because the temp table contains billed data (when deleted during debugging, it costs more money to reproduce)
-        logger.warning("Temporary table contents deleted. Proceeding to use it")
+        logger.warning(f"Temporary table '{table_id}' already exists. Re-creating it empty")
+
+        client.delete_table(table_id)
+        client.create_table(table)
+
+    return table_id
 
 
 def select_query_by_table_structure(desktop_table_list: List[str], mobile_table_list: List[str]) -> str:
@@ -242,7 +313,7 @@ def select_query_by_table_structure(desktop_table_list: List[str], mobile_table_
     return query_header + QUERY_NEL_DATA_BODY
 
 
-def populate_temp_table_with_query_results(client: bigquery.Client, query_string: str, output_filename: str):
+def populate_temp_table_with_query_results(client: BigQueryClient, query_string: str, output_filename: str):
     """
     Populate the temporary table managed by this script with data fetched by using the query string
     provided as an argument.
@@ -254,7 +325,7 @@ def populate_temp_table_with_query_results(client: bigquery.Client, query_string
     """
     logger.info(f"##### Populating temp table: ---{output_filename.upper()}---")
 
-    target_table_id = f"{GC_PROJECT_NAME}.{GC_BQ_DATASET_NAME}.{GC_BQ_TEMP_TABLE_NAME}"
+    target_table_id = _create_temp_table(client, output_filename)
     job_config = bigquery.QueryJobConfig(destination=target_table_id)
 
     client.query_and_wait(query_string, job_config=job_config)
@@ -262,12 +333,14 @@ def populate_temp_table_with_query_results(client: bigquery.Client, query_string
     logger.info(f"The temporary table {target_table_id} was loaded successfully with {output_filename}")
 
 
-def export_temp_table_to_storage_bucket_blobs(blob_name_prefix: str):
+def export_temp_table_to_storage_bucket_blobs(client: BigQueryClient, blob_name_prefix: str):
     """
-    Export the temporary table managed by this script into the Google Cloud Storage bucket with name configured
-    in this script's config.
+    Export the temporary table of a month managed by this script into the Google Cloud Storage bucket with name
+    configured in this script's config.
     The data will be stored there as multiple Parquet blobs compressed with SNAPPY.
 
+    :param client: Basic Google Cloud BigQuery API client with credentials and project ID
+                   already provided
     :param blob_name_prefix: Name to be used as a prefix for the multiple blobs to be created.
                              Example:
                                 * blob_name_prefix-00000001.parquet.snappy
@@ -276,12 +349,11 @@ def export_temp_table_to_storage_bucket_blobs(blob_name_prefix: str):
                                 * blob_name_prefix-0000000N.parquet.snappy
     """
     logger.info(f"##### Exporting temp table: ---{blob_name_prefix.upper()}---")
-    client = _bq_infrastructure_administration_client()
 
     destination_uri = "gs://{}/{}".format(DATA_EXPORT_BUCKET_NAME,
-                                          f"{blob_name_prefix}-*.parquet.snappy")
+                                          f"{_export_blob_name_prefix(blob_name_prefix)}*.parquet.snappy")
     dataset_ref = bigquery.DatasetReference(GC_PROJECT_NAME, GC_BQ_DATASET_NAME)
-    table_ref = dataset_ref.table(GC_BQ_TEMP_TABLE_NAME)
+    table_ref = dataset_ref.table(_temp_table_name(blob_name_prefix))
 
     job_config = bigquery.job.ExtractJobConfig()
     job_config.destination_format = bigquery.DestinationFormat.PARQUET
@@ -299,9 +371,14 @@ def export_temp_table_to_storage_bucket_blobs(blob_name_prefix: str):
     logger.info("NEL data exported successfully and is ready to be downloaded")
 
 
-def download_blobs_from_storage_bucket(storage_client: storage.Client, blob_name_prefix: str):
+def download_blobs_from_storage_bucket(storage_client: StorageClient, blob_name_prefix: str):
     """
     Downloads all blobs from the Google Cloud Storage bucket to local disk space.
+    The blobs are downloaded in parallel (see blob_download.DOWNLOAD_WORKERS). Blobs already downloaded completely
+    (by an interrupted previous run) are skipped.
+    Every downloaded blob is sorted into a sorted run right away (while the rest of the blobs is being downloaded)
+    and removed. The sorted runs are kept until the month is merged - blobs whose sorted run is on the local disk
+    already (left by an interrupted previous run) are not downloaded again.
 
     :param storage_client: Google Cloud Storage API client able to download blobs from a bucket
     :param blob_name_prefix: Name prefix for the blobs to download from the bucket
@@ -309,16 +386,78 @@ def download_blobs_from_storage_bucket(storage_client: storage.Client, blob_name
     logger.info(f"##### Downloading exported NEL data from storage: ---{blob_name_prefix.upper()}---")
 
     bucket = storage_client.get_bucket(DATA_EXPORT_BUCKET_NAME)
-    blobs = bucket.list_blobs(prefix=blob_name_prefix)
 
-    dl_time = time.time()
+    # Blobs are decoded & sorted in parallel threads (Arrow releases the GIL), at most MERGE_DECODE_WORKERS at once
+    with ThreadPoolExecutor(max_workers=MERGE_DECODE_WORKERS) as decode_executor:
+        sort_jobs = []
+        download_blobs(bucket, blob_name_prefix, DOWNLOAD_TEMP_BLOBS_DIR_PATH, workers=DOWNLOAD_WORKERS,
+                       on_downloaded=lambda blob_file: sort_jobs.append(
+                           decode_executor.submit(sort_downloaded_blob, blob_file)),
+                       is_processed=lambda blob: is_blob_sorted(
+                           blob, _sorted_run_path(pathlib.Path(DOWNLOAD_TEMP_BLOBS_DIR_PATH) / blob.name)))
 
-    for blob in blobs:
-        destination_uri = '{}/{}'.format(DOWNLOAD_TEMP_BLOBS_DIR_PATH, blob.name)
-        blob.download_to_filename(destination_uri)
+        for sort_job in sort_jobs:
+            sort_job.result()  # Re-raise decoding errors
 
     logger.info("Exported NEL data downloaded successfully")
-    logger.info(f"Download time: {time.time() - dl_time}")
+
+
+def sort_downloaded_blob(parquet_file: pathlib.Path) -> pathlib.Path:
+    """
+    Convert a downloaded NEL data blob to the v2 schema and sort it by url_domain into a sorted run directory
+    (<blob>.sorted, see month_sort.write_sorted_run) - the sorted runs are merged into a single sorted file afterwards.
+    The blob is read and converted batch by batch - only the (much smaller) v2 data of the blob is held in memory,
+    never the whole blob decoded as strings.
+    The sorted run records the size & MD5 checksum of the blob (see is_blob_sorted) and is written completely or not
+    at all. The blob is removed after, so it does not get merged to subsequent data tables.
+
+    :param parquet_file: The downloaded blob
+    :return: The sorted run
+    """
+    blob = ds.dataset(parquet_file, schema=PYARROW_MERGE_READ_SCHEMA, format="parquet")
+    table = pa.Table.from_batches(
+        [batch for record_batch in blob.to_batches(batch_size=MERGE_READ_BATCH_SIZE, use_threads=False)
+         for batch in to_schema_v2(pa.Table.from_batches([record_batch])).to_batches()],
+        schema=PYARROW_MERGE_WRITE_SCHEMA_V2)
+
+    sorted_table = sort_by_domain(table)
+    blob_metadata = json.dumps({"size": parquet_file.stat().st_size, "md5_hash": file_md5_hash(parquet_file)})
+    sorted_table = sorted_table.replace_schema_metadata({**(sorted_table.schema.metadata or {}),
+                                                        SORTED_RUN_BLOB_METADATA_KEY: blob_metadata})
+
+    sorted_run = _sorted_run_path(parquet_file)
+    partial_sorted_run = sorted_run.with_name(f"{sorted_run.name}{PARTIAL_DOWNLOAD_SUFFIX}")
+    for stale_run in [partial_sorted_run, sorted_run]:
+        shutil.rmtree(stale_run, ignore_errors=True)
+
+    write_sorted_run(sorted_table, partial_sorted_run)
+    os.replace(partial_sorted_run, sorted_run)
+    parquet_file.unlink()
+
+    return sorted_run
+
+
+def is_blob_sorted(blob, sorted_run: pathlib.Path) -> bool:
+    """
+    Check whether the blob was already sorted into the sorted run - the sorted run was made from a blob file with the
+    blob's size and MD5 checksum (only the size is compared for blobs without an MD5 checksum) and none of its
+    segments was merged (and removed) yet
+    """
+    if not sorted_run.is_dir() or blob.size is None:
+        return False
+
+    # The blob's size & checksum are stored in the footer of the first segment only
+    segments = sorted_run_segments(sorted_run)
+    metadata = (pq.read_schema(segments[0]).metadata if len(segments) > 0 else None) or {}
+    if SORTED_RUN_BLOB_METADATA_KEY.encode() not in metadata:
+        return False
+
+    blob_metadata = json.loads(metadata[SORTED_RUN_BLOB_METADATA_KEY.encode()])
+    return blob_metadata["size"] == blob.size and blob.md5_hash in (None, blob_metadata["md5_hash"])
+
+
+def _sorted_run_path(parquet_file: pathlib.Path) -> pathlib.Path:
+    return parquet_file.with_name(f"{parquet_file.name}{SORTED_RUN_SUFFIX}")
 
 
 def merge_downloaded_blobs_into_single_file(result_data_file_name: str):
@@ -332,39 +471,67 @@ def merge_downloaded_blobs_into_single_file(result_data_file_name: str):
     merge_time = time.time()
 
     blob_dir = pathlib.Path(DOWNLOAD_TEMP_BLOBS_DIR_PATH)
-    files = list(blob_dir.glob('*.parquet.snappy'))
 
-    if len(files) < 1:
+    # Blobs not sorted during the download yet
+    with ThreadPoolExecutor(max_workers=MERGE_DECODE_WORKERS) as decode_executor:
+        list(decode_executor.map(sort_downloaded_blob, blob_dir.glob(f'{result_data_file_name}-*.parquet.snappy')))
+
+    # Ordered by the blob names - the merged file does not depend on the order the downloads completed in
+    sorted_runs = sorted(blob_dir.glob(f'{result_data_file_name}-*.parquet.snappy{SORTED_RUN_SUFFIX}'))
+
+    if len(sorted_runs) < 1:
         logger.warning("Download completed with 0 files downloaded, "
                        "aborting merging downloaded NEL data into a single file")
         return
 
-    result_path = f"{DOWNLOAD_OUTPUT_DIR_PATH}/{result_data_file_name}.parquet"
-    with pq.ParquetWriter(result_path, schema=PYARROW_MERGE_WRITE_SCHEMA) as writer:
-        for parquet_file in files:
-            # Merge each standalone blob into a single file
-            table = pq.read_table(parquet_file, schema=PYARROW_MERGE_READ_SCHEMA)
+    # The month totals are the same in every row - store them in the file's footer as well
+    month_totals = None
+    for sorted_run in sorted_runs:
+        with pq.ParquetFile(sorted_run_segments(sorted_run)[0]) as parquet:
+            first_rows = next(parquet.iter_batches(batch_size=1, columns=MONTH_TOTALS_COLUMNS), None)
+        if first_rows is not None:
+            month_totals = month_totals_from_table(pa.Table.from_batches([first_rows]))
+        if month_totals is not None:
+            break
 
-            casted_table = table.cast(PYARROW_MERGE_WRITE_SCHEMA)
-            writer.write_table(casted_table)
-            # Remove the blob after, so it does not get merged to subsequent data tables
-            parquet_file.unlink()
+    result_path = f"{DOWNLOAD_OUTPUT_DIR_PATH}/{result_data_file_name}.parquet"
+    # The resulting file is written serially - only a batch of each sorted run is held in memory at a time.
+    # Every segment of the sorted runs is removed once merged - the disk holds the month only about once meanwhile
+    merge_sorted_runs(sorted_runs, result_path, schema=with_month_totals(PYARROW_MERGE_WRITE_SCHEMA_V2, month_totals),
+                      row_group_size=MERGE_ROW_GROUP_SIZE, compression=MERGE_COMPRESSION, remove_merged=True)
 
     print()
     logger.info(f"Result filesize: {os.path.getsize(result_path) / 2 ** 30} GB")
+
+    if DOWNLOAD_OUTPUT_LAYOUT == "dataset":
+        # Split the (sorted) month data file into the month's domain buckets
+        result_date = month_date(pathlib.Path(result_path))
+        write_month_partition(pathlib.Path(result_path), DOWNLOAD_DATASET_DIR_PATH, result_date,
+                              DOWNLOAD_DATASET_DOMAIN_BUCKETS)
+        pathlib.Path(result_path).unlink()
+        logger.info(f"Month data written into the dataset partition "
+                    f"{month_partition_dir(DOWNLOAD_DATASET_DIR_PATH, result_date)}")
+
     logger.info(f"Merge time: {time.time() - merge_time}")
 
 
-def _gc_storage_client() -> google.cloud.storage.Client:
+def _gc_storage_client() -> StorageClient:
     """
     Create an instance of the Google Cloud Storage client able to download blobs from buckets
+    (the offline emulator of Google Cloud Storage with the "local" GC_BACKEND)
 
     :return: The client instance
     """
+    if GC_BACKEND == "local":
+        client = LocalStorageClient(LOCAL_BACKEND_STORAGE_DIR_PATH, latency=LOCAL_BACKEND_LATENCY,
+                                    bandwidth=LOCAL_BACKEND_BANDWIDTH)
+        client.create_bucket(DATA_EXPORT_BUCKET_NAME)
+        return client
+
     return storage.Client.from_service_account_json(GC_PATH_TO_CREDENTIALS_FILE)
 
 
-def clean_storage_bucket(storage_client: google.cloud.storage.Client, blob_name_prefix: str):
+def clean_storage_bucket(storage_client: StorageClient, blob_name_prefix: str):
     """
     Clean all blobs from the used Google Cloud Storage bucket
 
@@ -382,89 +549,144 @@ def clean_storage_bucket(storage_client: google.cloud.storage.Client, blob_name_
     logger.info("Exported NEL data deleted successfully")
 
 
-def clean_temp_table(client: google.cloud.bigquery.Client, original_table_name: str):
+def clean_stale_exports(storage_client: StorageClient, output_filenames: List[str]):
+    """
+    Clean the blobs of all months except the ones to download from the used Google Cloud Storage bucket - the blobs
+    exported for the months to download (by an interrupted previous run) are kept and downloaded without querying &
+    exporting the months again
+
+    :param storage_client: Instance of the Google Cloud Storage client
+    :param output_filenames: Output filenames of the months to download
     """
-    Clean the temporary table - delete all rows from it
+    logger.info("##### Cleaning GSC storage: ---STALE EXPORTS---")
+
+    bucket = storage_client.get_bucket(DATA_EXPORT_BUCKET_NAME)
+    kept_blob_name_prefixes = tuple(_export_blob_name_prefix(output_filename) for output_filename in output_filenames)
+
+    for blob in bucket.list_blobs(prefix=""):
+        if not blob.name.startswith(kept_blob_name_prefixes):
+            blob.delete()
+
+    logger.info("Stale exported NEL data deleted successfully")
+
+
+def is_month_exported(storage_client: StorageClient, output_filename: str) -> bool:
+    """Check whether the month's NEL data are exported in the used Google Cloud Storage bucket already"""
+    bucket = storage_client.get_bucket(DATA_EXPORT_BUCKET_NAME)
+    return next(iter(bucket.list_blobs(prefix=_export_blob_name_prefix(output_filename))), None) is not None
+
+
+def _export_blob_name_prefix(output_filename: str) -> str:
+    return f"{output_filename}-"
+
+
+def clean_temp_table(client: BigQueryClient, output_filename: str):
+    """
+    Clean the temporary table of a month - delete the whole table (unlike a DELETE query, this is not billed)
 
     :param client: Basic Google Cloud BigQuery API client with credentials and project ID
                    already provided
-    :param original_table_name: The table name that was queried to populate the temporary table
-                                - that is now to be cleaned (all rows deleted)
+    :param output_filename: Name of the output file of the month the temporary table was populated for
     """
-    logger.info(f"##### Cleaning temp table: ---{original_table_name.upper()}---")
+    logger.info(f"##### Cleaning temp table: ---{output_filename.upper()}---")
+
+    table_id = f"{GC_PROJECT_NAME}.{GC_BQ_DATASET_NAME}.{_temp_table_name(output_filename)}"
+    client.delete_table(table_id, not_found_ok=True)
 
-    table_id = f"{GC_PROJECT_NAME}.{GC_BQ_DATASET_NAME}.{GC_BQ_TEMP_TABLE_NAME}"
-    delete_table_contents_query = f"DELETE FROM `{table_id}` WHERE 1=1;"
+    logger.info("Temporary table deleted successfully")
 
-    client.query_and_wait(delete_table_contents_query)
 
-    logger.info("Temporary table contents deleted successfully")
+def query_and_store_months(download_entries: List[Tuple[str, str]], query_client: BigQueryClient,
+                           storage_client: StorageClient, depth: int = PIPELINE_DEPTH):
+    """
+    Query & store the months - the query & export of the next months (in BigQuery) overlaps the download & merge
+    of the current month (on this device).
+    Months exported in the bucket already (by an interrupted previous run) are not queried & exported again.
+
+    :param download_entries: Output filename & query of every month to download
+    :param query_client: Basic Google Cloud BigQuery API client with credentials and project ID already provided
+    :param storage_client: Google Cloud Storage API client able to download blobs from a bucket
+    :param depth: Max. number of months queried & exported ahead of the month being downloaded (0 = no overlap)
+    """
+    def query_and_export(download_entry: Tuple[str, str]):
+        output_filename, query = download_entry
+
+        if is_month_exported(storage_client, output_filename):
+            logger.info(f"NEL data of {output_filename} already exported - downloading the exported blobs")
+            return
+
+        populate_temp_table_with_query_results(query_client, query, output_filename)
+        export_temp_table_to_storage_bucket_blobs(query_client, output_filename)
+
+    def download_and_merge(download_entry: Tuple[str, str], _):
+        output_filename = download_entry[0]
+
+        download_blobs_from_storage_bucket(storage_client, output_filename)
+        print()
+
+        merge_downloaded_blobs_into_single_file(output_filename)
+        print()
+
+        clean_storage_bucket(storage_client, output_filename)
+        clean_temp_table(query_client, output_filename)
+        print()
+
+    run_overlapped(download_entries, query_and_export, download_and_merge, depth=depth)
 
 
 def main():
+    start_time = time.time()
+
     # Prepare BigQuery infrastructure for querying data
     query_client = _bq_infrastructure_administration_client()
     storage_client = _gc_storage_client()
 
     # Prepare GC BQ Infrastructure
-    prepare_nel_data_table()
-    print()
-
-    # Prepare GCS bucket (clean all blobs)
-    clean_storage_bucket(storage_client, "")
+    prepare_nel_data_table(query_client)
     print()
 
     # Prepare download infrastructure on this device
     temp_blob_dir = pathlib.Path(DOWNLOAD_TEMP_BLOBS_DIR_PATH)
     temp_blob_dir.mkdir(parents=True, exist_ok=True)
 
-    # Clean all residual blobs before beginning (does nothing in case of a clean (first) run of this script)
-    [x.unlink() for x in list(temp_blob_dir.glob("*"))]
+    # Residual blobs & sorted runs (of an interrupted previous run) are kept - the download verifies them against the
+    # bucket (the exported blobs of the months to download are kept) and only fetches the blobs neither downloaded nor
+    # sorted yet
 
     # Run query & store
     with open(DOWNLOAD_CONFIG_PATH, 'r') as config_file:
         download_conf = json.loads(config_file.read())
 
-        for item in download_conf:
-            desktop_table_list = item.get('input_desktop', ["NOT PROVIDED"])
-            mobile_table_list = item.get('input_mobile', [])
-
-            # Ensure the download config entry contains a "processed_output" output filename value
-            output_filename = item.get('processed_output', None)
-            if output_filename is None:
-                logger.error(f"Tables with Desktop_1 {desktop_table_list[0]} - no output filename specified")
-                continue
-
-            # Skip this download entry if file with this entry's output filename already exists among downloaded files
-            file_to_download_path = pathlib.Path(f"{DOWNLOAD_OUTPUT_DIR_PATH}/{output_filename}.parquet")
-            if file_to_download_path.is_file():
-                logger.warning(f"Table {output_filename} already among downloaded files")
-                continue
-
-            # Query & Store a download entry...
-            query = select_query_by_table_structure(desktop_table_list, mobile_table_list)
-            print()
-
-            populate_temp_table_with_query_results(query_client, query, output_filename)
-            print()
-
-            export_temp_table_to_storage_bucket_blobs(output_filename)
-            print()
-
-            download_blobs_from_storage_bucket(storage_client, output_filename)
-            print()
-
-            merge_downloaded_blobs_into_single_file(output_filename)
-            print()
-
-            clean_storage_bucket(storage_client, output_filename)
-            print()
+    download_entries = []
+    for item in download_conf:
+        desktop_table_list = item.get('input_desktop', ["NOT PROVIDED"])
+        mobile_table_list = item.get('input_mobile', [])
+
+        # Ensure the download config entry contains a "processed_output" output filename value
+        output_filename = item.get('processed_output', None)
+        if output_filename is None:
+            logger.error(f"Tables with Desktop_1 {desktop_table_list[0]} - no output filename specified")
+            continue
+
+        # Skip this download entry if file with this entry's output filename already exists among downloaded files
+        file_to_download_path = pathlib.Path(f"{DOWNLOAD_OUTPUT_DIR_PATH}/{output_filename}.parquet")
+        if file_to_download_path.is_file() or (DOWNLOAD_OUTPUT_LAYOUT == "dataset" and month_partition_dir(
+                DOWNLOAD_DATASET_DIR_PATH, month_date(file_to_download_path)).is_dir()):
+            logger.warning(f"Table {output_filename} already among downloaded files")
+            continue
+
+        download_entries.append((output_filename, select_query_by_table_structure(desktop_table_list,
+                                                                                   mobile_table_list)))
+
+    # Prepare GCS bucket (clean all blobs except the ones exported for the months to download)
+    clean_stale_exports(storage_client, [output_filename for output_filename, _ in download_entries])
+    print()
 
-            clean_temp_table(query_client, output_filename)
-            print()
+    # Query & Store the download entries...
+    query_and_store_months(download_entries, query_client, storage_client, depth=PIPELINE_DEPTH)
 
     print()
-    logger.info("All items downloaded. Exiting...")
+    logger.info(f"All items downloaded in {time.time() - start_time:.1f} seconds. Exiting...")
 
 
 if '__main__' == __name__:
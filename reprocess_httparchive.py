@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""
+Additional standalone script to reprocess HTTP Archive months locally - runs the NEL data query (see nel_extraction)
+on local samples of the summary_requests tables instead of BigQuery, using all the CPU cores.
+
+The months to reprocess are read from the download config of query_and_store.py (the same "input_desktop",
+"input_mobile" & "processed_output" entries). Every table of a month has to be present in SUMMARY_REQUESTS_DIR_PATH as
+<table id>.parquet or as a directory <table id>/ of Parquet shards
+(e.g. httparchive.summary_requests.2018_09_01_desktop.parquet).
+
+The resulting month data files are the same files query_and_store.py produces - changed extraction rules can be applied
+to already downloaded months without paying for a re-query.
+"""
+
+import json
+import logging
+import os
+import pathlib
+import sys
+import time
+
+from src import psl_utils
+from src.classes.PslResolver import PslResolver
+from src.nel_extraction import extract_nel_data_from_files, summary_requests_path, write_month_data_file
+
+
+# LOGGING
+logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                    format='%(asctime)s:%(levelname)s\t- %(message)s')
+logger = logging.getLogger(__name__)
+
+
+###############################
+# CONFIGURE THESE BEFORE USE: #
+###############################
+SUMMARY_REQUESTS_DIR_PATH = "data/httparchive_summary_requests"
+REPROCESS_CONFIG_PATH = "config/httparchive_download_config.json"
+# Set to the DOWNLOAD_OUTPUT_DIR_PATH of query_and_store.py to replace the downloaded files
+REPROCESS_OUTPUT_DIR_PATH = "data/httparchive_reprocessed"
+REPROCESS_PSL_FILE_PATH = "resources/public_suffix_lists/psl_current.dat"  # NET.REG_DOMAIN emulation
+REPROCESS_WORKERS = os.cpu_count() or 1
+REPROCESS_COMPRESSION = "snappy"
+
+
+def reprocess_months(config_path: str, summary_requests_dir: str, output_dir: str, psl_resolver: PslResolver | None,
+                     workers: int):
+    with open(config_path, 'r') as config_file:
+        download_conf = json.loads(config_file.read())
+
+    pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    for item in download_conf:
+        output_filename = item.get('processed_output', None)
+        if output_filename is None:
+            logger.error(f"Entry {item} - no output filename specified")
+            continue
+
+        try:
+            table_paths = [summary_requests_path(summary_requests_dir, table_id)
+                           for table_id in item.get('input_desktop', []) + item.get('input_mobile', [])]
+        except FileNotFoundError as e:
+            logger.error(f"{output_filename} skipped: {e}")
+            continue
+
+        start_time = time.monotonic()
+
+        result = extract_nel_data_from_files(table_paths, psl_resolver, workers=workers)
+        write_month_data_file(result, f"{output_dir}/{output_filename}.parquet", compression=REPROCESS_COMPRESSION)
+
+        logger.info(f"{output_filename} reprocessed in {time.monotonic() - start_time:.1f} seconds "
+                    f"({result.num_rows} rows)")
+
+
+def main():
+    psl_path = pathlib.Path(REPROCESS_PSL_FILE_PATH)
+    psl_resolver = PslResolver(psl_utils.get_psl_by_path(psl_path).split("\n")) if psl_path.is_file() else None
+    if psl_resolver is None:
+        logger.warning(f"PSL file {psl_path} not found - registrable domains use the query's fallback only")
+
+    reprocess_months(REPROCESS_CONFIG_PATH, SUMMARY_REQUESTS_DIR_PATH, REPROCESS_OUTPUT_DIR_PATH, psl_resolver,
+                     REPROCESS_WORKERS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Parallel, resumable download of the exported NEL data blobs.
+
+Blobs are downloaded by a pool of threads (the download is network bound - the GIL is released while waiting).
+Every blob is first downloaded into a partial file and renamed once complete, so a local blob file is either
+complete or missing. A blob already on the local disk with the size & MD5 checksum of the bucket's blob is not
+downloaded again - a restarted download only fetches the blobs that did not complete.
+
+Every blob can be processed as soon as it is downloaded (on_downloaded) - the download threads are the producers
+and the calling thread is the consumer, so the processing of the blobs overlaps the download of the rest of them.
+Blobs processed by an interrupted previous run (is_processed) are not downloaded again, even if the blob files were
+removed after the processing. The processed files or directories (<blob name>.<suffix>) of the blobs still in the
+bucket are kept.
+
+The bucket can be anything listing blobs like google.cloud.storage.Bucket does (e.g. a LocalDirectoryBucket).
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Blobs downloaded at once
+DOWNLOAD_WORKERS = 8
+
+PARTIAL_DOWNLOAD_SUFFIX = ".part"
+
+_HASH_CHUNK_SIZE = 2 ** 24  # 16 MiB
+
+
+@dataclass
+class BlobDownloadReport:
+    downloaded_blobs: int = 0
+    skipped_blobs: int = 0
+    processed_blobs: int = 0
+    downloaded_bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Downloaded bytes per second"""
+        return self.downloaded_bytes / self.seconds if self.seconds > 0 else 0.0
+
+
+def download_blobs(bucket, blob_name_prefix: str, destination_dir: str | Path, workers: int = DOWNLOAD_WORKERS,
+                   on_downloaded: Callable[[Path], None] | None = None,
+                   is_processed: Callable[[object], bool] | None = None) -> BlobDownloadReport:
+    """
+    Download all blobs with the name prefix from the bucket. Blobs already downloaded are skipped.
+
+    :param bucket: Bucket to download the blobs from (google.cloud.storage.Bucket or a stand-in)
+    :param blob_name_prefix: Name prefix of the blobs to download
+    :param destination_dir: Local directory to download the blobs into
+    :param workers: Number of blobs downloaded at once
+    :param on_downloaded: Called (in the calling thread) with the local file of every blob as soon as the blob is
+                          downloaded (or found already downloaded), in the order the downloads complete
+    :param is_processed: Called with every blob of the bucket - blobs already processed are neither downloaded nor
+                         handed over to on_downloaded
+    :return: Summary of the download
+    """
+    destination_dir = Path(destination_dir)
+    destination_dir.mkdir(parents=True, exist_ok=True)
+
+    blobs = list(bucket.list_blobs(prefix=blob_name_prefix))
+    _remove_stale_blob_files(destination_dir, blob_name_prefix, {blob.name for blob in blobs})
+
+    report = BlobDownloadReport()
+    start_time = time.monotonic()
+
+    if is_processed is not None:
+        unprocessed_blobs = [blob for blob in blobs if not is_processed(blob)]
+        report.processed_blobs = len(blobs) - len(unprocessed_blobs)
+        blobs = unprocessed_blobs
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        downloads = {executor.submit(_download_blob, blob, destination_dir): blob for blob in blobs}
+
+        for download in as_completed(downloads):
+            downloaded_bytes = download.result()
+            if on_downloaded is not None:
+                on_downloaded(destination_dir / downloads[download].name)
+
+            if downloaded_bytes is None:
+                report.skipped_blobs += 1
+            else:
+                report.downloaded_blobs += 1
+                report.downloaded_bytes += downloaded_bytes
+
+    report.seconds = time.monotonic() - start_time
+
+    logger.info(f"Downloaded {report.downloaded_blobs} blobs ({report.downloaded_bytes / 2 ** 20:.1f} MB) "
+                f"in {report.seconds:.1f} seconds - {report.throughput / 2 ** 20:.1f} MB/s "
+                f"({report.skipped_blobs} blobs already downloaded, {report.processed_blobs} already processed)")
+
+    return report
+
+
+def is_blob_downloaded(blob, destination_file: Path) -> bool:
+    """
+    Check whether the blob was already downloaded completely - the local file has the blob's size and MD5 checksum
+    (only the size is compared for blobs without an MD5 checksum, e.g. composite objects)
+    """
+    if not destination_file.is_file() or blob.size is None or destination_file.stat().st_size != blob.size:
+        return False
+
+    return blob.md5_hash is None or file_md5_hash(destination_file) == blob.md5_hash
+
+
+def file_md5_hash(file_path: Path) -> str:
+    """MD5 checksum of a file in the format of the Google Cloud Storage blobs (base64 encoded digest)"""
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(_HASH_CHUNK_SIZE):
+            md5.update(chunk)
+
+    return base64.b64encode(md5.digest()).decode("ascii")
+
+
+def _download_blob(blob, destination_dir: Path) -> int | None:
+    """Download a blob (unless already downloaded) - return the downloaded bytes (None when skipped)"""
+    destination_file = destination_dir / blob.name
+    if is_blob_downloaded(blob, destination_file):
+        return None
+
+    partial_file = destination_file.with_name(f"{destination_file.name}{PARTIAL_DOWNLOAD_SUFFIX}")
+    blob.download_to_filename(str(partial_file))
+    os.replace(partial_file, destination_file)
+
+    return destination_file.stat().st_size
+
+
+def _remove_stale_blob_files(destination_dir: Path, blob_name_prefix: str, blob_names: set):
+    """
+    Remove the partial downloads & the local files of the prefix's blobs no longer in the bucket
+    (the blob files & the files or directories processed from them - <blob name>.<suffix>)
+    """
+    for blob_file in destination_dir.glob(f"{blob_name_prefix}*"):
+        if blob_file.name in blob_names:
+            continue
+
+        is_processed_file = blob_file.name.rpartition(".")[0] in blob_names
+        if blob_file.name.endswith(PARTIAL_DOWNLOAD_SUFFIX) or not is_processed_file:
+            if blob_file.is_dir():
+                shutil.rmtree(blob_file)
+            else:
+                blob_file.unlink()
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+from src.nel_dataset import month_data_files
+
+
+@dataclass
+class FileFingerprint:
+    path: str
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+class AnalysisManifest(object):
+    """
+    A record of what every computed metric result was computed from.
+    Lets an analysis re-run recompute only the results whose inputs or implementation have changed since.
+
+    For each month & metric, the manifest holds:
+        * fingerprint of the input month data file (size, mtime and content hash)
+        * PSL files used and their digest
+        * version of the metric implementation
+        * additional metric specific state (e.g. collector providers first found in that month)
+    """
+
+    HASH_CHUNK_SIZE = 2 ** 24  # 16 MiB
+
+    def __init__(self, file_path: str | Path):
+        self._file_path = Path(file_path)
+        self._months: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def __repr__(self):
+        return f"<AnalysisManifest path='{self._file_path}' months='{len(self._months)}'>"
+
+    @staticmethod
+    def load(file_path: str | Path) -> AnalysisManifest:
+        manifest = AnalysisManifest(file_path)
+
+        if manifest._file_path.is_file():
+            with open(manifest._file_path, "r", encoding="utf-8") as manifest_file:
+                manifest._months = json.load(manifest_file).get("months", {})
+
+        return manifest
+
+    def save(self):
+        self._file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first - an interrupted run must not corrupt the manifest
+        temp_file_path = self._file_path.with_suffix(".tmp")
+        with open(temp_file_path, "w", encoding="utf-8") as manifest_file:
+            json.dump({"months": self._months}, manifest_file, indent=2, sort_keys=True)
+
+        os.replace(temp_file_path, self._file_path)
+
+    def fingerprint(self, input_file: Path) -> FileFingerprint:
+        """
+        Fingerprint a month data file (or a month partition directory of the NEL dataset).
+        Hashing a multi-GB file takes a while - the recorded content hash is reused when the size & mtime still match.
+        """
+        data_files = month_data_files(input_file)
+        data_file_stats = [data_file.stat() for data_file in data_files]
+        size = sum(stat.st_size for stat in data_file_stats)
+        mtime_ns = max((stat.st_mtime_ns for stat in data_file_stats), default=0)
+
+        for metrics in self._months.values():
+            for entry in metrics.values():
+                recorded = entry.get("input")
+                if (recorded is not None
+                        and recorded["path"] == input_file.name
+                        and recorded["size"] == size
+                        and recorded["mtime_ns"] == mtime_ns):
+                    return FileFingerprint(**recorded)
+
+        if input_file.is_dir():
+            sha256 = self.files_digest(data_files, relative_to=input_file)
+        else:
+            sha256 = self.file_sha256(input_file)
+
+        return FileFingerprint(input_file.name, size, mtime_ns, sha256)
+
+    def is_stale(self, date: str, metric_name: str, version: int, input_fingerprint: FileFingerprint,
+                 psl_digest: str | None, output_files: List[Path]) -> bool:
+        """
+        Determine whether a metric result of a month has to be (re)computed
+
+        :param date: Month of the data (YYYY-MM)
+        :param metric_name: Name of the metric
+        :param version: Current version of the metric implementation
+        :param input_fingerprint: Fingerprint of the current month data file
+        :param psl_digest: Digest of the PSL files to be used (None if no PSL is used by the metric)
+        :param output_files: Files the metric result is saved in
+        :return: True if the recorded result is missing or outdated
+        """
+        entry = self._months.get(date, {}).get(metric_name)
+        if entry is None:
+            return True
+
+        if entry["version"] != version:
+            return True
+
+        # A touched, yet unchanged input file is still up-to-date (compare content only)
+        if entry["input"]["sha256"] != input_fingerprint.sha256:
+            return True
+
+        if entry["psl"]["sha256"] != psl_digest:
+            return True
+
+        return not all(output_file.is_file() for output_file in output_files)
+
+    def record(self, date: str, metric_name: str, version: int, input_fingerprint: FileFingerprint,
+               psl_files: List[Path], psl_digest: str | None, **state):
+        """Record a freshly computed metric result of a month (along with any additional metric state)"""
+        self._months.setdefault(date, {})[metric_name] = {
+            "version": version,
+            "input": asdict(input_fingerprint),
+            "psl": {
+                "files": [psl_file.name for psl_file in psl_files],
+                "sha256": psl_digest,
+            },
+            "state": state,
+        }
+
+    def get_state(self, date: str, metric_name: str, key: str, default: Any = None) -> Any:
+        return self._months.get(date, {}).get(metric_name, {}).get("state", {}).get(key, default)
+
+    @staticmethod
+    def file_sha256(file_path: Path) -> str:
+        sha256 = hashlib.sha256()
+
+        with open(file_path, "rb") as file:
+            while chunk := file.read(AnalysisManifest.HASH_CHUNK_SIZE):
+                sha256.update(chunk)
+
+        return sha256.hexdigest()
+
+    @staticmethod
+    def files_digest(file_paths: List[Path], relative_to: Path | None = None) -> str:
+        """
+        Digest of multiple files' contents (e.g. the historic & the current PSL merged for a month)
+
+        :param file_paths: Files to digest
+        :param relative_to: Digest the file paths relative to this directory (only the file names by default)
+        """
+        sha256 = hashlib.sha256()
+
+        for file_path in sorted(file_paths):
+            file_name = file_path.name if relative_to is None else file_path.relative_to(relative_to).as_posix()
+            sha256.update(file_name.encode("utf-8"))
+            sha256.update(AnalysisManifest.file_sha256(file_path).encode("ascii"))
+
+        return sha256.hexdigest()
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Set
+
+
+# LOGGING
+logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                    format='%(asctime)s:%(levelname)s\t- %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class PooledBrowser(object):
+    """A browser of a BrowserPool with its usage"""
+
+    def __init__(self, browser: Any, processes: List[Any]):
+        """
+        :param browser: The browser (e.g. a playwright Browser)
+        :param processes: Root processes of the browser (psutil.Process - empty when RSS is not tracked)
+        """
+        self.browser = browser
+        self.processes = processes
+
+        self.opened_pages = 0
+        self.open_contexts = 0
+        self.retiring = False
+
+    def __repr__(self):
+        return f"<PooledBrowser pages='{self.opened_pages}' contexts='{self.open_contexts}' retiring='{self.retiring}'>"
+
+
+class BrowserPool(object):
+    """
+    A pool of long-lived browser processes handing out a fresh browser context for every use.
+
+    A context does not share cookies nor cache with any other context, so a context per crawled domain isolates the
+    domains just like a browser per domain would - without a browser cold start for every domain.
+    A browser is recycled (replaced by a newly launched one & closed once its last context is closed) after max_pages
+    pages were opened in it, or once its processes use more than max_rss bytes of memory. A browser that crashed or
+    disconnected is replaced before the next context is handed out.
+    """
+
+    def __init__(self, launch_browser: Callable[[], Awaitable[Any]], size: int, max_pages: int | None = None,
+                 max_rss: int | None = None):
+        """
+        :param launch_browser: Launches a browser (e.g. playwright's chromium.launch)
+        :param size: Number of browsers kept running
+        :param max_pages: Pages opened in a browser before it is recycled (None = no limit)
+        :param max_rss: Resident memory (bytes) of a browser's processes before it is recycled (None = no limit,
+                        requires psutil otherwise)
+        """
+        if size < 1:
+            raise ValueError(f"The pool needs at least a single browser (got {size})")
+
+        self._launch_browser = launch_browser
+        self._size = size
+        self._max_pages = max_pages
+        self._max_rss = max_rss
+
+        self._browsers: List[PooledBrowser] = []
+        self._retired: Set[PooledBrowser] = set()
+        self._launch_lock = asyncio.Lock()
+        self._replace_lock = asyncio.Lock()
+
+        self.launched_browsers = 0
+
+    def __repr__(self):
+        return f"<BrowserPool size='{self._size}' launched='{self.launched_browsers}'>"
+
+    async def __aenter__(self) -> BrowserPool:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def start(self):
+        while len(self._browsers) < self._size:
+            self._browsers.append(await self._launch())
+
+    async def close(self):
+        for pooled_browser in self._browsers + list(self._retired):
+            try:
+                await pooled_browser.browser.close()
+            except Exception as ex:
+                logger.warning(f"Browser {pooled_browser} could not be closed: {ex}")
+
+        self._browsers.clear()
+        self._retired.clear()
+
+    @asynccontextmanager
+    async def context(self, **context_options) -> AsyncIterator[Any]:
+        """
+        A new context of the least busy browser - closed (and the browser recycled if needed) when the block exits
+
+        :param context_options: Options of the context (see playwright's Browser.new_context)
+        :raises Exception: A disconnected browser could not be replaced (its replacement failed to launch)
+        """
+        await self._replace_disconnected()
+
+        # A retiring browser is used only while its replacement is being launched (and there is no other browser)
+        candidates = [browser for browser in self._browsers if not browser.retiring] or self._browsers
+        pooled_browser = min(candidates, key=lambda browser: browser.open_contexts)
+        pooled_browser.open_contexts += 1
+
+        try:
+            ctx = await pooled_browser.browser.new_context(**context_options)
+            ctx.on("page", lambda _: self._page_opened(pooled_browser))
+
+            try:
+                yield ctx
+            finally:
+                await ctx.close()
+
+        finally:
+            pooled_browser.open_contexts -= 1
+            await self._recycle_if_needed(pooled_browser)
+
+    def _page_opened(self, pooled_browser: PooledBrowser):
+        pooled_browser.opened_pages += 1
+
+    async def _recycle_if_needed(self, pooled_browser: PooledBrowser):
+        if not pooled_browser.retiring and self._should_recycle(pooled_browser):
+            logger.debug(f"Recycling browser {pooled_browser}")
+
+            try:
+                await self._retire(pooled_browser)
+            except Exception as ex:
+                # Keep using the browser - recycling it is retried once its next context is closed
+                logger.exception(f"Browser {pooled_browser} not recycled - its replacement failed to launch: {ex}")
+
+        await self._close_if_unused(pooled_browser)
+
+    async def _close_if_unused(self, pooled_browser: PooledBrowser):
+        """Close a retired browser once it has no open context"""
+        if pooled_browser.retiring and pooled_browser.open_contexts == 0 and pooled_browser in self._retired:
+            self._retired.remove(pooled_browser)
+            try:
+                await pooled_browser.browser.close()
+            except Exception as ex:
+                logger.warning(f"Retired browser {pooled_browser} could not be closed: {ex}")
+
+    async def _replace_disconnected(self):
+        # One replacement at a time - contexts requested meanwhile wait for the replacement instead of the dead browser
+        async with self._replace_lock:
+            for pooled_browser in list(self._browsers):
+                if not pooled_browser.retiring and not pooled_browser.browser.is_connected():
+                    logger.warning(f"Browser {pooled_browser} disconnected - replacing it")
+                    await self._retire(pooled_browser)
+                    await self._close_if_unused(pooled_browser)
+
+    async def _retire(self, pooled_browser: PooledBrowser):
+        """Replace the browser with a newly launched one (the browser is still used if the launch fails)"""
+        # The replacement takes over once launched - the retired browser finishes the contexts it has open
+        pooled_browser.retiring = True
+        try:
+            replacement = await self._launch()
+        except Exception:
+            pooled_browser.retiring = False
+            raise
+
+        self._browsers[self._browsers.index(pooled_browser)] = replacement
+        self._retired.add(pooled_browser)
+
+    def _should_recycle(self, pooled_browser: PooledBrowser) -> bool:
+        if self._max_pages is not None and pooled_browser.opened_pages >= self._max_pages:
+            return True
+
+        return self._max_rss is not None and self._browser_rss(pooled_browser) > self._max_rss
+
+    async def _launch(self) -> PooledBrowser:
+        # One launch at a time - the processes started during a launch (except the ones started by the other browsers)
+        # are the processes of the launched browser
+        async with self._launch_lock:
+            processes_before = _descendant_processes() if self._max_rss is not None else set()
+            browser = await self._launch_browser()
+            self.launched_browsers += 1
+
+            if self._max_rss is None:
+                return PooledBrowser(browser, [])
+
+            processes_after = _descendant_processes()
+            new_processes = processes_after - processes_before
+            new_pids = {new_process.pid for new_process in new_processes}
+
+            parent_pids = {process.pid: process.ppid() for process in processes_after}
+            pooled_pids = {process.pid for pooled_browser in self._browsers + list(self._retired)
+                           for process in pooled_browser.processes}
+            root_processes = [process for process in new_processes
+                              if parent_pids[process.pid] not in new_pids
+                              and not _descends_from(process.pid, pooled_pids, parent_pids)]
+
+            return PooledBrowser(browser, root_processes)
+
+    @staticmethod
+    def _browser_rss(pooled_browser: PooledBrowser) -> int:
+        """Resident memory of the browser's processes (incl. the renderer processes started since the launch)"""
+        import psutil
+
+        rss = 0
+        for root_process in pooled_browser.processes:
+            try:
+                processes = [root_process] + root_process.children(recursive=True)
+            except psutil.NoSuchProcess:
+                continue
+
+            for process in processes:
+                try:
+                    rss += process.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+
+        return rss
+
+
+def _descends_from(pid: int, ancestor_pids: Set[int], parent_pids: Dict[int, int]) -> bool:
+    """Whether the process is a descendant of any of the ancestor processes (parent_pids = pid -> parent's pid)"""
+    while pid in parent_pids:
+        pid = parent_pids[pid]
+        if pid in ancestor_pids:
+            return True
+
+    return False
+
+
+def _descendant_processes() -> Set[Any]:
+    """All the processes started by this process (directly or by its children)"""
+    import psutil
+
+    return set(psutil.Process(os.getpid()).children(recursive=True))
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame
+
+
+class CollectorProviderIndex(object):
+    """
+    Persisted, ordered index of all the collector providers found throughout the analyzed months.
+
+    For each provider, the index holds every registered month it was seen in (and its position among the month's
+    providers). The month a provider was first seen in is the earliest of them - re-registering that month without the
+    provider moves its first occurrence to the next month it was seen in. The providers found before any month can
+    therefore be loaded without replaying the previous months - which lets the collector provider usage of any month be
+    computed on its own.
+
+    The months registered in the index are kept in the file's key-value metadata.
+    """
+
+    REGISTERED_MONTHS_METADATA_KEY = b"registered_months"
+
+    SCHEMA = pa.schema([
+        ('provider', pa.string()),
+        ('month', pa.string()),
+        ('position', pa.uint32()),
+    ])
+
+    def __init__(self):
+        # A row per provider & month it was seen in
+        self._providers: DataFrame = DataFrame({
+            'provider': pd.Series([], dtype=object),
+            'month': pd.Series([], dtype=object),
+            'position': pd.Series([], dtype="uint32"),
+        })
+        self._registered_months: List[str] = []
+
+    def __repr__(self):
+        return f"<CollectorProviderIndex providers='{len(self._providers)}' months='{len(self._registered_months)}'>"
+
+    @staticmethod
+    def load(file_path: str | Path) -> CollectorProviderIndex:
+        index = CollectorProviderIndex()
+
+        if not Path(file_path).is_file():
+            return index
+
+        metadata = pq.read_schema(file_path).metadata or {}
+        table = pq.read_table(file_path)
+        if 'first_seen' in table.column_names:
+            # Index saved with the first occurrences only
+            table = table.rename_columns(['month' if column == 'first_seen' else column
+                                          for column in table.column_names])
+        table = table.select(CollectorProviderIndex.SCHEMA.names).cast(CollectorProviderIndex.SCHEMA)
+
+        index._providers = table.to_pandas()
+        index._registered_months = json.loads(
+            metadata.get(CollectorProviderIndex.REGISTERED_MONTHS_METADATA_KEY, b"[]")
+        )
+
+        return index
+
+    def save(self, file_path: str | Path):
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+
+        table = pa.Table.from_pandas(self._providers, schema=self.SCHEMA, preserve_index=False)
+        table = table.replace_schema_metadata({
+            self.REGISTERED_MONTHS_METADATA_KEY: json.dumps(self._registered_months).encode("utf-8")
+        })
+
+        pq.write_table(table, file_path)
+
+    def is_registered(self, date: str) -> bool:
+        return date in self._registered_months
+
+    def get_registered_months(self) -> List[str]:
+        return list(self._registered_months)
+
+    def providers_before(self, date: str) -> np.ndarray:
+        """
+        Get all the providers found in the months before the date given, ordered by the month they were first seen in
+
+        :param date: Month (YYYY-MM)
+        :return: Ordered providers
+        """
+        providers = self._providers[self._providers['month'] < date]
+        first_occurrences = providers.sort_values(by=['month', 'position'], kind='stable') \
+            .drop_duplicates(subset='provider', keep='first')
+
+        return first_occurrences['provider'].to_numpy(dtype=object)
+
+    def providers_before_digest(self, date: str) -> str:
+        """Digest of the (ordered) providers found before the date given - to detect changes of the index"""
+        sha256 = hashlib.sha256()
+        for provider in self.providers_before(date):
+            sha256.update(provider.encode("utf-8"))
+            sha256.update(b"\n")
+
+        return sha256.hexdigest()
+
+    def register_month(self, date: str, month_providers: Iterable[str]) -> List[str]:
+        """
+        Register (or re-register) the providers found in a month
+
+        :param date: Month (YYYY-MM)
+        :param month_providers: Providers found in the month in their order of appearance
+        :return: Providers first seen in the month
+        """
+        providers_seen_before = set(self.providers_before(date))
+        month_providers = pd.Series(month_providers, dtype=object).dropna().unique()
+
+        # Replace the previous registration of the month
+        month_rows = DataFrame({
+            'provider': pd.Series(month_providers, dtype=object),
+            'month': pd.Series([date] * len(month_providers), dtype=object),
+            'position': pd.Series(range(len(month_providers)), dtype="uint32"),
+        })
+
+        self._providers = pd.concat([self._providers[self._providers['month'] != date], month_rows], ignore_index=True)
+        self._providers.sort_values(by=['month', 'position'], kind='stable', inplace=True, ignore_index=True)
+
+        if date not in self._registered_months:
+            self._registered_months = sorted([*self._registered_months, date])
+
+        return [provider for provider in month_providers if provider not in providers_seen_before]
+
+    def unregister_month(self, date: str):
+        """Remove a month (e.g. one whose data file is no longer available) from the index"""
+        self._providers = self._providers[self._providers['month'] != date].reset_index(drop=True)
+
+        if date in self._registered_months:
+            self._registered_months.remove(date)
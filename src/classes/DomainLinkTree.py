@@ -1,39 +1,95 @@
 from __future__ import annotations
 
+import heapq
+import struct
+import sys
 from abc import ABC
-from collections import deque
-from typing import List, Any
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, Tuple
+
+
+# Shared (read-only) children of all the nodes without any children - saves a dict per leaf node
+_NO_CHILDREN: Mapping[str, Node] = MappingProxyType({})
 
 
 class Node(ABC):
+    __slots__ = ('label', 'parent', 'sequence_number', '_children', '_added_children_count')
 
     def __init__(self, label: str):
-        self.label = label
+        # Labels repeat across the tree (and across the links) - a single copy of every label is kept
+        self.label = sys.intern(label)
 
         self.parent: Node | None = None
-        self.children: List[Node] = []
+        # Number of the node among its siblings - the siblings are traversed in the order of their sequence numbers
+        self.sequence_number: int = 0
+
+        # Children by their label - in the order they were added (created with the first child)
+        self._children: Dict[str, Node] | None = None
+        self._added_children_count = 0
 
     def __eq__(self, other: Node):
         """Object identity (used to check for equality when looking up a node in another node's child list)"""
         return self.label == other.label
 
+    @property
+    def children(self) -> Mapping[str, Node]:
+        return self._children if self._children is not None else _NO_CHILDREN
+
+    @property
+    def bfs_key(self) -> bytes:
+        """
+        Key of the node in the breadth-first traversal order - the depth of the node & the sequence numbers of its
+        ancestors and itself (fixed width, so the keys compare byte by byte)
+        """
+        sequence_numbers = []
+        node = self
+        while node.parent is not None:
+            sequence_numbers.append(node.sequence_number)
+            node = node.parent
+
+        return struct.pack(f">H{len(sequence_numbers)}I", len(sequence_numbers), *reversed(sequence_numbers))
+
     def get_child_by_label(self, label: str, default: Any = None) -> Node:
-        for child in self.children:
-            if child.label == label:
-                return child
-        return default
+        return self.children.get(label, default)
 
     def add_child(self, child: Node):
-        if child not in self.children:
+        if self._children is None:
+            self._children = {}
+
+        if child.label not in self._children:
             child.parent = self
-            self.children.append(child)
+            child.sequence_number = self._added_children_count
+            self._added_children_count += 1
+            self._children[child.label] = child
+
+    def replace_child(self, child: Node):
+        """
+        Replace the child with the same label - the new child takes over its children, but it is added as the last
+        child (the traversal order of the whole subtree changes)
+        """
+        replaced_child = self._children.pop(child.label)
+        self.add_child(child)
+
+        child._children = replaced_child._children
+        child._added_children_count = replaced_child._added_children_count
+        for grandchild in child.children.values():
+            grandchild.parent = child
+
+    def iter_subtree(self) -> Iterator[Node]:
+        """The node & all its descendants"""
+        nodes_to_visit = [self]
+        while len(nodes_to_visit) > 0:
+            node = nodes_to_visit.pop()
+            yield node
+            nodes_to_visit.extend(node.children.values())
 
     def remove_child(self, child: Node):
-        self.children.remove(child)
+        del self._children[child.label]
 
 
 class StructureNode(Node):
     """Node used to mark link tree structure, not a usable link"""
+    __slots__ = ()
 
     def __init__(self, label: str):
         super().__init__(label)
@@ -44,6 +100,7 @@ class StructureNode(Node):
 
 class LinkNode(Node):
     """Node used to mark usable links"""
+    __slots__ = ('visited',)
 
     def __init__(self, label: str):
         super().__init__(label)
@@ -60,6 +117,11 @@ class DomainLinkTree:
     A "registry" to manage URL links.
     Supports adding new links to a tree structure and retrieving them using breadth-first traversal strategy.
     When a link is retrieved, it will be internally marked as visited, so it does not have to be visited again.
+
+    The unvisited links are kept in a frontier (a heap ordered by the breadth-first traversal order) maintained while
+    adding links - retrieving a link does not traverse the tree.
+    The nodes are slotted objects with interned labels - link-dense domains (100k+ links) take a few tens of MB
+    (see benchmark_domain_link_tree.py).
     """
 
     def __init__(self, domain_name: str, initial_links: List[str] = None):
@@ -70,6 +132,10 @@ class DomainLinkTree:
         # Here, the LinkNode translates to the base domain link - https://{domain_name}
         self._link_tree_root: LinkNode = LinkNode('')
 
+        # Unvisited links by their breadth-first traversal key - the root goes first
+        self._frontier: List[Tuple[bytes, LinkNode]] = []
+        self._add_to_frontier(self._link_tree_root)
+
         if initial_links:
             self.add(initial_links)
 
@@ -77,46 +143,34 @@ class DomainLinkTree:
         return f"<DomainLinkTree domain='{self._domain_name}' visited_links_count='{self._visited_links_count}'>"
 
     def get_next(self):
-        traverse_queue = deque()
+        while len(self._frontier) > 0:
+            bfs_key, next_node = heapq.heappop(self._frontier)
+            if bfs_key != next_node.bfs_key:
+                # The node has moved since (see Node.replace_child) - its entry with the current position is used
+                continue
 
-        # Verify root
-        if not self._link_tree_root.visited:
-            self._link_tree_root.visited = True
+            next_node.visited = True
             self._visited_links_count += 1
-            return self._node_to_link(self._link_tree_root)
-
-        # Expand root's children
-        current_node = self._link_tree_root
-        for child in current_node.children:
-            traverse_queue.appendleft(child)
-
-        while len(traverse_queue) > 0:
-            # Get and verify current
-            current_node = traverse_queue.pop()
-            if isinstance(current_node, LinkNode) and current_node.visited is False:
-                # Return the node if it is an unvisited LinkNode
-                current_node.visited = True
-                self._visited_links_count += 1
-                return self._node_to_link(current_node)
-
-            # Expand current's children
-            for child in current_node.children:
-                traverse_queue.appendleft(child)
+            return self._node_to_link(next_node)
 
         # No unvisited links available
         return None
 
+    def _add_to_frontier(self, node: LinkNode):
+        heapq.heappush(self._frontier, (node.bfs_key, node))
+
     def _node_to_link(self, node: LinkNode):
         if node is None:
             return f"https://{self._domain_name}"
 
-        result = node.label
-        parent_node = node.parent
-        while parent_node is not None:
-            if parent_node.label != '':
-                result = f"{parent_node.label}/{result}"
-            parent_node = parent_node.parent
+        # Labels from the node up to the root - joined at once
+        labels = []
+        while node is not None:
+            if node.label != '':
+                labels.append(node.label)
+            node = node.parent
 
+        result = "/".join(reversed(labels))
         if result.strip() == "":
             return f"https://{self._domain_name}"
         return f"https://{self._domain_name}/{result}"
@@ -130,32 +184,30 @@ class DomainLinkTree:
             parent_node = self._link_tree_root
 
             for current_part_idx, current_part in enumerate(current_link_parts):
-                
-                adding_last_part = current_part_idx == len(current_link_parts) - 1 
 
-                # Init the node
-                if adding_last_part:
-                    # The LAST part of any link marks a whole LINK
-                    node_to_add = LinkNode(current_part)
-                else:
-                    # Any other part is just a placeholder StructureNode with a label
-                    node_to_add = StructureNode(current_part)
+                adding_last_part = current_part_idx == len(current_link_parts) - 1
+                existing_current_part_node = parent_node.get_child_by_label(current_part)
 
-                # Insert or update the node into the tree
-                if node_to_add not in parent_node.children:
+                if existing_current_part_node is None:
                     # If not created yet - simply insert
+                    # The LAST part of any link marks a whole LINK
+                    # Any other part is just a placeholder StructureNode with a label
+                    node_to_add = LinkNode(current_part) if adding_last_part else StructureNode(current_part)
                     parent_node.add_child(node_to_add)
 
-                else:
+                    if adding_last_part:
+                        self._add_to_frontier(node_to_add)
+
+                elif adding_last_part and isinstance(existing_current_part_node, StructureNode):
                     # If created already - update it only when adding the last part of a link (change Structure to Link)
-                    existing_current_part_node = parent_node.get_child_by_label(current_part)
-                    if isinstance(node_to_add, LinkNode) and isinstance(existing_current_part_node, StructureNode):
-                        # Adding the last part - replace the existing Structure Node with a Link Node (keep children)
-                        existing_current_part_node_children = existing_current_part_node.children
-
-                        node_to_add.children = existing_current_part_node_children
-                        parent_node.remove_child(existing_current_part_node)
-                        parent_node.add_child(node_to_add)
+                    # Replace the existing Structure Node with a Link Node (keep children)
+                    node_to_add = LinkNode(current_part)
+                    parent_node.replace_child(node_to_add)
+
+                    # The whole subtree has moved - re-add its unvisited links with their new positions
+                    for node in node_to_add.iter_subtree():
+                        if isinstance(node, LinkNode) and not node.visited:
+                            self._add_to_frontier(node)
 
                 # Traverse down the tree to the node that was created
                 parent_node = parent_node.get_child_by_label(current_part)
@@ -1,10 +1,14 @@
 from __future__ import annotations
-import numpy as np
+from typing import Any, Dict, List, Set
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pandas import DataFrame, Series
 from pathlib import Path
 
 from src import crawling_utils
+from src.month_totals import month_totals_from_table, with_month_totals
 from src.crawling_utils import ResponseData, NelHeaders, RtHeaders
 
 
@@ -31,40 +35,78 @@ class DomainNelDataRegistry(object):
         'rt_collectors': "object",
     }
 
+    # Columns computed by count_totals - unknown while the responses are being inserted
+    TOTALS_COLUMNS = [
+        'url_domain_hosted_resources',
+        'url_domain_hosted_resources_with_nel',
+        'url_domain_monitored_resources_ratio',
+        'total_crawled_resources',
+        'total_crawled_domains',
+        'total_crawled_resources_with_nel',
+        'total_crawled_domains_with_nel',
+        'total_crawled_resources_with_correct_nel',
+        'total_crawled_domains_with_correct_nel',
+    ]
+
     def __init__(self):
         self._total_crawled_resources: int = 0
-        self._data: DataFrame = DataFrame({
-            'type': [],
-            'status': [],
-            'url': [],
-            'url_domain': [],
-            'url_domain_hosted_resources': [],
-            'url_domain_hosted_resources_with_nel': [],
-            'url_domain_monitored_resources_ratio': [],
-            'total_crawled_resources': [],
-            'total_crawled_domains': [],
-            'total_crawled_resources_with_nel': [],
-            'total_crawled_domains_with_nel': [],
-            'total_crawled_resources_with_correct_nel': [],
-            'total_crawled_domains_with_correct_nel': [],
-            'nel_max_age': [],
-            'nel_failure_fraction': [],
-            'nel_success_fraction': [],
-            'nel_include_subdomains': [],
-            'nel_report_to': [],
-            'rt_collectors': [],
-        }).astype(DomainNelDataRegistry.DF_SCHEMA)
+
+        # The inserted rows are appended to plain per-column lists (and the added registries to a list of their data).
+        # The DataFrame is built from them only once the data is needed (see _data)
+        self._materialized_data: DataFrame = DataFrame(
+            {column: [] for column in DomainNelDataRegistry.DF_SCHEMA}).astype(DomainNelDataRegistry.DF_SCHEMA)
+        self._pending_data: List[DataFrame] = []
+        self._pending_rows: Dict[str, List[Any]] = self._empty_rows()
+
+        # URLs of all the rows - to skip the duplicate resources without scanning the data
+        self._urls: Set[str] = set()
+
+    @property
+    def _data(self) -> DataFrame:
+        """The registry data - the rows inserted (& the registries added) since the last access are appended at once"""
+        self._flush_pending()
+
+        if len(self._pending_data) > 0:
+            data = [self._materialized_data] if not self._materialized_data.empty else []
+            data += self._pending_data
+            self._materialized_data = data[0] if len(data) == 1 else pd.concat(data)
+            self._pending_data = []
+
+        return self._materialized_data
+
+    @_data.setter
+    def _data(self, data: DataFrame):
+        self._materialized_data = data
+        self._pending_data = []
+        self._pending_rows = self._empty_rows()
+        self._urls = set(data['url']) if 'url' in data.columns else set()
+
+    def _flush_pending(self):
+        """Move the rows inserted so far into the pending data (behind the registries added before them)"""
+        if len(self._pending_rows['url']) > 0:
+            rows_count = len(self._pending_rows['url'])
+            self._pending_data.append(DataFrame({
+                column: self._pending_rows.get(column, [None] * rows_count)
+                for column in DomainNelDataRegistry.DF_SCHEMA
+            }).astype(DomainNelDataRegistry.DF_SCHEMA))
+            self._pending_rows = self._empty_rows()
+
+    @staticmethod
+    def _empty_rows() -> Dict[str, List[Any]]:
+        return {column: [] for column in DomainNelDataRegistry.DF_SCHEMA if column not in
+                DomainNelDataRegistry.TOTALS_COLUMNS}
 
     def insert(self, domain_name: str, response_data: ResponseData):
         url = response_data.url if not response_data.url.endswith('/') else response_data.url[:-1]
 
-        if url in self._data['url'].values:
+        if url in self._urls:
             # Do not process duplicate resources at all
             # Duplicate resources are mostly crawled when loading sub-resources of the currently crawled document
             return
 
         # If inserting a new resource (url), increase the number of total (unique) crawled resources
         self._total_crawled_resources += 1
+        self._urls.add(url)
 
         nel_fields: NelHeaders = crawling_utils.parse_nel_header(response_data.headers.get("nel", None))
         rt_fields: RtHeaders = crawling_utils.parse_rt_header(response_data.headers.get("report-to", None))
@@ -78,46 +120,26 @@ class DomainNelDataRegistry(object):
             # Incorrect NEL config
             nel_report_to = None
 
-        new_registry_row = DataFrame({
-            "type": [content_type],
-            "status": [response_data.status],
-            "url": [url],
-            "url_domain": [domain_name],
-            'url_domain_hosted_resources': [np.nan],
-            'url_domain_hosted_resources_with_nel': [np.nan],
-            'url_domain_monitored_resources_ratio': [np.nan],
-            'total_crawled_resources': [np.nan],
-            'total_crawled_domains': [np.nan],
-            'total_crawled_resources_with_nel': [np.nan],
-            'total_crawled_domains_with_nel': [np.nan],
-            'total_crawled_resources_with_correct_nel': [np.nan],
-            'total_crawled_domains_with_correct_nel': [np.nan],
-            "nel_max_age": [nel_fields.max_age],
-            "nel_failure_fraction": [nel_fields.failure_fraction],
-            "nel_success_fraction": [nel_fields.success_fraction],
-            "nel_include_subdomains": [nel_fields.include_subdomains],
-            "nel_report_to": [nel_report_to],
-            "rt_collectors": [rt_fields.endpoints]
-        }).astype(DomainNelDataRegistry.DF_SCHEMA)
-
-        # Append to registry dataframe
-        if self._data.empty:
-            self._data = new_registry_row
-        else:
-            self._data = pd.concat([self._data, new_registry_row])
+        # Append to the registry's columns (the totals columns are filled with nulls once the DataFrame is built)
+        self._pending_rows["type"].append(content_type)
+        self._pending_rows["status"].append(response_data.status)
+        self._pending_rows["url"].append(url)
+        self._pending_rows["url_domain"].append(domain_name)
+        self._pending_rows["nel_max_age"].append(nel_fields.max_age)
+        self._pending_rows["nel_failure_fraction"].append(nel_fields.failure_fraction)
+        self._pending_rows["nel_success_fraction"].append(nel_fields.success_fraction)
+        self._pending_rows["nel_include_subdomains"].append(nel_fields.include_subdomains)
+        self._pending_rows["nel_report_to"].append(nel_report_to)
+        self._pending_rows["rt_collectors"].append(rt_fields.endpoints)
 
     def concat_content(self, other: DomainNelDataRegistry):
         self._total_crawled_resources += other._total_crawled_resources
 
-        if self._data.empty and not other._data.empty:
-            # Store the other registry if this registry is empty and the other is not
-            self._data = other._data
-
-        elif not self._data.empty and not other._data.empty:
-            # Merge registries if both are not empty
-            self._data = pd.concat([self._data, other._data])
-
-        # Otherwise there is nothing to concat
+        # Concatenated with the rest of the data once the data is needed (not once per added registry)
+        if not other._data.empty:
+            self._flush_pending()  # Keep the order of the rows - the rows inserted so far go first
+            self._pending_data.append(other._data)
+            self._urls |= other._urls
 
     def filter_out_incorrect_nel(self):
         # Keep only the resources with correct NEL
@@ -127,19 +149,10 @@ class DomainNelDataRegistry(object):
             inplace=True)
 
         self._data.reset_index(drop=True, inplace=True)
+        self._urls = set(self._data['url'])
 
     def _should_count_totals(self):
-        if self._data[[
-            'url_domain_hosted_resources',
-            'url_domain_hosted_resources_with_nel',
-            'url_domain_monitored_resources_ratio',
-            'total_crawled_resources',
-            'total_crawled_domains',
-            'total_crawled_resources_with_nel',
-            'total_crawled_domains_with_nel',
-            'total_crawled_resources_with_correct_nel',
-            'total_crawled_domains_with_correct_nel'
-        ]].isnull().values.any():
+        if self._data[DomainNelDataRegistry.TOTALS_COLUMNS].isnull().values.any():
             return True
         return False
 
@@ -167,24 +180,28 @@ class DomainNelDataRegistry(object):
                 self._calculate_total_crawled_domains_with_correct_nel()
 
     def _calculate_url_domain_hosted_resources(self):
-        url_counts_by_domain = self._data.groupby(['url_domain'])['url'].count()
-        return self._data['url_domain'].map(url_counts_by_domain)
+        url_counts_by_domain = self._data.groupby(['url_domain'], observed=True)['url'].count()
+        # Mapped as plain values - a categorical url_domain would map to a categorical (non-numeric) result
+        return self._data['url_domain'].astype(object).map(url_counts_by_domain)
 
     def _calculate_url_domain_hosted_resources_with_nel(self):
-        url_with_nel_counts_by_domain = self._data.groupby(['url_domain'])['nel_max_age'].count()  # None-s do not count
-        return self._data['url_domain'].map(url_with_nel_counts_by_domain)
+        # None-s do not count
+        url_with_nel_counts_by_domain = self._data.groupby(['url_domain'], observed=True)['nel_max_age'].count()
+        return self._data['url_domain'].astype(object).map(url_with_nel_counts_by_domain)
 
     def _calculate_total_crawled_resources_with_nel(self):
         return len(self._data[self._data['nel_max_age'].notna()])
 
     def _calculate_total_crawled_domains_with_nel(self):
-        return self._data.groupby(['url_domain'])['nel_max_age'].agg(self.__agg_at_least_one_non_null).sum()
+        return self._data.groupby(['url_domain'], observed=True)['nel_max_age'] \
+            .agg(self.__agg_at_least_one_non_null).sum()
 
     def _calculate_total_crawled_resources_with_correct_nel(self):
         return len(self._data[self._data['nel_report_to'].notna()])
 
     def _calculate_total_crawled_domains_with_correct_nel(self):
-        return self._data.groupby(['url_domain'])['nel_report_to'].agg(self.__agg_at_least_one_non_null).sum()
+        return self._data.groupby(['url_domain'], observed=True)['nel_report_to'] \
+            .agg(self.__agg_at_least_one_non_null).sum()
 
     @staticmethod
     def __agg_at_least_one_non_null(nel_report_to: Series):
@@ -197,7 +214,12 @@ class DomainNelDataRegistry(object):
         return 1 if contains_any_correct_nel_resources else 0
 
     def save(self, file_path: str | Path):
-        self._data.to_parquet(file_path)
+        table = pa.Table.from_pandas(self._data)
+
+        # Store the month totals (same in every row) in the file's footer as well
+        table = table.replace_schema_metadata(with_month_totals(table.schema, month_totals_from_table(table)).metadata)
+
+        pq.write_table(table, file_path)
 
     def save_raw(self, file_path: str | Path):
         self._data['total_crawled_resources'] = self._total_crawled_resources
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Set
+
+import google.api_core.exceptions
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+from src.bq_parametrized_queries import QUERY_NEL_DATA_BODY
+from src.classes.PslResolver import PslResolver
+from src.nel_extraction import extract_nel_data_from_files, summary_requests_path
+
+
+class LocalBigQueryClient(object):
+    """
+    Offline stand-in for a google.cloud.bigquery.Client - supports just what query_and_store needs.
+
+    The HTTP Archive tables (e.g. httparchive.summary_requests.2018_09_01_desktop) are local Parquet samples:
+    <tables_dir>/<table id>.parquet or a directory <tables_dir>/<table id>/ of Parquet shards.
+    The NEL data query runs locally (see nel_extraction) and the resulting tables are kept in memory. Tables are
+    exported into the storage directory shared with a LocalStorageClient (gs://<bucket>/<blob> ->
+    <storage_dir>/<bucket>/<blob>).
+    """
+
+    SOURCE_TABLE_PATTERN = re.compile(r"FROM `([^`]+)`")
+
+    def __init__(self, project: str, tables_dir: str | Path, storage_dir: str | Path, latency: float = 0.0,
+                 export_blob_rows: int = 64 * 1024, psl_resolver: PslResolver | None = None, workers: int = 1):
+        """
+        :param project: Google Cloud project name
+        :param tables_dir: Directory with the HTTP Archive table samples
+        :param storage_dir: Directory holding the buckets (see LocalStorageClient)
+        :param latency: Seconds added to every job (query, export)
+        :param export_blob_rows: Max. rows of an exported blob
+        :param psl_resolver: PSL to emulate NET.REG_DOMAIN with (see nel_extraction)
+        :param workers: Threads running the query
+        """
+        self.project = project
+        self._tables_dir = Path(tables_dir)
+        self._storage_dir = Path(storage_dir)
+        self._latency = latency
+        self._export_blob_rows = export_blob_rows
+        self._psl_resolver = psl_resolver
+        self._workers = workers
+
+        self._datasets: Set[str] = set()
+        self._tables: Dict[str, pa.Table] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<LocalBigQueryClient project='{self.project}' tables='{len(self._tables)}'>"
+
+    def get_table_data(self, table: Any) -> pa.Table:
+        """Rows of a table (local only - lets the results be inspected without exporting them)"""
+        with self._lock:
+            if _table_id(table) not in self._tables:
+                raise google.api_core.exceptions.NotFound(f"Table {_table_id(table)} does not exist")
+            return self._tables[_table_id(table)]
+
+    def create_dataset(self, dataset: bigquery.Dataset, **_) -> bigquery.Dataset:
+        dataset_id = f"{dataset.project}.{dataset.dataset_id}"
+        with self._lock:
+            if dataset_id in self._datasets:
+                raise google.api_core.exceptions.Conflict(f"Dataset {dataset_id} already exists")
+            self._datasets.add(dataset_id)
+
+        return dataset
+
+    def create_table(self, table: bigquery.Table, **_) -> bigquery.Table:
+        with self._lock:
+            if _table_id(table) in self._tables:
+                raise google.api_core.exceptions.Conflict(f"Table {_table_id(table)} already exists")
+            self._tables[_table_id(table)] = pa.table({field.name: [] for field in table.schema})
+
+        return table
+
+    def delete_table(self, table: Any, not_found_ok: bool = False, **_):
+        with self._lock:
+            if self._tables.pop(_table_id(table), None) is None and not not_found_ok:
+                raise google.api_core.exceptions.NotFound(f"Table {_table_id(table)} does not exist")
+
+    def query_and_wait(self, query: str, job_config: bigquery.QueryJobConfig | None = None, **_) -> pa.Table:
+        """Run the NEL data query - returns the query result"""
+        self._simulate_job()
+
+        if not query.endswith(QUERY_NEL_DATA_BODY):
+            raise NotImplementedError("Only the NEL data query can run locally")
+
+        source_tables = self.SOURCE_TABLE_PATTERN.findall(query[:-len(QUERY_NEL_DATA_BODY)])
+        result = extract_nel_data_from_files([self._source_table_path(table_id) for table_id in source_tables],
+                                             self._psl_resolver, workers=self._workers)
+
+        if job_config is not None and job_config.destination is not None:
+            self._write_query_result(_table_id(job_config.destination), result, job_config.write_disposition)
+
+        return result
+
+    def extract_table(self, source: Any, destination_uris: str, job_config: bigquery.ExtractJobConfig | None = None,
+                      **_) -> LocalJob:
+        """Export a table as Parquet blobs - destination_uris: gs://<bucket>/<blob name pattern with a *>"""
+        self._simulate_job()
+
+        bucket_name, blob_name_pattern = destination_uris.removeprefix("gs://").split("/", 1)
+        bucket_dir = self._storage_dir / bucket_name
+        if not bucket_dir.is_dir():
+            raise google.api_core.exceptions.NotFound(f"Bucket {bucket_name} does not exist")
+
+        table = self.get_table_data(source)
+        compression = "snappy" if job_config is None or job_config.compression is None \
+            else job_config.compression.lower()
+
+        # Even an empty table is exported as a single (empty) blob
+        for blob_idx, offset in enumerate(range(0, max(table.num_rows, 1), self._export_blob_rows)):
+            blob_file = bucket_dir / blob_name_pattern.replace("*", f"{blob_idx:012}")
+            blob_file.parent.mkdir(parents=True, exist_ok=True)
+            pq.write_table(table.slice(offset, self._export_blob_rows), blob_file, compression=compression)
+
+        return LocalJob()
+
+    def _source_table_path(self, table_id: str) -> Path:
+        try:
+            return summary_requests_path(self._tables_dir, table_id)
+        except FileNotFoundError as e:
+            raise google.api_core.exceptions.NotFound(str(e))
+
+    def _write_query_result(self, table_id: str, result: pa.Table, write_disposition: str | None):
+        with self._lock:
+            existing = self._tables.get(table_id)
+
+            if write_disposition == bigquery.WriteDisposition.WRITE_APPEND and existing is not None \
+                    and existing.num_rows > 0:
+                result = pa.concat_tables([existing.cast(result.schema), result])
+            elif write_disposition in (None, bigquery.WriteDisposition.WRITE_EMPTY) and existing is not None \
+                    and existing.num_rows > 0:
+                raise google.api_core.exceptions.Conflict(f"Table {table_id} is not empty")
+
+            self._tables[table_id] = result
+
+    def _simulate_job(self):
+        if self._latency > 0:
+            time.sleep(self._latency)
+
+
+class LocalJob(object):
+    """A finished job of the LocalBigQueryClient"""
+
+    def result(self):
+        return None
+
+
+def _table_id(table: Any) -> str:
+    """ID (project.dataset.table) of a table given as an ID, a bigquery.Table or a bigquery.TableReference"""
+    if isinstance(table, str):
+        return table
+
+    return f"{table.project}.{table.dataset_id}.{table.table_id}"
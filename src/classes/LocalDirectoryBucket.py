@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import shutil
+import time
+from pathlib import Path
+from typing import Iterator
+
+from src.blob_download import file_md5_hash
+
+
+class LocalBlob(object):
+    """A file of a LocalDirectoryBucket - exposes the google.cloud.storage.Blob attributes used by the download"""
+
+    def __init__(self, file_path: Path, name: str, bucket: LocalDirectoryBucket):
+        self._file_path = file_path
+        self._bucket = bucket
+        self.name = name
+
+    def __repr__(self):
+        return f"<LocalBlob name='{self.name}'>"
+
+    @property
+    def size(self) -> int:
+        return self._file_path.stat().st_size
+
+    @property
+    def md5_hash(self) -> str:
+        return file_md5_hash(self._file_path)
+
+    def download_to_filename(self, filename: str):
+        self._bucket.simulate_transfer(self.size)
+        shutil.copyfile(self._file_path, filename)
+
+    def delete(self):
+        self._bucket.simulate_transfer(0)
+        self._file_path.unlink()
+
+
+class LocalDirectoryBucket(object):
+    """
+    A stand-in for a google.cloud.storage.Bucket backed by a local directory - every file of the directory is a blob
+    (the blob name is the file's path relative to the directory).
+    The latency of the requests and the bandwidth of the downloads can be simulated.
+    """
+
+    def __init__(self, directory: str | Path, latency: float = 0.0, bandwidth: float | None = None):
+        """
+        :param directory: Directory holding the blobs
+        :param latency: Seconds added to every request
+        :param bandwidth: Bytes per second of each download (None = unlimited)
+        """
+        self._directory = Path(directory)
+        self._latency = latency
+        self._bandwidth = bandwidth
+
+    def __repr__(self):
+        return f"<LocalDirectoryBucket directory='{self._directory}'>"
+
+    def list_blobs(self, prefix: str = "") -> Iterator[LocalBlob]:
+        self.simulate_transfer(0)
+
+        for file_path in sorted(self._directory.rglob("*")):
+            name = file_path.relative_to(self._directory).as_posix()
+            if file_path.is_file() and name.startswith(prefix):
+                yield LocalBlob(file_path, name, self)
+
+    def simulate_transfer(self, size: int):
+        """Wait as long as a request transferring size bytes would take"""
+        seconds = self._latency + (size / self._bandwidth if self._bandwidth else 0.0)
+        if seconds > 0:
+            time.sleep(seconds)
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import google.api_core.exceptions
+
+from src.classes.LocalDirectoryBucket import LocalDirectoryBucket
+
+
+class LocalStorageClient(object):
+    """
+    Offline stand-in for a google.cloud.storage.Client - every bucket is a directory (named after the bucket) in
+    the storage directory. See LocalBigQueryClient for the BigQuery side exporting into the same storage directory.
+    """
+
+    def __init__(self, storage_dir: str | Path, latency: float = 0.0, bandwidth: float | None = None):
+        """
+        :param storage_dir: Directory holding the buckets
+        :param latency: Seconds added to every request
+        :param bandwidth: Bytes per second of each blob download (None = unlimited)
+        """
+        self._storage_dir = Path(storage_dir)
+        self._latency = latency
+        self._bandwidth = bandwidth
+
+    def __repr__(self):
+        return f"<LocalStorageClient storage_dir='{self._storage_dir}'>"
+
+    def bucket_dir(self, bucket_name: str) -> Path:
+        return self._storage_dir / bucket_name
+
+    def create_bucket(self, bucket_name: str) -> LocalDirectoryBucket:
+        self.bucket_dir(bucket_name).mkdir(parents=True, exist_ok=True)
+        return self.get_bucket(bucket_name)
+
+    def get_bucket(self, bucket_name: str) -> LocalDirectoryBucket:
+        if not self.bucket_dir(bucket_name).is_dir():
+            raise google.api_core.exceptions.NotFound(f"Bucket {bucket_name} does not exist")
+
+        return LocalDirectoryBucket(self.bucket_dir(bucket_name), self._latency, self._bandwidth)
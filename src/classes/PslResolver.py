@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import os
+from io import StringIO
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+from src.classes.RegistrableDomainMemo import RegistrableDomainMemo
+
+
+class PslResolver(object):
+    """
+    Resolves domain names to their registrable domain names (eTLD+1) using a single, compiled Public Suffix List.
+
+    The PSL rules are compiled into a trie of reversed domain labels once (per PSL). The resolution follows the exact
+    semantics of publicsuffix2.PublicSuffixList(idna=True).get_sld(domain, wildcard=True, strict=False) that was used
+    by the analysis before - without relying on the module-global PSL cached by publicsuffix2.
+
+    Trie nodes are kept in flat structures (node id -> negation flag, node id -> children of the node).
+    A compiled PSL can be saved as an Arrow IPC file (one row per node) and memory-mapped back without parsing
+    the PSL rules again (see save/load). A loaded PSL looks its nodes up in the mapped file - the children of a node are
+    decoded only once the node is visited by a lookup.
+    """
+
+    ROOT = 0
+
+    # Bump whenever the compiled (saved) PSL format changes
+    FORMAT_VERSION = 2
+
+    SCHEMA = pa.schema([
+        ('label', pa.string()),
+        ('negate', pa.uint8()),
+        ('children_offset', pa.uint32()),
+        ('children_count', pa.uint32()),
+    ])
+
+    def __init__(self, psl_rules: Iterable[str], idna: bool = True):
+        """
+        :param psl_rules: Lines of a PSL file
+        :param idna: Convert the rules to IDNA-encoded strings (domains to resolve have to be IDNA-encoded too)
+        """
+        self._negate: List[int] | Dict[int, int] = [0]
+        self._children: Dict[int, Dict[str, int]] = {}
+
+        # Nodes of a loaded (memory-mapped) PSL - the children of a node are consecutive rows
+        self._labels: pa.Array | None = None
+        self._negate_flags: np.ndarray | None = None
+        self._children_offsets: np.ndarray | None = None
+        self._children_counts: np.ndarray | None = None
+
+        # Persistent memo of the already resolved domains (optional, see psl_utils.load_psl_resolver_for_specific_date)
+        self.memo: RegistrableDomainMemo | None = None
+
+        for line in psl_rules:
+            line = line.strip()
+            if not line or line.startswith('//'):
+                continue
+            if idna:
+                line = line.encode('idna').decode()
+
+            self._add_rule(line.split()[0].lstrip('.'))
+
+    def __repr__(self):
+        return f"<PslResolver nodes='{len(self._negate)}'>"
+
+    @staticmethod
+    def from_psl_io(custom_psl: StringIO) -> PslResolver:
+        """Compile a PSL file's contents (see psl_utils.get_psl_for_specific_date)"""
+        custom_psl.seek(0)
+        return PslResolver(custom_psl)
+
+    @staticmethod
+    def load(file_path: str | Path) -> PslResolver:
+        """Load a compiled PSL saved by save() - the file is memory-mapped, no node is decoded until it is looked up"""
+        with pa.memory_map(str(file_path), "r") as source:
+            nodes = ipc.open_file(source).read_all().combine_chunks()
+
+        # Zero-copy views of the mapped columns (the mapping lives as long as the buffers do)
+        resolver = PslResolver([])
+        resolver._labels = nodes['label'].chunk(0)
+        resolver._negate_flags = nodes['negate'].chunk(0).to_numpy()
+        resolver._negate = {resolver.ROOT: int(resolver._negate_flags[resolver.ROOT])}
+        resolver._children_offsets = nodes['children_offset'].chunk(0).to_numpy()
+        resolver._children_counts = nodes['children_count'].chunk(0).to_numpy()
+
+        return resolver
+
+    def save(self, file_path: str | Path):
+        """
+        Save the compiled PSL as an Arrow IPC file - the nodes are numbered breadth-first, so the children of a node are
+        consecutive rows (node id = row number, the root node has no label)
+        """
+        saved_nodes = [self.ROOT]  # Node ids of this resolver in the order of the saved rows
+        labels: List[str | None] = [None]
+        children_offsets: List[int] = []
+        children_counts: List[int] = []
+
+        for node in saved_nodes:  # Grows while being iterated (breadth-first)
+            children = self._node_children(node)
+            children_offsets.append(len(saved_nodes))
+            children_counts.append(len(children))
+
+            saved_nodes.extend(children.values())
+            labels.extend(children.keys())
+
+        nodes = pa.table([
+            pa.array(labels, type=pa.string()),
+            pa.array([self._negate[node] for node in saved_nodes], type=pa.uint8()),
+            pa.array(children_offsets, type=pa.uint32()),
+            pa.array(children_counts, type=pa.uint32()),
+        ], schema=self.SCHEMA)
+
+        # Write to a temporary file first - other processes might be loading the same compiled PSL
+        file_path = Path(file_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file_path = file_path.with_name(f"{file_path.name}.{os.getpid()}.tmp")
+
+        with pa.OSFile(str(temp_file_path), "wb") as sink:
+            with ipc.new_file(sink, self.SCHEMA) as writer:
+                writer.write_table(nodes)
+
+        os.replace(temp_file_path, file_path)
+
+    def _add_rule(self, rule: str):
+        if rule.startswith('!'):
+            negate = 1
+            rule = rule[1:]
+        else:
+            negate = 0
+
+        node = self.ROOT
+        for label in reversed(rule.split('.')):
+            children = self._children.setdefault(node, {})
+            child = children.get(label)
+            if child is None:
+                child = len(self._negate)
+                self._negate.append(0)
+                children[label] = child
+            node = child
+
+        self._negate[node] = negate
+
+    def _node_children(self, node: int) -> Dict[str, int]:
+        """Children of a node by their labels (decoded from the mapped file once, if the PSL was loaded)"""
+        children = self._children.get(node)
+        if children is None and self._labels is not None:
+            offset, count = int(self._children_offsets[node]), int(self._children_counts[node])
+            children = dict(zip(self._labels.slice(offset, count).to_pylist(), range(offset, offset + count)))
+            self._negate.update(zip(range(offset, offset + count), self._negate_flags[offset:offset + count].tolist()))
+            self._children[node] = children
+
+        return children if children is not None else {}
+
+    def _lookup(self, matches: List[int | None], depth: int, node: int, labels: List[str]):
+        """
+        Walk the trie along the domain's labels (and wildcards) and mark the negation flags of all the matched nodes.
+        When no rule matches, the prevailing rule is "*" (see Algorithm at https://publicsuffix.org/list/)
+        """
+        if depth == 1:
+            matches[-depth] = 0
+
+        children = self._node_children(node)
+        if not children or depth > len(labels):
+            return
+
+        for label in ('*', labels[-depth]):
+            child = children.get(label)
+            if child is not None:
+                matches[-depth] = self._negate[child]
+                self._lookup(matches, depth + 1, child, labels)
+
+    def resolve(self, domain: str | None) -> str | None:
+        """
+        Get the registrable domain name (eTLD+1) of a domain.
+        A domain that is an eTLD itself is returned as-is.
+
+        :param domain: Domain name (IDNA-encoded)
+        :return: eTLD+1 of the domain (None for an empty domain)
+        """
+        if not domain:
+            return None
+
+        labels = domain.lower().strip('.').split('.')
+
+        suffix_labels_count = 0
+        if labels[-1] in self._node_children(self.ROOT):
+            matches: List[int | None] = [None] * len(labels)
+            self._lookup(matches, 1, self.ROOT, labels)
+
+            for label_idx, negate in enumerate(matches):
+                if negate == 0:
+                    suffix_labels_count = len(labels) - label_idx
+                    break
+
+        if len(labels) <= suffix_labels_count:
+            return '.'.join(labels)
+
+        return '.'.join(labels[-(suffix_labels_count + 1):])
+
+    def resolve_many(self, domains: pa.Array | pa.ChunkedArray | np.ndarray | Iterable[str]) -> pa.Array:
+        """
+        Get the registrable domain names (eTLD+1) of multiple domains. Each unique domain is resolved only once
+        (and only if it is not in the memo yet, when a memo is used).
+
+        :param domains: Domain names (IDNA-encoded, nulls allowed)
+        :return: Registrable domain names - in the order of the given domains
+        """
+        if isinstance(domains, pa.ChunkedArray):
+            domains = domains.combine_chunks()
+        elif not isinstance(domains, pa.Array):
+            domains = pa.array(domains, type=pa.string())
+
+        encoded_domains = pc.dictionary_encode(domains)
+
+        if self.memo is not None:
+            resolved_domains = self.memo.get_or_resolve(encoded_domains.dictionary, self.resolve)
+        else:
+            resolved_domains = pa.array(
+                [self.resolve(domain) for domain in encoded_domains.dictionary.to_pylist()], type=pa.string()
+            )
+
+        return pc.take(resolved_domains, encoded_domains.indices)
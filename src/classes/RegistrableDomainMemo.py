@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Callable
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+
+class RegistrableDomainMemo(object):
+    """
+    Persistent memo of the registrable domain names (eTLD+1) already resolved with a specific PSL snapshot.
+
+    Collector hostnames recur in most of the analyzed months - with the memo, only the hostnames not seen before
+    (with the same PSL snapshot) have to be resolved. Each PSL snapshot has its own memo file, so the memo is keyed
+    by (hostname, PSL snapshot id).
+    """
+
+    SNAPSHOT_ID_METADATA_KEY = b"psl_snapshot_id"
+
+    SCHEMA = pa.schema([
+        ('hostname', pa.string()),
+        ('registrable_domain', pa.string()),
+    ])
+
+    def __init__(self, file_path: str | Path, snapshot_id: str):
+        self._file_path = Path(file_path)
+        self._snapshot_id = snapshot_id
+
+        self._hostnames: pa.Array = pa.array([], type=pa.string())
+        self._registrable_domains: pa.Array = pa.array([], type=pa.string())
+
+    def __repr__(self):
+        return f"<RegistrableDomainMemo snapshot='{self._snapshot_id}' hostnames='{len(self._hostnames)}'>"
+
+    def __len__(self):
+        return len(self._hostnames)
+
+    @staticmethod
+    def load(file_path: str | Path, snapshot_id: str) -> RegistrableDomainMemo:
+        memo = RegistrableDomainMemo(file_path, snapshot_id)
+        memo._hostnames, memo._registrable_domains = memo._read_entries()
+
+        return memo
+
+    def save(self):
+        """Save the memo (entries saved by other processes in the meantime are kept)"""
+        saved_hostnames, saved_registrable_domains = self._read_entries()
+        if len(saved_hostnames) > 0:
+            self._add(saved_hostnames, saved_registrable_domains)
+
+        table = pa.table([self._hostnames, self._registrable_domains], schema=self.SCHEMA)
+        table = table.replace_schema_metadata({self.SNAPSHOT_ID_METADATA_KEY: self._snapshot_id.encode("utf-8")})
+
+        self._file_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file_path = self._file_path.with_name(f"{self._file_path.name}.{os.getpid()}.tmp")
+        pq.write_table(table, temp_file_path)
+        os.replace(temp_file_path, self._file_path)
+
+    def get_or_resolve(self, hostnames: pa.Array, resolve: Callable[[str | None], str | None]) -> pa.Array:
+        """
+        Get the registrable domain names of (unique) hostnames. Only the hostnames missing in the memo are resolved
+        - and the memo is saved right after.
+
+        :param hostnames: Unique hostnames
+        :param resolve: Function resolving a single hostname to its registrable domain name
+        :return: Registrable domain names in the order of the hostnames
+        """
+        memo_indices = pc.index_in(hostnames, value_set=self._hostnames)
+
+        missing_hostnames = hostnames.filter(pc.and_(pc.is_null(memo_indices), pc.is_valid(hostnames)))
+        if len(missing_hostnames) > 0:
+            resolved_domains = pa.array([resolve(hostname) for hostname in missing_hostnames.to_pylist()],
+                                        type=pa.string())
+            self._add(missing_hostnames, resolved_domains)
+            self.save()
+
+            memo_indices = pc.index_in(hostnames, value_set=self._hostnames)
+
+        return pc.take(self._registrable_domains, memo_indices)
+
+    def _add(self, hostnames: pa.Array, registrable_domains: pa.Array):
+        new_entries = pc.invert(pc.is_in(hostnames, value_set=self._hostnames))
+
+        self._hostnames = pa.concat_arrays([self._hostnames, hostnames.filter(new_entries)])
+        self._registrable_domains = pa.concat_arrays([self._registrable_domains,
+                                                      registrable_domains.filter(new_entries)])
+
+    def _read_entries(self) -> tuple[pa.Array, pa.Array]:
+        if self._file_path.is_file():
+            metadata = pq.read_schema(self._file_path).metadata or {}
+            if metadata.get(self.SNAPSHOT_ID_METADATA_KEY) == self._snapshot_id.encode("utf-8"):
+                table = pq.read_table(self._file_path, schema=self.SCHEMA)
+                return (table['hostname'].combine_chunks(), table['registrable_domain'].combine_chunks())
+
+        return pa.array([], type=pa.string()), pa.array([], type=pa.string())
@@ -0,0 +1,27 @@
+class WorkerRecyclingPolicy(object):
+    """
+    Decides when a crawl worker has to recycle its session (close it & open a fresh one) - e.g. a browser context,
+    so that no cookies nor cache are shared by the domains crawled with it.
+
+    The session is recycled after max_domains domains. Recycling does not depend on how the domains are scheduled
+    (see crawl_scheduler).
+    """
+
+    def __init__(self, max_domains: int | None = None):
+        """
+        :param max_domains: Domains crawled with a single session (None = never recycle)
+        """
+        if max_domains is not None and max_domains < 1:
+            raise ValueError(f"A session has to crawl at least a single domain (got {max_domains})")
+
+        self.max_domains = max_domains
+
+    def __repr__(self):
+        return f"<WorkerRecyclingPolicy max_domains='{self.max_domains}'>"
+
+    def should_recycle(self, crawled_domains: int) -> bool:
+        """
+        :param crawled_domains: Domains crawled with the current session so far
+        :return: Whether the session has to be recycled before crawling another domain
+        """
+        return self.max_domains is not None and crawled_domains >= self.max_domains
@@ -0,0 +1,97 @@
+"""
+Scheduling of the domains to crawl among the crawl workers.
+
+All the domains are put into a single shared queue. Every worker is a long-lived task pulling one domain at a time, so
+a worker that finishes early just takes the next domain - no domain waits behind a slow one assigned to the same
+worker. The crawl ends roughly when the slowest single domain does.
+Every worker crawls with its own session (e.g. a browser with its context), recycled as decided by
+a WorkerRecyclingPolicy. A failure to crawl a domain or to open/close a session is logged and the worker moves on
+(a domain whose session could not be opened is skipped) - no failure stops the other workers.
+"""
+
+import asyncio
+import logging
+import sys
+from contextlib import AbstractAsyncContextManager, AsyncExitStack
+from typing import Any, Awaitable, Callable, List, Tuple
+
+from src.classes.WorkerRecyclingPolicy import WorkerRecyclingPolicy
+
+
+# LOGGING
+logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                    format='%(asctime)s:%(levelname)s\t- %(message)s')
+logger = logging.getLogger(__name__)
+
+
+async def crawl_domains(domains: List[str], workers: int, open_session: Callable[[], AbstractAsyncContextManager],
+                        crawl_domain: Callable[[Any, str], Awaitable[None]],
+                        recycling_policy: WorkerRecyclingPolicy = WorkerRecyclingPolicy()):
+    """
+    Crawl the domains with the workers pulling them from a shared queue
+
+    :param domains: Domains to crawl (in the order they are handed to the workers)
+    :param workers: Number of workers crawling at once
+    :param open_session: Opens a new session of a worker (an async context manager yielding the session)
+    :param crawl_domain: Crawls a domain with a session - a failure is logged and the worker moves on to the next domain
+    :param recycling_policy: Decides when a worker's session is recycled
+    """
+    if workers < 1:
+        raise ValueError(f"At least a single worker is needed (got {workers})")
+
+    domain_queue: asyncio.Queue[str] = asyncio.Queue()
+    for domain in domains:
+        domain_queue.put_nowait(domain)
+
+    await asyncio.gather(*[_crawl_worker(domain_queue, open_session, crawl_domain, recycling_policy)
+                           for _ in range(min(workers, len(domains)))])
+
+
+async def _crawl_worker(domain_queue: asyncio.Queue, open_session: Callable[[], AbstractAsyncContextManager],
+                        crawl_domain: Callable[[Any, str], Awaitable[None]], recycling_policy: WorkerRecyclingPolicy):
+    session_stack: AsyncExitStack | None = None
+    session, crawled_domains = None, 0
+
+    try:
+        while not domain_queue.empty():
+            domain = domain_queue.get_nowait()
+
+            # A session is opened only when there still is a domain to crawl with it
+            if session_stack is None:
+                try:
+                    session_stack, session = await _open_session(open_session)
+                    crawled_domains = 0
+                except Exception as ex:
+                    logger.exception(f"Domain ({domain}) skipped - the session to crawl it could not be opened: {ex}")
+                    domain_queue.task_done()
+                    continue
+
+            try:
+                await crawl_domain(session, domain)
+            except Exception as ex:
+                logger.exception(f"Domain ({domain}) crawl failed: {ex}")
+            finally:
+                domain_queue.task_done()
+
+            crawled_domains += 1
+            if recycling_policy.should_recycle(crawled_domains):
+                await _close_session(session_stack)
+                session_stack = None
+
+    finally:
+        if session_stack is not None:
+            await _close_session(session_stack)
+
+
+async def _open_session(open_session: Callable[[], AbstractAsyncContextManager]) -> Tuple[AsyncExitStack, Any]:
+    session_stack = AsyncExitStack()
+    session = await session_stack.enter_async_context(open_session())
+
+    return session_stack, session
+
+
+async def _close_session(session_stack: AsyncExitStack):
+    try:
+        await session_stack.aclose()
+    except Exception as ex:
+        logger.exception(f"Session could not be closed: {ex}")
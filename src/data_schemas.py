@@ -28,6 +28,34 @@ BIGQUERY_NEL_DATA_SCHEMA = [
     bigquery.SchemaField("rt_collectors_registrable", "STRING", mode="REPEATED"),
 ]
 
+# BIGQUERY_NEL_DATA_SCHEMA as an Arrow schema - the result of the NEL data query run locally (see nel_extraction)
+PYARROW_NEL_QUERY_RESULT_SCHEMA = pa.schema([
+    ('requestId', pa.int64()),
+    ('firstReq', pa.bool_()),
+    ('type', pa.string()),
+    ('ext', pa.string()),
+    ('status', pa.int64()),
+    ('url', pa.string()),
+    ('url_domain', pa.string()),
+    ('url_domain_registrable', pa.string()),
+    ('url_domain_hosted_resources', pa.int64()),
+    ('url_domain_hosted_resources_with_nel', pa.int64()),
+    ('url_domain_monitored_resources_ratio', pa.float64()),
+    ('total_crawled_resources', pa.int64()),
+    ('total_crawled_domains', pa.int64()),
+    ('total_crawled_resources_with_nel', pa.int64()),
+    ('total_crawled_domains_with_nel', pa.int64()),
+    ('total_crawled_resources_with_correct_nel', pa.int64()),
+    ('total_crawled_domains_with_correct_nel', pa.int64()),
+    ('nel_max_age', pa.string()),
+    ('nel_failure_fraction', pa.string()),
+    ('nel_success_fraction', pa.string()),
+    ('nel_include_subdomains', pa.string()),
+    ('nel_report_to', pa.string()),
+    ('rt_collectors', pa.list_(pa.string())),
+    ('rt_collectors_registrable', pa.list_(pa.string())),
+])
+
 
 PYARROW_MERGE_READ_SCHEMA = pa.schema([
         ('requestId', pa.uint64()),
@@ -83,3 +111,36 @@ PYARROW_MERGE_WRITE_SCHEMA = pa.schema([
     ('rt_collectors', pa.list_(pa.string())),
     ('rt_collectors_registrable', pa.list_(pa.string()))
 ])
+
+
+# Schema version of a month data file (stored in the file's footer; files without it use PYARROW_MERGE_WRITE_SCHEMA)
+NEL_DATA_SCHEMA_VERSION_METADATA_KEY = b"nel_data_schema_version"
+
+# v2: counts, HTTP status & NEL field values stored as numbers (no string parsing needed when the data is read).
+# Month data files written with the previous schema can be migrated using migrate_nel_data_files.py
+PYARROW_MERGE_WRITE_SCHEMA_V2 = pa.schema([
+    ('requestId', pa.uint64()),
+    ('firstReq', pa.bool_()),
+    ('type', pa.dictionary(pa.int32(), pa.string())),
+    ('ext', pa.dictionary(pa.int32(), pa.string())),
+    ('status', pa.uint16()),
+    ('url', pa.string()),
+    ('url_domain', pa.dictionary(pa.int32(), pa.string())),
+    ('url_domain_registrable', pa.dictionary(pa.int32(), pa.string())),
+    ('url_domain_hosted_resources', pa.uint32()),
+    ('url_domain_hosted_resources_with_nel', pa.uint32()),
+    ('url_domain_monitored_resources_ratio', pa.float32()),
+    ('total_crawled_resources', pa.uint32()),
+    ('total_crawled_domains', pa.uint32()),
+    ('total_crawled_resources_with_nel', pa.uint32()),
+    ('total_crawled_domains_with_nel', pa.uint32()),
+    ('total_crawled_resources_with_correct_nel', pa.uint32()),
+    ('total_crawled_domains_with_correct_nel', pa.uint32()),
+    ('nel_max_age', pa.uint32()),
+    ('nel_failure_fraction', pa.float32()),
+    ('nel_success_fraction', pa.float32()),
+    ('nel_include_subdomains', pa.bool_()),
+    ('nel_report_to', pa.dictionary(pa.int32(), pa.string())),
+    ('rt_collectors', pa.list_(pa.string())),
+    ('rt_collectors_registrable', pa.list_(pa.string()))
+], metadata={NEL_DATA_SCHEMA_VERSION_METADATA_KEY: b"2"})
@@ -0,0 +1,114 @@
+"""
+Lookup of the month data rows of specific domains.
+
+Only the row groups whose url_domain min/max statistics can contain the looked up domains are read. The lookup is
+selective for month data files sorted by url_domain (see month_sort) - it still works, only slower, for the
+unsorted ones. In the NEL dataset (see nel_dataset), only the domain buckets of the domains are read.
+"""
+
+import logging
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pandas import DataFrame
+
+from src.month_scan import NULLABLE_PANDAS_TYPES
+from src.nel_dataset import MONTH_PARTITION_KEY, NEL_DATASET_PARTITIONING, domain_filter, month_filter, \
+    month_partition_dirs, open_nel_dataset
+
+logger = logging.getLogger(__name__)
+
+
+def lookup_domains(domains: Iterable[str], months: Iterable[str] | None, nel_data_dir: str | Path,
+                   columns: List[str] | None = None) -> DataFrame:
+    """
+    Get the month data rows of the given domains
+
+    :param domains: url_domain values to look up
+    :param months: Months (YYYY-MM) to look the domains up in (None = all the months available, months without
+                   a month data file are skipped)
+    :param nel_data_dir: Directory with the month data files (nel_data_YYYY_MM.parquet) or the NEL dataset
+    :param columns: Month data columns to get (None = all the columns)
+    :return: Rows of the domains with the month (date) they are from
+    """
+    domains = pa.array(sorted(set(domains)), type=pa.string())
+
+    if len(month_partition_dirs(nel_data_dir)) > 0:
+        return _lookup_dataset(domains, months, nel_data_dir, columns)
+
+    if months is None:
+        input_files = sorted(Path(nel_data_dir).glob("nel_data_*.parquet"))
+    else:
+        input_files = [Path(nel_data_dir) / f"nel_data_{month.replace('-', '_')}.parquet" for month in sorted(months)]
+
+        for missing_file in [input_file for input_file in input_files if not input_file.is_file()]:
+            logger.warning(f"No month data file {missing_file.name} in {nel_data_dir} - skipping the month")
+        input_files = [input_file for input_file in input_files if input_file.is_file()]
+
+    results = []
+    for input_file in input_files:
+        month_rows = _lookup_month(input_file, domains, columns)
+        if month_rows.num_rows == 0:
+            continue
+
+        year, month = input_file.stem.split('_')[-2:]
+        month_rows = month_rows.to_pandas(types_mapper=NULLABLE_PANDAS_TYPES.get)
+        month_rows.insert(0, 'date', f"{year}-{month}")
+        results.append(month_rows)
+
+    if len(results) == 0:
+        return DataFrame(columns=['date', *(columns or [])])
+
+    return pd.concat(results, ignore_index=True)
+
+
+def _lookup_dataset(domains: pa.Array, months: Iterable[str] | None, dataset_dir: str | Path,
+                    columns: List[str] | None) -> DataFrame:
+    """Look the domains up in the NEL dataset - only the domain buckets of the domains (in the months) are read"""
+    dataset = open_nel_dataset(dataset_dir)
+
+    dataset_filter = domain_filter(dataset, domains.to_pylist())
+    if months is not None:
+        dataset_filter = dataset_filter & month_filter(months)
+
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name not in NEL_DATASET_PARTITIONING.schema.names]
+
+    result = dataset.to_table(columns=[MONTH_PARTITION_KEY, *columns], filter=dataset_filter)
+    result = result.to_pandas(types_mapper=NULLABLE_PANDAS_TYPES.get).rename(columns={MONTH_PARTITION_KEY: 'date'})
+
+    return result.sort_values(by='date', kind='stable', ignore_index=True)
+
+
+def _lookup_month(input_file: Path, domains: pa.Array, columns: List[str] | None) -> pa.Table:
+    with pq.ParquetFile(input_file) as parquet:
+        row_groups = _matching_row_groups(parquet.metadata, domains.to_numpy(zero_copy_only=False))
+        read_columns = None if columns is None else list(dict.fromkeys(['url_domain', *columns]))
+
+        month_rows = parquet.read_row_groups(row_groups, columns=read_columns)
+
+    month_rows = month_rows.filter(pc.is_in(pc.cast(month_rows['url_domain'], pa.string()), value_set=domains))
+    return month_rows if columns is None else month_rows.select(columns)
+
+
+def _matching_row_groups(metadata: pq.FileMetaData, sorted_domains: np.ndarray) -> List[int]:
+    """Row groups whose url_domain value range contains at least one of the (sorted) domains"""
+    url_domain_idx = [metadata.schema.column(column).path for column in range(metadata.num_columns)].index('url_domain')
+
+    row_groups = []
+    for row_group in range(metadata.num_row_groups):
+        statistics = metadata.row_group(row_group).column(url_domain_idx).statistics
+        if statistics is None or not statistics.has_min_max:
+            row_groups.append(row_group)
+            continue
+
+        first_candidate = np.searchsorted(sorted_domains, statistics.min, side='left')
+        if first_candidate < len(sorted_domains) and sorted_domains[first_candidate] <= statistics.max:
+            row_groups.append(row_group)
+
+    return row_groups
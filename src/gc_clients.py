@@ -0,0 +1,48 @@
+"""
+Interfaces of the Google Cloud clients used by query_and_store - only the methods the script calls.
+
+Implemented by the Google Cloud clients (google.cloud.bigquery.Client, google.cloud.storage.Client) and by the offline
+emulator (LocalBigQueryClient, LocalStorageClient).
+"""
+
+from typing import Any, Iterable, Protocol
+
+
+class BigQueryJob(Protocol):
+
+    def result(self) -> Any: ...
+
+
+class BigQueryClient(Protocol):
+    project: str
+
+    def create_dataset(self, dataset: Any, timeout: float | None = None) -> Any: ...
+
+    def create_table(self, table: Any) -> Any: ...
+
+    def delete_table(self, table: Any, not_found_ok: bool = False) -> None: ...
+
+    def query_and_wait(self, query: str, job_config: Any = None) -> Any: ...
+
+    def extract_table(self, source: Any, destination_uris: str, location: str | None = None,
+                      job_config: Any = None) -> BigQueryJob: ...
+
+
+class StorageBlob(Protocol):
+    name: str
+    size: int | None
+    md5_hash: str | None
+
+    def download_to_filename(self, filename: str) -> None: ...
+
+    def delete(self) -> None: ...
+
+
+class StorageBucket(Protocol):
+
+    def list_blobs(self, prefix: str | None = None) -> Iterable[StorageBlob]: ...
+
+
+class StorageClient(Protocol):
+
+    def get_bucket(self, bucket_name: str) -> StorageBucket: ...
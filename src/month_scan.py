@@ -0,0 +1,489 @@
+"""
+Single-pass scan engine for the monthly NEL data files.
+
+Each metric computed in nel_analysis only needs a handful of columns from a month data file. Instead of letting every
+metric re-open and decode the same (multi-GB) file on its own, the engine reads the union of the columns required by all
+registered metrics exactly once - batch by batch - and hands every batch over to each metric's accumulator.
+"""
+
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame
+from pandas.api.types import union_categoricals
+
+from src.nel_dataset import open_month
+
+SCAN_BATCH_SIZE = 1_000_000
+
+# Memory the streaming aggregations may use for their partial results before spilling them to disk
+AGGREGATION_MEMORY_BUDGET = 2 ** 28  # 256 MiB
+AGGREGATION_SPILL_PARTITIONS = 16
+AGGREGATION_RESULT_BATCH_ROWS = 64 * 1024  # Rows of each sorted partition read at once while merging the result
+
+# Numeric & bool columns of the v2 data schema (see data_schemas) may contain nulls - keep them as nullable pandas types
+# (instead of floats & objects)
+NULLABLE_PANDAS_TYPES = {
+    pa.uint16(): pd.UInt16Dtype(),
+    pa.uint32(): pd.UInt32Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+}
+
+
+class MetricAccumulator(ABC):
+    """
+    Accumulates partial results of a single metric while a month data file is being scanned.
+
+    Lifecycle: consume() is called for every batch of the scanned file, finalize() once after the scan is done
+    and save() to persist the final result.
+    """
+
+    # Name of the metric & version of its implementation (bump the version whenever the metric's results change)
+    name: str = ""
+    version: int = 1
+
+    # Month data file columns required by the metric
+    columns: List[str] = []
+
+    # Files the metric saves its results into (relative to the output directory, "{date}" = the analyzed month)
+    output_files: List[str] = []
+
+    @abstractmethod
+    def consume(self, batch: DataFrame):
+        """
+        Update partial results with a batch of rows
+
+        :param batch: Batch of the month data file rows (contains only the columns listed in `columns`)
+        """
+
+    @abstractmethod
+    def finalize(self):
+        """Compute the final metric result from the partial results (called once after the scan is finished)"""
+
+    @abstractmethod
+    def save(self, output_dir: str):
+        """Persist the final metric result into the output directory"""
+
+
+class DomainMetric(ABC):
+    """
+    Metric computed from the month's domain table - the first values of the domain-level columns for each url_domain
+    (see FirstValuesPerDomain). The domain table is built once per month and shared by all the domain metrics.
+    """
+
+    name: str = ""
+    version: int = 1
+
+    # Domain table columns required by the metric (the table is indexed by url_domain)
+    columns: List[str] = []
+
+    # Files the metric saves its results into (relative to the output directory, "{date}" = the analyzed month)
+    output_files: List[str] = []
+
+    @abstractmethod
+    def compute(self, domain_table: DataFrame):
+        """
+        Compute the metric result
+
+        :param domain_table: Domain table of the month (contains at least the columns listed in `columns`)
+        """
+
+    @abstractmethod
+    def save(self, output_dir: str):
+        """Persist the final metric result into the output directory"""
+
+
+class FirstValuesPerDomain(object):
+    """
+    Streaming equivalent of `data.groupby('url_domain').first()`.
+
+    Keeps the first non-null value of every column for each url_domain. Domains are kept in the order in which they
+    first appear in the scanned data.
+    """
+
+    def __init__(self, columns: List[str]):
+        self._columns = columns
+        self._partials: List[DataFrame] = []
+
+    def update(self, batch: DataFrame):
+        if batch.empty:
+            return
+
+        partial = batch.groupby('url_domain', observed=True, sort=False)[self._columns].first()
+        self._partials.append(partial)
+
+    def result(self) -> DataFrame:
+        if len(self._partials) == 0:
+            return DataFrame(columns=self._columns, index=pd.Index([], name='url_domain'))
+
+        if len(self._partials) == 1:
+            return self._partials[0]
+
+        # Categories differ between batches - unify them only once the per-batch partials are merged (in the order in
+        # which they first appear, the same categories the whole file would be read with)
+        index_categories = None
+        if isinstance(self._partials[0].index, pd.CategoricalIndex):
+            index_categories = union_categories([partial.index.categories for partial in self._partials])
+        column_categories = {
+            column: union_categories([partial[column].cat.categories for partial in self._partials])
+            for column in self._columns if isinstance(self._partials[0][column].dtype, pd.CategoricalDtype)
+        }
+
+        partials = [_decategorize(partial) for partial in self._partials]
+        result = pd.concat(partials).groupby(level=0, sort=False).first()
+
+        if index_categories is not None:
+            result.index = pd.CategoricalIndex(result.index, categories=index_categories)
+        result.index.name = 'url_domain'
+
+        for column, categories in column_categories.items():
+            result[column] = pd.Categorical(result[column], categories=categories)
+
+        return result
+
+
+class StreamingGroupCount(object):
+    """
+    Streaming equivalent of `data.groupby(key_columns).size()` with bounded memory.
+
+    Partial counts of the batches (a row per distinct key of the batch) are merged into a single running table, which
+    is hash-partitioned by its key values & spilled to disk whenever it exceeds the memory budget. The keys are kept
+    dictionary-coded (categoricals of the values in the table) in memory & in the spill files. All the state kept in
+    memory between the batches (the running table & the pending partial counts) is counted against the budget.
+
+    Once the scan is done, the spilled partitions are merged & sorted one at a time and the sorted partitions are
+    merged into the result batch by batch (see result_batches) - only a single partition (about 1/spill_partitions
+    of the groups) is held in memory at once.
+
+    Rows with a null value in any of the key columns are not counted (same as groupby(dropna=True)). Key columns with
+    the same categories in every batch are returned as categoricals, the others as plain values - the same as grouping
+    the concatenated per-batch counts. The result is sorted by the keys (categoricals by the order of their categories).
+    """
+
+    def __init__(self, key_columns: List[str], count_column: str, memory_budget: int = AGGREGATION_MEMORY_BUDGET,
+                 spill_partitions: int = AGGREGATION_SPILL_PARTITIONS, spill_dir: str | None = None,
+                 category_columns: List[str] | None = None):
+        """
+        :param key_columns: Columns to group by
+        :param count_column: Name of the column with the group sizes in the result
+        :param memory_budget: Bytes the partial counts may take before being spilled to disk
+        :param spill_partitions: Number of partitions the spilled partial counts are split into
+        :param spill_dir: Directory to spill the partial counts into (system temp directory by default)
+        :param category_columns: Key columns returned as categoricals in any case (of all their values, sorted, unless
+                                 the column has the same categories in every batch) - for the low-cardinality keys
+        """
+        self._key_columns = key_columns
+        self._count_column = count_column
+        self._memory_budget = memory_budget
+        self._spill_partitions = spill_partitions
+        self._spill_dir = spill_dir
+        self._category_columns = category_columns or []
+
+        self._running: DataFrame | None = None
+        self._running_bytes = 0
+        self._pending: List[DataFrame] = []
+        self._pending_bytes = 0
+
+        self._spill_path: Path | None = None
+        self._spill_count = 0
+
+        # Categories of each key column (None once the column has different categories in some of the batches)
+        self._key_categories: Dict[str, pd.CategoricalDtype | None] | None = None
+
+    def update(self, batch: DataFrame):
+        if batch.empty:
+            return
+
+        partial = batch.groupby(self._key_columns, observed=True, sort=False).size()
+
+        if self._key_categories is None:
+            self._key_categories = {column: batch[column].dtype if isinstance(batch[column].dtype, pd.CategoricalDtype)
+                                    else None for column in self._key_columns}
+        elif not partial.empty:
+            for column, dtype in self._key_categories.items():
+                if dtype is not None and batch[column].dtype != dtype:
+                    self._key_categories[column] = None
+
+        if partial.empty:
+            return
+
+        # Only the categories of the batch's keys are kept
+        partial = _remove_unused_categories(partial.rename(self._count_column).reset_index())
+
+        self._pending.append(partial)
+        self._pending_bytes += _memory_usage(partial)
+
+        if self._running_bytes + self._pending_bytes > self._memory_budget:
+            self._compact()
+
+            if self._running_bytes > self._memory_budget // 2:
+                self._spill()
+
+    def result(self) -> DataFrame:
+        """The whole result at once (see result_batches to get it batch by batch)"""
+        batches = list(self.result_batches())
+        if len(batches) == 0:
+            return DataFrame(columns=[*self._key_columns, self._count_column]).astype({self._count_column: np.int64})
+
+        return pd.concat(batches, ignore_index=True)
+
+    def result_batches(self, batch_rows: int = AGGREGATION_RESULT_BATCH_ROWS) -> Iterator[DataFrame]:
+        """
+        The result in batches of consecutive (sorted) rows - the partitions are merged & sorted one at a time and the
+        sorted partitions are merged batch by batch (at most `batch_rows` rows of each partition are read at once)
+        """
+        self._compact()
+        key_categories = self._key_categories or {column: None for column in self._key_columns}
+        category_values: Dict[str, List[pd.Index]] = {
+            column: [] for column in self._category_columns if key_categories[column] is None
+        }
+
+        try:
+            if self._spill_path is None:
+                partitions = [self._running] if self._running is not None else []
+                self._running, self._running_bytes = None, 0
+
+                sorted_partitions = [_frame_batches(self._sorted_partition(partition, key_categories, category_values),
+                                                    batch_rows) for partition in partitions]
+            else:
+                self._spill()
+
+                sorted_partitions = []
+                for partition in range(self._spill_partitions):
+                    sorted_partition = self._sorted_partition(self._read_spilled_partition(partition), key_categories,
+                                                              category_values)
+                    sorted_partition_file = self._spill_path / f"sorted_{partition}.parquet"
+                    pq.write_table(pa.Table.from_pandas(sorted_partition, preserve_index=False), sorted_partition_file)
+                    sorted_partitions.append(_parquet_batches(sorted_partition_file, batch_rows))
+
+            categories = {column: union_categories(values).sort_values() for column, values in category_values.items()}
+
+            for batch in self._merge_sorted_partitions(sorted_partitions):
+                for column, dtype in key_categories.items():
+                    if dtype is not None:
+                        batch[column] = pd.Categorical.from_codes(batch[column], dtype=dtype)
+                    elif column in categories:
+                        batch[column] = pd.Categorical(batch[column], categories=categories[column])
+
+                yield batch
+        finally:
+            if self._spill_path is not None:
+                shutil.rmtree(self._spill_path, ignore_errors=True)
+                self._spill_path = None
+
+    def _compact(self):
+        """Merge the pending partial counts into the running table"""
+        if len(self._pending) == 0:
+            return
+
+        partials = ([self._running] if self._running is not None else []) + self._pending
+        self._running = self._merge(partials)
+        self._running_bytes = _memory_usage(self._running)
+
+        self._pending = []
+        self._pending_bytes = 0
+
+    def _merge(self, partials: List[DataFrame]) -> DataFrame:
+        merged = _concat_dictionary_coded(partials) \
+            .groupby(self._key_columns, observed=True, sort=False, as_index=False)[self._count_column].sum()
+
+        return _remove_unused_categories(merged)
+
+    def _spill(self):
+        """Hash-partition the running table by its keys & append the partitions to the spill files"""
+        if self._spill_path is None:
+            self._spill_path = Path(tempfile.mkdtemp(prefix="nel_group_count_", dir=self._spill_dir))
+
+        if self._running is not None:
+            partitions = _hash_partition(self._running[self._key_columns], self._spill_partitions)
+
+            for partition in range(self._spill_partitions):
+                partition_counts = _remove_unused_categories(self._running[partitions == partition])
+                table = pa.Table.from_pandas(partition_counts, preserve_index=False)
+                pq.write_table(table, self._spill_path / f"partition_{partition}_{self._spill_count}.parquet")
+
+            self._spill_count += 1
+
+        self._running, self._running_bytes = None, 0
+
+    def _read_spilled_partition(self, partition: int) -> DataFrame:
+        partition_counts = [
+            pq.read_table(self._spill_path / f"partition_{partition}_{spill_idx}.parquet")
+            .to_pandas(types_mapper=NULLABLE_PANDAS_TYPES.get)
+            for spill_idx in range(self._spill_count)
+        ]
+
+        return self._merge(partition_counts)
+
+    def _sorted_partition(self, partition: DataFrame, key_categories: Dict[str, pd.CategoricalDtype | None],
+                          category_values: Dict[str, List[pd.Index]]) -> DataFrame:
+        """
+        Sort a merged partition by the keys - the keys with the same categories in every batch are turned into their
+        codes in those categories (sorted by the codes), the others into plain values
+        """
+        partition = partition.copy()
+
+        for column, dtype in key_categories.items():
+            if dtype is not None:
+                partition[column] = pd.Categorical(partition[column], dtype=dtype).codes.astype(np.int64)
+            elif isinstance(partition[column].dtype, pd.CategoricalDtype):
+                partition[column] = partition[column].astype(partition[column].cat.categories.dtype)
+
+            if column in category_values:
+                category_values[column].append(pd.Index(partition[column].unique()))
+
+        partition.sort_values(by=self._key_columns, inplace=True, ignore_index=True)
+
+        return partition
+
+    def _merge_sorted_partitions(self, sorted_partitions: List[Iterator[DataFrame]]) -> Iterator[DataFrame]:
+        """Merge the batches of the sorted partitions into batches of the sorted result (every key is unique)"""
+        buffers: List[DataFrame | None] = [None] * len(sorted_partitions)
+
+        while True:
+            # Refill the empty buffers (exhausted partitions are dropped)
+            for partition, batches in enumerate(sorted_partitions):
+                while batches is not None and (buffers[partition] is None or buffers[partition].empty):
+                    buffers[partition] = next(batches, None)
+                    if buffers[partition] is None:
+                        sorted_partitions[partition] = batches = None
+
+            if all(buffer is None or buffer.empty for buffer in buffers):
+                break
+
+            # Every row up to the smallest last key of the buffers of the unfinished partitions can be returned - all
+            # the rows still to be read from the partitions are greater than it
+            unfinished_last_keys = [tuple(buffer[self._key_columns].iloc[-1])
+                                    for partition, buffer in enumerate(buffers)
+                                    if sorted_partitions[partition] is not None and not buffer.empty]
+            watermark = min(unfinished_last_keys) if len(unfinished_last_keys) > 0 else None
+
+            ready = []
+            for partition, buffer in enumerate(buffers):
+                if buffer is None or buffer.empty:
+                    continue
+
+                ready_rows = len(buffer) if watermark is None else _rows_up_to(buffer[self._key_columns], watermark)
+                ready.append(buffer.iloc[:ready_rows])
+                buffers[partition] = buffer.iloc[ready_rows:]
+
+            yield pd.concat(ready, ignore_index=True).sort_values(by=self._key_columns, ignore_index=True)
+
+
+def _concat_dictionary_coded(frames: List[DataFrame]) -> DataFrame:
+    """Concatenate the frames - the columns categorical in all of them stay categorical (of all their categories)"""
+    if len(frames) == 1:
+        return frames[0]
+
+    columns = {}
+    for column in frames[0].columns:
+        values = [frame[column] for frame in frames]
+        if all(isinstance(column_values.dtype, pd.CategoricalDtype) for column_values in values):
+            columns[column] = union_categoricals(values)
+        else:
+            columns[column] = pd.concat(values, ignore_index=True)
+
+    return DataFrame(columns)
+
+
+def _remove_unused_categories(data: DataFrame) -> DataFrame:
+    data = data.copy()
+
+    for column in data.columns:
+        if isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].cat.remove_unused_categories()
+
+    return data
+
+
+def _rows_up_to(keys: DataFrame, watermark: tuple) -> int:
+    """Number of the (sorted) keys lower or equal to the watermark key"""
+    less = np.zeros(len(keys), dtype=bool)
+    equal = np.ones(len(keys), dtype=bool)
+
+    for column, watermark_value in zip(keys.columns, watermark):
+        values = keys[column].to_numpy()
+        less |= equal & (values < watermark_value)
+        equal &= values == watermark_value
+
+    return int((less | equal).sum())
+
+
+def _frame_batches(data: DataFrame, batch_rows: int) -> Iterator[DataFrame]:
+    for batch_start in range(0, len(data), batch_rows):
+        yield data.iloc[batch_start:batch_start + batch_rows].reset_index(drop=True)
+
+
+def _parquet_batches(file_path: Path, batch_rows: int) -> Iterator[DataFrame]:
+    with pq.ParquetFile(file_path) as parquet:
+        for batch in parquet.iter_batches(batch_size=batch_rows):
+            yield batch.to_pandas(types_mapper=NULLABLE_PANDAS_TYPES.get)
+
+
+def _hash_partition(keys: DataFrame, partitions: int) -> np.ndarray:
+    """Spread the keys evenly over the partitions (the same key values always go to the same partition)"""
+    hashed = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    return (hashed % np.uint64(partitions)).astype(np.int64)
+
+
+def _memory_usage(data: DataFrame) -> int:
+    return int(data.memory_usage(index=True, deep=True).sum())
+
+
+def scan_month(input_file: Path, accumulators: List[MetricAccumulator], batch_size: int = SCAN_BATCH_SIZE):
+    """
+    Read the month data file once and feed every batch of it to all the accumulators provided.
+    The accumulators are finalized after the scan.
+
+    :param input_file: Month data file (or a month partition directory of the NEL dataset) to scan
+    :param accumulators: Metric accumulators to feed with the scanned data
+    :param batch_size: Maximum number of rows decoded at once
+    """
+    columns = list(dict.fromkeys(column for accumulator in accumulators for column in accumulator.columns))
+
+    if Path(input_file).is_dir():
+        # Month partition of the NEL dataset - read the domain buckets one by one, in order
+        batches = open_month(Path(input_file)).to_batches(columns=columns, batch_size=batch_size, batch_readahead=1,
+                                                     fragment_readahead=1)
+    else:
+        batches = pq.ParquetFile(input_file).iter_batches(batch_size=batch_size, columns=columns)
+
+    for batch in batches:
+        data = batch.to_pandas(types_mapper=NULLABLE_PANDAS_TYPES.get)
+
+        for accumulator in accumulators:
+            accumulator.consume(data[accumulator.columns])
+
+        del data
+
+    for accumulator in accumulators:
+        accumulator.finalize()
+
+
+def union_categories(categories: List[pd.Index]) -> pd.Index:
+    """Categories of the batches merged in the order in which they first appear"""
+    if len(categories) == 0:
+        return pd.Index([])
+
+    return categories[0].append(categories[1:]).unique()
+
+
+def _decategorize(data: DataFrame) -> DataFrame:
+    """Turn categorical index & columns into plain object ones so that data from different batches can be merged"""
+    data = data.copy()
+
+    if isinstance(data.index, pd.CategoricalIndex):
+        data.index = data.index.astype(object)
+
+    for column in data.columns:
+        if isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype(object)
+
+    return data
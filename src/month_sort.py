@@ -0,0 +1,174 @@
+"""
+Month data files sorted by url_domain.
+
+Sorted files keep the rows of a domain together in a few row groups. The url_domain min/max statistics of the row
+groups then tell which row groups a domain can be in (see domain_lookup) - no full scan is needed.
+
+A month does not fit in memory as a whole. Every downloaded blob is sorted on its own (a sorted run) and the runs
+are merged afterwards, holding only a batch of each run in memory at a time.
+
+A sorted run can be split into segments - files of consecutive rows of the run in a run directory (see
+write_sorted_run). The segments merged already can be removed during the merge, so the disk does not hold the sorted
+runs and the whole merged file at once.
+"""
+
+import shutil
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Iterator, List
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Rows per row group of a sorted month data file - smaller row groups make the lookups more selective
+DOMAIN_SORTED_ROW_GROUP_SIZE = 128 * 1024
+
+# Rows read from each sorted run at once while the runs are merged
+SORTED_RUN_BATCH_SIZE = 16 * 1024
+
+# Rows per segment of a sorted run - the disk holds at most a segment of each run more than the month while merging
+SORTED_RUN_SEGMENT_ROWS = 4 * SORTED_RUN_BATCH_SIZE
+
+# Sorts after every (IDNA-encoded) domain name - rows without url_domain end up at the end of a file
+_NULL_DOMAIN_KEY = "\uffff"
+
+
+def sort_by_domain(table: pa.Table) -> pa.Table:
+    """Sort month data by url_domain (rows without url_domain go last)"""
+    return table.take(pc.sort_indices(_domain_keys(table)))
+
+
+def write_sorted_run(table: pa.Table, run_dir: str | Path, segment_rows: int = SORTED_RUN_SEGMENT_ROWS):
+    """
+    Write month data sorted by url_domain into a sorted run directory - a segment file per `segment_rows` rows
+    (the schema metadata of the table is stored in the footer of the first segment, see sorted_run_segments)
+    """
+    run_dir = Path(run_dir)
+    run_dir.mkdir()
+
+    for segment_idx, segment_start in enumerate(range(0, max(table.num_rows, 1), segment_rows)):
+        segment = table.slice(segment_start, segment_rows)
+        if segment_idx > 0:
+            segment = segment.replace_schema_metadata(None)
+
+        pq.write_table(segment, run_dir / f"segment_{segment_idx:06}.parquet")
+
+
+def sorted_run_segments(run: str | Path) -> List[Path]:
+    """Files of a sorted run in the order of its rows (a sorted run directory or a single sorted month data file)"""
+    run = Path(run)
+    return sorted(run.glob("segment_*.parquet")) if run.is_dir() else [run]
+
+
+def merge_sorted_runs(runs: List[Path], output_file: str | Path, schema: pa.Schema,
+                      row_group_size: int = DOMAIN_SORTED_ROW_GROUP_SIZE,
+                      batch_size: int = SORTED_RUN_BATCH_SIZE, compression: str = "snappy",
+                      remove_merged: bool = False):
+    """
+    Merge month data files sorted by url_domain (see sort_by_domain) into a single sorted month data file
+
+    :param runs: Sorted month data files (or sorted run directories) to merge
+    :param output_file: The resulting month data file
+    :param schema: Schema of the resulting file (incl. the metadata to store in its footer)
+    :param row_group_size: Rows per row group of the resulting file
+    :param batch_size: Rows read from each run at once
+    :param compression: Compression codec of the resulting file
+    :param remove_merged: Remove every segment of the runs as soon as all of its rows are read (and the runs once
+                          merged)
+    """
+    with ExitStack() as stack:
+        writer = stack.enter_context(_RowGroupWriter(output_file, schema, row_group_size, compression))
+
+        run_batches = [_sorted_run_batches(run, batch_size, remove_merged) for run in runs]
+        for batches in run_batches:
+            stack.callback(batches.close)
+
+        buffers: List[pa.Table | None] = [None] * len(runs)
+
+        while True:
+            # Refill the empty buffers (exhausted runs are dropped)
+            for run_idx, batches in enumerate(run_batches):
+                while batches is not None and (buffers[run_idx] is None or buffers[run_idx].num_rows == 0):
+                    batch = next(batches, None)
+                    if batch is None:
+                        run_batches[run_idx] = batches = None
+                    else:
+                        buffers[run_idx] = pa.Table.from_batches([batch]).cast(schema)
+
+            active_buffers = [buffer for buffer in buffers if buffer is not None and buffer.num_rows > 0]
+            if len(active_buffers) == 0:
+                break
+
+            # Every row up to the smallest last key of the buffers of the unfinished runs can be written - all the
+            # rows still to be read from the runs are greater or equal to it
+            unfinished_last_keys = [_domain_keys(buffer)[-1].as_py() for run_idx, buffer in enumerate(buffers)
+                                    if run_batches[run_idx] is not None and buffer.num_rows > 0]
+            watermark = min(unfinished_last_keys) if len(unfinished_last_keys) > 0 else None
+
+            ready = []
+            for run_idx, buffer in enumerate(buffers):
+                if buffer is None or buffer.num_rows == 0:
+                    continue
+
+                ready_rows = buffer.num_rows if watermark is None else \
+                    pc.sum(pc.less_equal(_domain_keys(buffer), watermark)).as_py() or 0
+                ready.append(buffer.slice(0, ready_rows))
+                buffers[run_idx] = buffer.slice(ready_rows)
+
+            writer.write(sort_by_domain(pa.concat_tables(ready)))
+
+    if remove_merged:
+        for run in map(Path, runs):
+            if run.is_dir():
+                shutil.rmtree(run)
+            else:
+                run.unlink(missing_ok=True)
+
+
+def _sorted_run_batches(run: Path, batch_size: int, remove_merged: bool) -> Iterator[pa.RecordBatch]:
+    for segment in sorted_run_segments(run):
+        with pq.ParquetFile(segment) as segment_file:
+            yield from segment_file.iter_batches(batch_size=batch_size)
+
+        if remove_merged:
+            segment.unlink()
+
+
+def _domain_keys(table: pa.Table) -> pa.ChunkedArray:
+    return pc.fill_null(pc.cast(table['url_domain'], pa.string()), _NULL_DOMAIN_KEY)
+
+
+class _RowGroupWriter(object):
+    """Parquet writer producing row groups of the same size regardless of the sizes of the written tables"""
+
+    def __init__(self, output_file: str | Path, schema: pa.Schema, row_group_size: int, compression: str = "snappy"):
+        self._writer = pq.ParquetWriter(output_file, schema=schema, compression=compression)
+        self._row_group_size = row_group_size
+
+        self._pending: List[pa.Table] = []
+        self._pending_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write(self, table: pa.Table):
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+
+        if self._pending_rows >= self._row_group_size:
+            pending = pa.concat_tables(self._pending)
+            full_row_groups_rows = pending.num_rows - pending.num_rows % self._row_group_size
+
+            self._writer.write_table(pending.slice(0, full_row_groups_rows), row_group_size=self._row_group_size)
+            self._pending = [pending.slice(full_row_groups_rows)]
+            self._pending_rows = self._pending[0].num_rows
+
+    def close(self):
+        if self._pending_rows > 0:
+            self._writer.write_table(pa.concat_tables(self._pending), row_group_size=self._row_group_size)
+
+        self._writer.close()
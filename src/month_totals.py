@@ -0,0 +1,126 @@
+"""
+Month totals (total crawled resources, domains, ...) kept in the key-value metadata of the month data file's footer.
+
+The totals have the same value in every row of a month data file. Storing them in the footer as well lets the analysis
+read them without decoding any row data.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Dict, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame
+
+from src.month_scan import NULLABLE_PANDAS_TYPES
+from src.nel_dataset import month_data_files, month_date, month_partition_dirs
+
+MONTH_TOTALS_METADATA_KEY = b"nel_month_totals"
+
+MONTH_TOTALS_COLUMNS = [
+    'total_crawled_resources',
+    'total_crawled_domains',
+    'total_crawled_resources_with_nel',
+    'total_crawled_domains_with_nel',
+    'total_crawled_resources_with_correct_nel',
+    'total_crawled_domains_with_correct_nel',
+]
+
+
+def month_totals_from_table(table: pa.Table) -> Dict[str, int | None] | None:
+    """
+    Get the month totals from the first row of a month data table
+
+    :return: Month totals cast to integers - the v1 schema stores them as (dictionary encoded) strings
+             (None if the table has no rows or some of the totals columns)
+    """
+    if table.num_rows == 0 or not set(MONTH_TOTALS_COLUMNS).issubset(table.column_names):
+        return None
+
+    return {column: _to_int(table.column(column)[0].as_py()) for column in MONTH_TOTALS_COLUMNS}
+
+
+def with_month_totals(schema: pa.Schema, month_totals: Dict[str, int | None] | None) -> pa.Schema:
+    """Add the month totals to the schema's metadata (written into the footer of a Parquet file)"""
+    if month_totals is None:
+        return schema
+
+    return schema.with_metadata({
+        **(schema.metadata or {}),
+        MONTH_TOTALS_METADATA_KEY: json.dumps(month_totals).encode("utf-8"),
+    })
+
+
+def read_month_totals(input_file: str | Path) -> DataFrame | None:
+    """
+    Read the month totals from the footer of a month data file or a month partition (no row data is read)
+
+    :return: Single row data frame with the month totals typed the same as when read from the row data
+             (None if the file has no month totals in its footer)
+    """
+    footer = _read_footer_month_totals(Path(input_file))
+    if footer is None:
+        return None
+
+    parquet_schema, month_totals = footer
+
+    return pa.table({
+        column: pa.array([_as_column_value(month_totals[column], parquet_schema.field(column).type)],
+                         type=parquet_schema.field(column).type)
+        for column in MONTH_TOTALS_COLUMNS
+    }).to_pandas(types_mapper=NULLABLE_PANDAS_TYPES.get)
+
+
+def read_all_month_totals(nel_data_dir: str | Path) -> DataFrame:
+    """
+    Read the month totals of all the months in a directory from the footers of their data files alone
+    (the month data files nel_data_YYYY_MM.parquet or the month partitions of a NEL dataset)
+
+    :return: Data frame with a row per month (date & the month totals as integers) ordered by the date
+             (months without the month totals in their footer are left out)
+    """
+    input_files = month_partition_dirs(nel_data_dir) or sorted(Path(nel_data_dir).glob("nel_data_*.parquet"))
+
+    rows = []
+    for input_file in input_files:
+        footer = _read_footer_month_totals(input_file)
+        if footer is not None:
+            rows.append({"date": month_date(input_file), **footer[1]})
+
+    return pa.Table.from_pylist(rows, schema=pa.schema(
+        [("date", pa.string())] + [(column, pa.int64()) for column in MONTH_TOTALS_COLUMNS]
+    )).to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get).sort_values("date", ignore_index=True)
+
+
+def _read_footer_month_totals(input_file: Path) -> Tuple[pa.Schema, Dict[str, int | None]] | None:
+    """Parquet schema of the month data file (or partition) & its month totals (None if not in the footer)"""
+    data_files = month_data_files(input_file)
+    if len(data_files) == 0:
+        return None
+
+    # Every data file of a month partition has the same footer
+    parquet_schema = pq.read_schema(data_files[0])
+    month_totals = (parquet_schema.metadata or {}).get(MONTH_TOTALS_METADATA_KEY)
+    if month_totals is None:
+        return None
+
+    # Files written before the totals were cast to integers hold the v1 totals as strings
+    month_totals = json.loads(month_totals)
+    return parquet_schema, {column: _to_int(month_totals[column]) for column in MONTH_TOTALS_COLUMNS}
+
+
+def _as_column_value(total: int | None, column_type: pa.DataType) -> int | str | None:
+    """A month total typed as its column (the v1 schema stores the totals as dictionary encoded strings)"""
+    value_type = column_type.value_type if pa.types.is_dictionary(column_type) else column_type
+    if total is None or not pa.types.is_string(value_type):
+        return total
+
+    return str(total)
+
+
+def _to_int(total: int | str | None) -> int | None:
+    return int(total) if total is not None else None
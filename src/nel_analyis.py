@@ -1,17 +1,25 @@
+from __future__ import annotations
+
 import gc
+import json
 import os
 from io import StringIO
+from typing import Dict, List
 
 import numpy as np
 import pandas as pd
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 from pandas import DataFrame, Series
 from pathlib import Path
 
-from src import psl_utils, metric_utils
-
-RESOURCE_BATCH_SIZE = 50_000_000
+from src import metric_utils
+from src.month_totals import MONTH_TOTALS_COLUMNS, read_month_totals
+from src.nel_dataset import month_data_files, open_month
+from src.classes.PslResolver import PslResolver
+from src.month_scan import MetricAccumulator, DomainMetric, FirstValuesPerDomain, StreamingGroupCount, scan_month, \
+    AGGREGATION_MEMORY_BUDGET, union_categories
 
 """
 METRIC LEGEND: (see docs/data-contract)
@@ -20,389 +28,717 @@ METRIC LEGEND: (see docs/data-contract)
     cX (bY) = custom metric number X - fulfills Y from base metric b
 """
 
+NEL_DEPLOYMENT_COLUMNS = MONTH_TOTALS_COLUMNS
+
+NEL_CONFIG_COLUMNS = [
+    'nel_failure_fraction',
+    'nel_success_fraction',
+    'nel_include_subdomains',
+    'nel_max_age',
+]
+
+NEL_DOMAIN_RESOURCES_COLUMNS = [
+    'url_domain_hosted_resources',
+    'url_domain_hosted_resources_with_nel',
+    'url_domain_monitored_resources_ratio',
+]
+
+# Domain-level columns (same value for all the resources of a url_domain) kept in the per-month domain table
+DOMAIN_TABLE_COLUMNS = [
+    *NEL_DOMAIN_RESOURCES_COLUMNS,
+    *NEL_CONFIG_COLUMNS,
+    'rt_collectors',
+    'rt_collectors_registrable',
+]
+
+NEL_RESOURCE_CONFIG_COLUMNS = [
+    'url_domain',
+    'nel_include_subdomains',
+    'nel_failure_fraction',
+    'nel_success_fraction',
+    'nel_max_age',
+]
+
+
+def analyze_month(input_file: Path, date: str, aggregated_providers: np.ndarray,
+                  used_psl: StringIO | PslResolver | None, output_dir: str) -> np.ndarray:
+    """
+    Compute all the metrics for a single month data file while reading the file only once.
+
+    :param input_file: Month data file (or a month partition directory of the NEL dataset) to analyze
+    :param date: Month of the data (YYYY-MM)
+    :param aggregated_providers: Collector providers found in the previously analyzed months
+    :param used_psl: PSL (or the compiled PSL) to parse registrable collector domain names with
+                     (None = use pre-computed ones)
+    :param output_dir: Directory to save the metric results into
+    :return: All collector providers found so far (including the ones from this month)
+    """
+    collector_provider_usage = analyze_month_independent_metrics(input_file, date, used_psl, output_dir)
+
+    return save_collector_provider_usage(collector_provider_usage, aggregated_providers, output_dir)
 
-def nel_deployment(input_file: Path, date: str, output_dir: str):
+
+def analyze_month_independent_metrics(input_file: Path, date: str, used_psl: StringIO | PslResolver | None,
+                                      output_dir: str, metric_names: List[str] | None = None,
+                                      domain_table_dir: str | None = None) -> CollectorProviderUsageMetric | None:
+    """
+    Compute & save all the metrics that do not depend on the previously analyzed months (single pass over the file).
+
+    Domain metrics are computed from the month's domain table (see DomainTable) built during the same pass.
+    If a domain table directory is given, the domain table is saved there and reused by later runs - then the month
+    data file does not have to be scanned at all if only domain metrics are requested.
+
+    The collector provider usage metric needs the collector providers aggregated throughout the previous months.
+    Its month-specific part is computed here, but it is returned unsaved - see save_collector_provider_usage().
+    This makes it possible to analyze the months independently and in parallel.
+
+    :param input_file: Month data file (or a month partition directory of the NEL dataset) to analyze
+    :param date: Month of the data (YYYY-MM)
+    :param used_psl: PSL (or the compiled PSL) to parse registrable collector domain names with
+                     (None = use pre-computed ones)
+    :param output_dir: Directory to save the metric results into
+    :param metric_names: Names of the metrics to compute (see METRIC_VERSIONS). All of them by default
+    :param domain_table_dir: Directory to save & reuse the domain tables in (None = do not save them)
+    :return: Finalized, but not yet saved collector provider usage metric (None if it was not requested)
+    """
+    if metric_names is None:
+        metric_names = list(METRIC_VERSIONS.keys())
+
+    month_independent_metrics = [
+        metric_class(date) for metric_class in MONTH_INDEPENDENT_METRICS if metric_class.name in metric_names
+    ]
+    resource_metrics = [metric for metric in month_independent_metrics if isinstance(metric, MetricAccumulator)]
+    domain_metrics = [metric for metric in month_independent_metrics if isinstance(metric, DomainMetric)]
+
+    if CollectorProviderUsageMetric.name in metric_names:
+        collector_provider_usage = CollectorProviderUsageMetric(date, np.empty(0, dtype=str), used_psl)
+        domain_metrics.append(collector_provider_usage)
+    else:
+        collector_provider_usage = None
+
+    domain_table = None
+    domain_table_builder = None
+    if len(domain_metrics) > 0:
+        if domain_table_dir is not None:
+            domain_table = DomainTable.load(domain_table_dir, date, input_file)
+
+        required_columns = [column for metric in domain_metrics for column in metric.columns]
+        if domain_table is None or not set(required_columns).issubset(domain_table.columns):
+            domain_table = None
+            domain_table_builder = DomainTable(date, input_file)
+
+    # NEL deployment only needs the month totals - read them from the file's footer if they are there
+    scanned_metrics: List[MetricAccumulator] = [
+        metric for metric in resource_metrics
+        if not (isinstance(metric, NelDeploymentMetric) and metric.compute_from_month_totals(input_file))
+    ]
+    if domain_table_builder is not None:
+        scanned_metrics.append(domain_table_builder)
+
+    if len(scanned_metrics) > 0:
+        scan_month(input_file, scanned_metrics)
+
+    if domain_table_builder is not None:
+        domain_table = domain_table_builder.result
+        if domain_table_dir is not None:
+            domain_table_builder.save(domain_table_dir)
+
+    for metric in domain_metrics:
+        metric.compute(domain_table)
+
+    for metric in month_independent_metrics:
+        metric.save(output_dir)
+
+    return collector_provider_usage
+
+
+def save_collector_provider_usage(collector_provider_usage: CollectorProviderUsageMetric,
+                                  aggregated_providers: np.ndarray, output_dir: str) -> np.ndarray:
+    """
+    Save a finalized collector provider usage metric given the collector providers from the previous months
+
+    :return: All collector providers found so far (including the ones from the metric's month)
+    """
+    collector_provider_usage.aggregated_providers = aggregated_providers
+    collector_provider_usage.save(output_dir)
+
+    return collector_provider_usage.all_providers_so_far
+
+
+class DomainTable(MetricAccumulator):
+    """
+    Builds the month's domain table - the first values of the domain-level columns (DOMAIN_TABLE_COLUMNS) for each
+    url_domain. All the domain metrics are computed from this table, which is much smaller than the month data file.
+
+    The table can be saved & reused for the same (unchanged) month data file.
+    """
+
+    name = "domain_table"
+    version = 1
+
+    SOURCE_METADATA_KEY = b"nel_domain_table_source"
+
+    def __init__(self, date: str, input_file: Path):
+        self.date = date
+        self.input_file = input_file
+        self.result: DataFrame | None = None
+
+        # Not all the columns are available in every month data file (e.g. crawled data files)
+        available_columns = open_month(Path(input_file)).schema.names
+        domain_columns = [column for column in DOMAIN_TABLE_COLUMNS if column in available_columns]
+
+        self.columns = ['url_domain', *domain_columns]
+        self._domains = FirstValuesPerDomain(domain_columns)
+
+    def consume(self, batch: DataFrame):
+        self._domains.update(batch)
+
+    def finalize(self):
+        self.result = self._domains.result()
+        del self._domains
+
+    def save(self, output_dir: str):
+        """Save the domain table along with the identity of the month data file it was built from"""
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        table = pa.Table.from_pandas(self.result)
+        table = table.replace_schema_metadata({
+            **table.schema.metadata,
+            self.SOURCE_METADATA_KEY: json.dumps(self._source_identity(self.input_file)).encode("utf-8"),
+        })
+
+        pq.write_table(table, output_dir / f"{self.date}.parquet")
+
+    @staticmethod
+    def load(domain_table_dir: str, date: str, input_file: Path) -> DataFrame | None:
+        """
+        Load a saved domain table of a month
+
+        :return: The domain table (None if it was not saved yet or was built from a different month data file)
+        """
+        domain_table_file = Path(domain_table_dir) / f"{date}.parquet"
+        if not domain_table_file.is_file():
+            return None
+
+        metadata = pq.read_schema(domain_table_file).metadata or {}
+        source_identity = metadata.get(DomainTable.SOURCE_METADATA_KEY)
+        if source_identity is None or json.loads(source_identity) != DomainTable._source_identity(input_file):
+            return None
+
+        return pd.read_parquet(domain_table_file)
+
+    @staticmethod
+    def _source_identity(input_file: Path) -> dict:
+        data_file_stats = [data_file.stat() for data_file in month_data_files(Path(input_file))]
+        return {
+            "version": DomainTable.version,
+            "file": Path(input_file).name,
+            "size": sum(stat.st_size for stat in data_file_stats),
+            "mtime_ns": max((stat.st_mtime_ns for stat in data_file_stats), default=0),
+        }
+
+
+class NelDeploymentMetric(MetricAccumulator):
     """PREPARES DATA FOR: c2 (b1)"""
 
-    # Read only the first row of the month data file (necessary data is already precomputed)
-    parquet = pq.ParquetFile(input_file)
-    first_row = next(parquet.iter_batches(batch_size=1,
-                                          columns=[
-                                              'total_crawled_resources',
-                                              'total_crawled_domains',
-                                              'total_crawled_resources_with_nel',
-                                              'total_crawled_domains_with_nel',
-                                              'total_crawled_resources_with_correct_nel',
-                                              'total_crawled_domains_with_correct_nel']))
-    data = pa.Table.from_batches([first_row]).to_pandas()
-
-    if len(data) == 0:
-        return
+    name = "nel_deployment"
+    version = 1
+    columns = NEL_DEPLOYMENT_COLUMNS
+    output_files = ["nel_deployment/{date}.parquet"]
 
-    total_crawled_resources = data['total_crawled_resources'][0]
-    total_crawled_domains = data['total_crawled_domains'][0]
-    total_crawled_resources_with_nel = data['total_crawled_resources_with_nel'][0]
-    total_crawled_domains_with_nel = data['total_crawled_domains_with_nel'][0]
-    total_crawled_resources_with_correct_nel = data['total_crawled_resources_with_correct_nel'][0]
-    total_crawled_domains_with_correct_nel = data['total_crawled_domains_with_correct_nel'][0]
-
-    result = DataFrame({
-        "date": [date],
-        "total_crawled_resources": [total_crawled_resources],
-        "total_crawled_domains": [total_crawled_domains],
-        "total_crawled_resources_with_nel": [total_crawled_resources_with_nel],
-        "total_crawled_domains_with_nel": [total_crawled_domains_with_nel],
-        "total_crawled_resources_with_correct_nel": [total_crawled_resources_with_correct_nel],
-        "total_crawled_domains_with_correct_nel": [total_crawled_domains_with_correct_nel],
-    }).reset_index(drop=True)
-
-    del data
-    gc.collect()
+    def __init__(self, date: str):
+        self.date = date
+        self.result: DataFrame | None = None
 
-    # Save the result
-    output_dir = Path(f"{output_dir}/nel_deployment")
-    output_dir.mkdir(parents=True, exist_ok=True)
+        self._first_row: DataFrame | None = None
 
-    result.to_parquet(os.path.join(output_dir.absolute(), f"{date}.parquet"))
+    def compute_from_month_totals(self, input_file: Path) -> bool:
+        """
+        Compute the metric from the month totals stored in the month data file's footer (no row data is read)
 
+        :return: False if the file has no month totals in its footer (the metric has to be computed by scanning it)
+        """
+        month_totals = read_month_totals(input_file)
+        if month_totals is None:
+            return False
 
-def nel_domain_resource_monitoring_stats(input_file: Path, date: str, output_dir: str):
+        self.consume(month_totals)
+        self.finalize()
+        return True
+
+    def consume(self, batch: DataFrame):
+        # Only the first row of the month data file is needed (necessary data is already precomputed)
+        if self._first_row is None and len(batch) > 0:
+            self._first_row = batch.head(1).reset_index(drop=True)
+
+    def finalize(self):
+        if self._first_row is None:
+            return
+
+        self.result = DataFrame({
+            "date": [self.date],
+            **{column: [self._first_row[column][0]] for column in NEL_DEPLOYMENT_COLUMNS}
+        }).reset_index(drop=True)
+
+        self._first_row = None
+
+    def save(self, output_dir: str):
+        if self.result is None:
+            return
+
+        _save_result(self.result, output_dir, "nel_deployment", f"{self.date}.parquet")
+
+
+class DomainResourceMonitoringStatsMetric(DomainMetric):
     """PREPARES DATA FOR: c9a"""
 
-    # Load data & group by url_domain right away
-    # because the other columns have the same value for each url_domain resource
-    result = pd.read_parquet(input_file, columns=[
-        'url_domain',
-        'url_domain_hosted_resources',
-        'url_domain_hosted_resources_with_nel',
-        'url_domain_monitored_resources_ratio',
-    ]).groupby(['url_domain'], observed=True, as_index=False).first().reset_index(drop=True)
-
-    result = result.copy()
-    result['date'] = date
-    result.set_index('date', inplace=True)
-    result.reset_index(inplace=True)
-
-    # Save the result
-    output_dir = Path(f"{output_dir}/nel_domain_resource_monitoring_stats")
-    output_dir.mkdir(parents=True, exist_ok=True)
+    name = "nel_domain_resource_monitoring_stats"
+    version = 1
+    columns = NEL_DOMAIN_RESOURCES_COLUMNS
+    output_files = ["nel_domain_resource_monitoring_stats/{date}.parquet"]
 
-    result.to_parquet(os.path.join(output_dir.absolute(), f"{date}.parquet"))
+    def __init__(self, date: str):
+        self.date = date
+        self.result: DataFrame | None = None
 
+    def compute(self, domain_table: DataFrame):
+        result = domain_table[self.columns].reset_index()
 
-def nel_popular_domain_collector_provider_usage(input_file: Path, aggregated_providers: np.ndarray, date: str,
-                                                used_psl: StringIO | None, output_dir: str):
-    year, month = date.split('-')
-    # TRANCO is only available from 1.12.2018
-    if year == '2018' and month < '12':
-        return
+        result['date'] = self.date
+        result.set_index('date', inplace=True)
+        result.reset_index(inplace=True)
 
-    tranco_list = metric_utils.load_tranco_list(year, month)
+        self.result = result
 
-    return nel_collector_provider_usage(input_file, aggregated_providers, date, used_psl, output_dir, tranco_list)
+    def save(self, output_dir: str):
+        _save_result(self.result, output_dir, "nel_domain_resource_monitoring_stats", f"{self.date}.parquet")
 
 
-def nel_collector_provider_usage(input_file: Path,
-                                 aggregated_providers: np.ndarray,
-                                 date: str,
-                                 used_psl: StringIO | None,
-                                 output_dir: str,
-                                 tranco_list: DataFrame | None = None) -> np.ndarray:
+class CollectorProviderUsageMetric(DomainMetric):
     """PREPARES DATA FOR: c1, c2 (b2 & b3), c4, c5"""
 
-    if used_psl is None:
-        used_columns = ['url_domain', 'rt_collectors_registrable']
-    else:
-        used_columns = ['url_domain', 'rt_collectors']
+    name = "nel_collector_provider_usage"
+    version = 1
+    output_files = ["nel_collector_provider_usage/{date}.parquet"]
 
-    data = pd.read_parquet(input_file, columns=used_columns)
+    def __init__(self, date: str, aggregated_providers: np.ndarray, used_psl: StringIO | PslResolver | None,
+                 tranco_list: DataFrame | None = None):
+        self.date = date
+        self.aggregated_providers = aggregated_providers
+        self.used_psl = used_psl
+        self.tranco_list = tranco_list
+
+        self.result: DataFrame | None = None
+        self.all_providers_so_far: np.ndarray | None = None
+
+        if used_psl is None:
+            self.columns = ['rt_collectors_registrable']
+        else:
+            self.columns = ['rt_collectors']
+
+        self._collectors_column = self.columns[0]
+
+        # Per-month partial results (independent of the previously analyzed months)
+        self._total_url_domains = 0
+        self._month_providers: np.ndarray | None = None
+        self._primary_collector_usage: DataFrame | None = None
+        self._secondary_collector_usage: DataFrame | None = None
+        self._fallback_collector_usage: DataFrame | None = None
+
+    @property
+    def month_providers(self) -> np.ndarray | None:
+        """Collector providers found in the metric's month (in the order of their first appearance)"""
+        return self._month_providers
+
+    def compute(self, domain_table: DataFrame):
+        collectors_per_url_domain = domain_table[[self._collectors_column]]
+
+        # If TRANCO list has been provided, filter the domain names to those that are marked as popular by the list
+        if self.tranco_list is not None:
+            collectors_per_url_domain = collectors_per_url_domain[
+                collectors_per_url_domain.index.isin(self.tranco_list['popular_domain_name'])
+            ]
+
+        self._total_url_domains = len(collectors_per_url_domain)
+
+        # Lists of collectors per url_domain -> flat collector names + the url_domain (list) each one belongs to
+        collector_lists = pa.array(collectors_per_url_domain[self._collectors_column].to_numpy(dtype=object),
+                                   type=pa.list_(pa.string()))
+        collectors = pc.list_flatten(collector_lists)
+        list_indices = pc.list_parent_indices(collector_lists).to_numpy()
+
+        # Dictionary-encode the collectors (ids are assigned in the order of the collectors' first appearance)
+        encoded_collectors = pc.dictionary_encode(collectors)
+        collector_ids = encoded_collectors.indices
+        providers = encoded_collectors.dictionary
+
+        # In case the used_psl was provided, map each collector domain name into its registrable domain name
+        # (only the unique names are mapped - then the ids are re-encoded to point to the registrable names)
+        if self.used_psl is not None:
+            if isinstance(self.used_psl, PslResolver):
+                psl_resolver = self.used_psl
+            else:
+                psl_resolver = PslResolver.from_psl_io(self.used_psl)
+
+            encoded_registrable_providers = pc.dictionary_encode(psl_resolver.resolve_many(providers))
+            collector_ids = pc.take(encoded_registrable_providers.indices, collector_ids)
+            providers = encoded_registrable_providers.dictionary
+
+        self._month_providers = providers.to_numpy(zero_copy_only=False)
+
+        # Position of each collector within its url_domain's list (0 = primary, 1 = secondary, 2+ = fallback)
+        list_offsets = np.asarray(collector_lists.offsets)
+        positions = np.arange(len(collectors)) - (list_offsets[list_indices] - list_offsets[0])
+
+        valid_ids = np.asarray(pc.is_valid(collector_ids), dtype=bool)
+        ids = collector_ids.fill_null(0).to_numpy().astype(np.int64)
+
+        # Domains without a (valid) primary collector are not considered at all
+        has_primary = np.zeros(len(collector_lists), dtype=bool)
+        has_primary[list_indices[(positions == 0) & valid_ids]] = True
+        counted = valid_ids & has_primary[list_indices]
+
+        self._primary_collector_usage = self._count_usage(ids[counted & (positions == 0)], providers,
+                                                          'primary_collectors', 'as_primary').reset_index()
+        self._secondary_collector_usage = self._count_usage(ids[counted & (positions == 1)], providers,
+                                                            'secondary_collectors', 'as_secondary').reset_index()
+        self._fallback_collector_usage = self._count_usage(ids[counted & (positions >= 2)], providers,
+                                                           'fallback_collectors', 'among_fallback')
+
+    @staticmethod
+    def _count_usage(ids: np.ndarray, providers: pa.Array, providers_column: str, count_column: str) -> DataFrame:
+        """Count occurrences of the (dictionary-encoded) providers - only the providers that occurred are kept"""
+        counts = np.bincount(ids, minlength=len(providers))
+        used = np.flatnonzero(counts)
+
+        usage = DataFrame({
+            providers_column: providers.to_numpy(zero_copy_only=False)[used],
+            count_column: counts[used].astype(np.int64),
+        })
+        usage.sort_values(by=providers_column, inplace=True)
+
+        return usage.set_index(providers_column)
+
+    def _assemble_result(self):
+        """Combine the month's collector usage with the collector providers found in the previous months"""
+        all_providers_so_far = Series(
+            np.append(self.aggregated_providers, self._month_providers)
+        ).dropna().unique()
+
+        result = DataFrame({
+            "date": [self.date] * len(all_providers_so_far),
+            "providers": all_providers_so_far
+        })
+
+        result = result.merge(self._primary_collector_usage, how='left',
+                              left_on="providers", right_on="primary_collectors")
+        result.drop(columns=['primary_collectors'], inplace=True)
+        result['share_as_primary'] = result['as_primary'] / self._total_url_domains * 100
+
+        result = result.merge(self._secondary_collector_usage, how='left',
+                              left_on="providers", right_on="secondary_collectors")
+        result.drop(columns=['secondary_collectors'], inplace=True)
+        result['share_as_secondary'] = result['as_secondary'] / result['as_secondary'].sum() * 100
+
+        result = result.merge(self._fallback_collector_usage, how='left',
+                              left_on="providers", right_on="fallback_collectors")
+
+        result['as_primary'] = result['as_primary'].fillna(0)
+        result['share_as_primary'] = result['share_as_primary'].fillna(0)
+
+        result['as_secondary'] = result['as_secondary'].fillna(0)
+        result['share_as_secondary'] = result['share_as_secondary'].fillna(0)
+
+        result['among_fallback'] = result['among_fallback'].fillna(0)
+
+        result.sort_values(by=['as_primary'], ascending=False, inplace=True)
+        result.reset_index(inplace=True, drop=True)
+
+        self.result = result
+        # Remember every analyzed collector provider from the beginning
+        self.all_providers_so_far = all_providers_so_far
+
+    def save(self, output_dir: str):
+        self._assemble_result()
+
+        if self.tranco_list is not None:
+            metric_dir = "popular_nel_collector_provider_usage"
+        else:
+            metric_dir = "nel_collector_provider_usage"
+
+        _save_result(self.result, output_dir, metric_dir, f"{self.date}.parquet")
+
+
+class NelConfigMetric(DomainMetric):
+    """PREPARES DATA FOR: c7"""
+
+    name = "nel_config"
+    version = 1
+    columns = NEL_CONFIG_COLUMNS
+    output_files = [
+        "nel_config/failure_fraction_{date}.parquet",
+        "nel_config/success_fraction_{date}.parquet",
+        "nel_config/include_subdomains_{date}.parquet",
+        "nel_config/max_age_{date}.parquet",
+    ]
+
+    def __init__(self, date: str):
+        self.date = date
+
+        self.result_failure_fraction: DataFrame | None = None
+        self.result_success_fraction: DataFrame | None = None
+        self.result_include_subdomains: DataFrame | None = None
+        self.result_max_age: DataFrame | None = None
+
+    def compute(self, domain_table: DataFrame):
+        config_per_url_domain = domain_table[self.columns].reset_index()
+
+        self.result_failure_fraction = self._domain_count_per_value(config_per_url_domain, 'nel_failure_fraction')
+        self.result_success_fraction = self._domain_count_per_value(config_per_url_domain, 'nel_success_fraction')
+        self.result_include_subdomains = self._domain_count_per_value(config_per_url_domain, 'nel_include_subdomains')
+
+        #
+        # max_age
+        #
+        ma_data = DataFrame({
+            "date": [self.date] * len(config_per_url_domain),
+            "url_domain": config_per_url_domain['url_domain'],
+            "nel_max_age": config_per_url_domain['nel_max_age']
+        })
+        ma_data_length = len(ma_data)
+        ma_data = ma_data.groupby(['date', 'nel_max_age'], as_index=True, observed=True).agg(
+            domain_count=("url_domain", "count"))
+        ma_data.reset_index(inplace=True)  # Used as_index=True here because of unexpected an index length problem
+
+        ma_data['nel_max_age'] = ma_data['nel_max_age'].astype("UInt64")
+        ma_data.sort_values(by='nel_max_age', ascending=True, inplace=True)
+
+        ma_data['domain_percent'] = ma_data['domain_count'] / ma_data_length * 100
+
+        self.result_max_age = ma_data.reset_index(drop=True)
+
+    def _domain_count_per_value(self, config_per_url_domain: DataFrame, config_column: str) -> DataFrame:
+        data = DataFrame({
+            "date": [self.date] * len(config_per_url_domain),
+            "url_domain": config_per_url_domain['url_domain'],
+            config_column: config_per_url_domain[config_column]
+        })
+        data_length = len(data)
+
+        data = data.groupby(['date', config_column], as_index=False, observed=True).agg(
+            domain_count=("url_domain", "count"))
+        data['domain_percent'] = data['domain_count'] / data_length * 100
+
+        return data.reset_index(drop=True)
+
+    def save(self, output_dir: str):
+        _save_result(self.result_failure_fraction, output_dir, "nel_config", f"failure_fraction_{self.date}.parquet")
+        _save_result(self.result_success_fraction, output_dir, "nel_config", f"success_fraction_{self.date}.parquet")
+        _save_result(self.result_include_subdomains, output_dir, "nel_config",
+                     f"include_subdomains_{self.date}.parquet")
+        _save_result(self.result_max_age, output_dir, "nel_config", f"max_age_{self.date}.parquet")
+
+
+class ResourceConfigVariabilityMetric(MetricAccumulator):
+    """PREPARES DATA FOR: c6"""
 
-    # If TRANCO list has been provided, filter the domain names to those that are marked as popular by the TRANCO list
-    if tranco_list is not None:
-        data = data[data['url_domain'].isin(tranco_list['popular_domain_name'])]
+    name = "nel_resource_config_variability"
+    version = 1
+    columns = NEL_RESOURCE_CONFIG_COLUMNS
+    output_files = ["nel_resource_config_variability/{date}.parquet"]
+
+    def __init__(self, date: str, memory_budget: int = AGGREGATION_MEMORY_BUDGET):
+        self.date = date
+
+        # Resources per unique (url_domain, NEL config) - aggregated in bounded memory (spilled to disk if needed)
+        self._resources_per_config = StreamingGroupCount(NEL_RESOURCE_CONFIG_COLUMNS, 'resources_with_this_config',
+                                                         memory_budget,
+                                                         category_columns=NEL_RESOURCE_CONFIG_COLUMNS[1:])
+
+    def consume(self, batch: DataFrame):
+        self._resources_per_config.update(batch)
+
+    def finalize(self):
+        # The result is merged batch by batch while being saved - it is never held in memory as a whole
+        pass
+
+    def save(self, output_dir: str):
+        output_dir = Path(f"{output_dir}/nel_resource_config_variability")
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_file = os.path.join(output_dir.absolute(), f"{self.date}.parquet")
+
+        writer = None
+        try:
+            for batch in self._resources_per_config.result_batches():
+                batch.insert(0, 'date', pd.Categorical([self.date] * len(batch)))
+
+                if writer is None:
+                    table = pa.Table.from_pandas(batch, preserve_index=False)
+                    writer = pq.ParquetWriter(output_file, table.schema)
+                else:
+                    # Only the first row group holds all the categories - they are read back in the same order
+                    for column in batch.columns:
+                        if isinstance(batch[column].dtype, pd.CategoricalDtype):
+                            batch[column] = batch[column].cat.remove_unused_categories()
+                    table = pa.Table.from_pandas(batch, preserve_index=False).cast(writer.schema)
+
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if writer is None:
+            # No resource with a NEL config at all
+            result = DataFrame(columns=NEL_RESOURCE_CONFIG_COLUMNS).astype("category").astype({'url_domain': object})
+            result.insert(0, 'date', pd.Categorical([]))
+            result['resources_with_this_config'] = Series([], dtype=np.int64)
+            result.to_parquet(output_file)
+
+
+class MonitoredResourceTypesMetric(MetricAccumulator):
+    """PREPARES DATA FOR: c8"""
 
-    collectors_per_url_domain = data.groupby(['url_domain'], observed=True).first()
+    name = "nel_monitored_resource_types"
+    version = 1
+    columns = ['url_domain', 'type']
+    output_files = ["nel_monitored_resource_types/{date}.parquet"]
 
-    del data
-    gc.collect()
+    def __init__(self, date: str):
+        self.date = date
+        self.result: DataFrame | None = None
 
-    total_url_domains = len(collectors_per_url_domain)
-
-    collectors_column = used_columns[1]
-    # In case the argument used_psl was provided, map each collector domain name into it's registrable domain name
-    if used_psl is not None:
-        unique_fullname_domains = collectors_per_url_domain[collectors_column].explode().dropna().unique()
-        unique_registrable_domains = np.asarray(
-            [psl_utils.get_sld_from_custom_psl(domain, used_psl) for domain in unique_fullname_domains]
-        )
-        registrable_domain_map = dict(zip(unique_fullname_domains, unique_registrable_domains))
-
-        collectors_per_url_domain[collectors_column] = collectors_per_url_domain[collectors_column].map(
-            lambda collectors:
-            [registrable_domain_map[domain_name] for domain_name in collectors]
-        )
-
-    all_providers_so_far = Series(
-        np.append(
-            aggregated_providers,
-            collectors_per_url_domain[collectors_column].explode().unique()
-        )
-    ).dropna().unique()
-
-    result = DataFrame({
-        "date": [date] * len(all_providers_so_far),
-        "providers": all_providers_so_far
-    })
-
-    collectors_per_url_domain['primary_collectors'] = collectors_per_url_domain[collectors_column].map(
-        lambda collectors: collectors[0] if len(collectors) > 0 else None
-    )
-    collectors_per_url_domain['secondary_collectors'] = collectors_per_url_domain[collectors_column].map(
-        lambda collectors: collectors[1] if len(collectors) > 1 else None
-    )
-    collectors_per_url_domain['fallback_collectors'] = collectors_per_url_domain[collectors_column].map(
-        lambda collectors: collectors[2:] if len(collectors) > 2 else None
-    )
-
-    collectors_per_url_domain = collectors_per_url_domain.drop(columns=[collectors_column])
-
-    collectors_per_url_domain.dropna(inplace=True, subset=['primary_collectors'])
-    collectors_per_url_domain.reset_index(inplace=True)
-
-    primary_collector_usage = (collectors_per_url_domain
-                               .groupby(['primary_collectors'])
-                               .agg(as_primary=('url_domain', 'count')))
-    primary_collector_usage.reset_index(inplace=True)
-
-    secondary_collector_usage = (collectors_per_url_domain
-                                 .groupby(['secondary_collectors'])
-                                 .agg(as_secondary=('url_domain', 'count')))
-    secondary_collector_usage.reset_index(inplace=True)
-
-    fallback_collectors_per_url_domain = collectors_per_url_domain[['url_domain', 'fallback_collectors']]
-    fallback_collector_usage = (fallback_collectors_per_url_domain
-                                .explode(['fallback_collectors'])
-                                .groupby(['fallback_collectors'])
-                                .agg(among_fallback=('url_domain', 'count')))
-
-    result = result.merge(primary_collector_usage, how='left', left_on="providers", right_on="primary_collectors")
-    result.drop(columns=['primary_collectors'], inplace=True)
-    result['share_as_primary'] = result['as_primary'] / total_url_domains * 100
-
-    result = result.merge(secondary_collector_usage, how='left', left_on="providers", right_on="secondary_collectors")
-    result.drop(columns=['secondary_collectors'], inplace=True)
-    result['share_as_secondary'] = result['as_secondary'] / result['as_secondary'].sum() * 100
-
-    result = result.merge(fallback_collector_usage, how='left', left_on="providers", right_on="fallback_collectors")
-
-    result['as_primary'] = result['as_primary'].fillna(0)
-    result['share_as_primary'] = result['share_as_primary'].fillna(0)
-
-    result['as_secondary'] = result['as_secondary'].fillna(0)
-    result['share_as_secondary'] = result['share_as_secondary'].fillna(0)
-
-    result['among_fallback'] = result['among_fallback'].fillna(0)
-
-    result.sort_values(by=['as_primary'], ascending=False, inplace=True)
-    result.reset_index(inplace=True, drop=True)
-
-    # Save the result
-    if tranco_list is not None:
-        output_dir = Path(f"{output_dir}/popular_nel_collector_provider_usage")
-    else:
-        output_dir = Path(f"{output_dir}/nel_collector_provider_usage")
+        self._partials: List[Series] = []
+        self._categories: Dict[str, List[pd.Index]] = {'url_domain': [], 'type': []}
 
-    output_dir.mkdir(parents=True, exist_ok=True)
+    def consume(self, batch: DataFrame):
+        for column, categories in self._categories.items():
+            if isinstance(batch[column].dtype, pd.CategoricalDtype):
+                categories.append(batch[column].cat.categories)
 
-    result.to_parquet(os.path.join(output_dir.absolute(), f"{date}.parquet"))
+        # Count instances of a monitored type per url_domain
+        batch_result = batch.groupby(['url_domain', 'type'], observed=True, sort=False).size()
 
-    # Remember every analyzed collector provider from the beginning
-    return all_providers_so_far
+        if not batch_result.empty:
+            batch_result.index = batch_result.index.set_levels(
+                [level.astype(object) for level in batch_result.index.levels]
+            )
+            self._partials.append(batch_result)
 
+    def finalize(self):
+        if len(self._partials) == 0:
+            counts = Series([], dtype="UInt32", index=pd.MultiIndex.from_tuples([], names=['url_domain', 'type']))
+        else:
+            counts = pd.concat(self._partials).groupby(level=['url_domain', 'type'], sort=False).sum()
+        self._partials = []
 
-def nel_config(input_file: Path, date: str, output_dir: str):
-    """
-    PREPARES DATA FOR: c7
+        result = counts.rename('count').reset_index()
+        result.insert(0, 'date', self.date)
 
-    IMPL NOTE: I deliberately avoid loading all the data and making copies of it here to trade computing time for RAM.
-    """
-    #
-    # failure_fraction
-    #
-    data = pd.read_parquet(input_file, columns=['url_domain', 'nel_failure_fraction'])
-    ff_data = DataFrame({
-        "date": [date] * len(data),
-        "url_domain": data['url_domain'],
-        "nel_failure_fraction": data['nel_failure_fraction']
-    })
-    del data
-    gc.collect()
+        # Ordered as grouped by the categories of the whole file
+        for column, categories in self._categories.items():
+            if len(categories) > 0:
+                result[column] = pd.Categorical(result[column], categories=union_categories(categories))
+        self._categories = {column: [] for column in self._categories}
+        result.sort_values(by=['url_domain', 'type'], inplace=True, ignore_index=True)
 
-    ff_data = ff_data.groupby(['date', 'url_domain'], as_index=False, observed=True).first()
-    ff_data_length = len(ff_data)
-    ff_data = ff_data.groupby(['date', 'nel_failure_fraction'], as_index=False, observed=True).agg(
-        domain_count=("url_domain", "count"))
-    ff_data['domain_percent'] = ff_data['domain_count'] / ff_data_length * 100
-
-    #
-    # success_fraction
-    #
-    data = pd.read_parquet(input_file, columns=['url_domain', 'nel_success_fraction'])
-    sf_data = DataFrame({
-        "date": [date] * len(data),
-        "url_domain": data['url_domain'],
-        "nel_success_fraction": data['nel_success_fraction']
-    })
-    del data
-    gc.collect()
+        # Cast to convenient types
+        result['date'] = result['date'].astype("category")
+        result['url_domain'] = result['url_domain'].astype("category")
+        result['type'] = result['type'].astype("category")
+        result['count'] = result['count'].astype("UInt32")
 
-    sf_data = sf_data.groupby(['date', 'url_domain'], as_index=False, observed=True).first()
-    sf_data_length = len(sf_data)
-    sf_data = sf_data.groupby(['date', 'nel_success_fraction'], as_index=False, observed=True).agg(
-        domain_count=("url_domain", "count"))
-    sf_data['domain_percent'] = sf_data['domain_count'] / sf_data_length * 100
-
-    #
-    # include_subdomains
-    #
-    data = pd.read_parquet(input_file, columns=['url_domain', 'nel_include_subdomains'])
-    is_data = DataFrame({
-        "date": [date] * len(data),
-        "url_domain": data['url_domain'],
-        "nel_include_subdomains": data['nel_include_subdomains']
-    })
-    del data
-    gc.collect()
+        self.result = result
 
-    is_data = is_data.groupby(['date', 'url_domain'], as_index=False, observed=True).first()
-    is_data_length = len(is_data)
-    is_data = is_data.groupby(['date', 'nel_include_subdomains'], as_index=False, observed=True).agg(
-        domain_count=("url_domain", "count"))
-    is_data['domain_percent'] = is_data['domain_count'] / is_data_length * 100
-
-    #
-    # max_age
-    #
-    data = pd.read_parquet(input_file, columns=['url_domain', 'nel_max_age'])
-    ma_data = DataFrame({
-        "date": [date] * len(data),
-        "url_domain": data['url_domain'],
-        "nel_max_age": data['nel_max_age']
-    })
-    del data
-    gc.collect()
+    def save(self, output_dir: str):
+        _save_result(self.result, output_dir, "nel_monitored_resource_types", f"{self.date}.parquet")
 
-    ma_data = ma_data.groupby(['date', 'url_domain'], as_index=False, observed=True).first()
-    ma_data_length = len(ma_data)
-    ma_data = ma_data.groupby(['date', 'nel_max_age'], as_index=True, observed=True).agg(
-        domain_count=("url_domain", "count"))
-    ma_data.reset_index(inplace=True)  # Used as_index=True here because of unexpected an index length problem
 
-    ma_data['nel_max_age'] = ma_data['nel_max_age'].astype("UInt64")
-    ma_data.sort_values(by='nel_max_age', ascending=True, inplace=True)
+# Metrics computed from a single month data file alone
+MONTH_INDEPENDENT_METRICS = [
+    NelDeploymentMetric,
+    DomainResourceMonitoringStatsMetric,
+    NelConfigMetric,
+    ResourceConfigVariabilityMetric,
+    MonitoredResourceTypesMetric,
+]
 
-    ma_data['domain_percent'] = ma_data['domain_count'] / ma_data_length * 100
+# Metrics whose results depend on the used PSL
+PSL_DEPENDENT_METRICS = [CollectorProviderUsageMetric.name]
 
-    # Gather the results
-    result_failure_fraction = ff_data.reset_index(drop=True)
-    result_success_fraction = sf_data.reset_index(drop=True)
-    result_include_subdomains = is_data.reset_index(drop=True)
-    result_max_age = ma_data.reset_index(drop=True)
+# Implementation version of every metric computed by analyze_month()
+METRIC_VERSIONS = {
+    metric_class.name: metric_class.version
+    for metric_class in [*MONTH_INDEPENDENT_METRICS, CollectorProviderUsageMetric]
+}
 
-    # Save the results
-    output_dir = Path(f"{output_dir}/nel_config")
-    output_dir.mkdir(parents=True, exist_ok=True)
 
-    output_dir_absolute = output_dir.absolute()
+def nel_deployment(input_file: Path, date: str, output_dir: str):
+    """PREPARES DATA FOR: c2 (b1)"""
+    _run_single_metric(input_file, NelDeploymentMetric(date), output_dir)
+
+
+def nel_domain_resource_monitoring_stats(input_file: Path, date: str, output_dir: str):
+    """PREPARES DATA FOR: c9a"""
+    _run_single_metric(input_file, DomainResourceMonitoringStatsMetric(date), output_dir)
+
+
+def nel_popular_domain_collector_provider_usage(input_file: Path, aggregated_providers: np.ndarray, date: str,
+                                                used_psl: StringIO | PslResolver | None, output_dir: str):
+    year, month = date.split('-')
+    # TRANCO is only available from 1.12.2018
+    if year == '2018' and month < '12':
+        return
+
+    tranco_list = metric_utils.load_tranco_list(year, month)
 
-    failure_fraction_output_path = os.path.join(output_dir_absolute, f"failure_fraction_{date}.parquet")
-    result_failure_fraction.to_parquet(failure_fraction_output_path)
+    return nel_collector_provider_usage(input_file, aggregated_providers, date, used_psl, output_dir, tranco_list)
 
-    success_fraction_output_path = os.path.join(output_dir_absolute, f"success_fraction_{date}.parquet")
-    result_success_fraction.to_parquet(success_fraction_output_path)
 
-    include_subdomains_output_path = os.path.join(output_dir_absolute, f"include_subdomains_{date}.parquet")
-    result_include_subdomains.to_parquet(include_subdomains_output_path)
+def nel_collector_provider_usage(input_file: Path,
+                                 aggregated_providers: np.ndarray,
+                                 date: str,
+                                 used_psl: StringIO | PslResolver | None,
+                                 output_dir: str,
+                                 tranco_list: DataFrame | None = None) -> np.ndarray:
+    """PREPARES DATA FOR: c1, c2 (b2 & b3), c4, c5"""
+    metric = CollectorProviderUsageMetric(date, aggregated_providers, used_psl, tranco_list)
+    _run_single_metric(input_file, metric, output_dir)
 
-    max_age_output_path = os.path.join(output_dir_absolute, f"max_age_{date}.parquet")
-    result_max_age.to_parquet(max_age_output_path)
+    return metric.all_providers_so_far
+
+
+def nel_config(input_file: Path, date: str, output_dir: str):
+    """PREPARES DATA FOR: c7"""
+    _run_single_metric(input_file, NelConfigMetric(date), output_dir)
 
 
 def nel_resource_config_variability(input_file: Path, date: str, output_dir: str):
     """PREPARES DATA FOR: c6"""
-    parquet = pq.ParquetFile(input_file)
-    data_batch_generator = parquet.iter_batches(batch_size=RESOURCE_BATCH_SIZE,
-                                                columns=[
-                                                    'url_domain',
-                                                    'nel_include_subdomains',
-                                                    'nel_failure_fraction',
-                                                    'nel_success_fraction',
-                                                    'nel_max_age'
-                                                ])
-    result = None
-
-    for batch in data_batch_generator:
-        data = batch.to_pandas()
-
-        data['resources_with_this_config'] = 1
-        batch_result = data.groupby(
-            ['url_domain', 'nel_include_subdomains', 'nel_failure_fraction', 'nel_success_fraction', 'nel_max_age'],
-            observed=True
-        ).agg({'resources_with_this_config': 'count'})
-
-        batch_result.reset_index(inplace=True)
-
-        if result is None:
-            # Store results the first time (or at least the schema if batch_result is empty)
-            result = batch_result
-        else:
-            if not batch_result.empty:
-                result = pd.concat([result, batch_result])
-
-    # Perform one more group by to handle in-between-the-batches duplicate results
-    # If the same NEL config is found for 2 domains, sum their resources_with_this_config numbers
-    result = result.groupby(
-        ['url_domain', 'nel_include_subdomains', 'nel_failure_fraction', 'nel_success_fraction', 'nel_max_age'],
-        observed=True, as_index=False
-    ).agg({'resources_with_this_config': 'sum'})
-
-    result['date'] = date
-    result.set_index('date', inplace=True)
-    result.reset_index(inplace=True)
-
-    # Cast to category where convenient
-    result['date'] = result['date'].astype("category")
-    result['nel_include_subdomains'] = result['nel_include_subdomains'].astype("category")
-    result['nel_failure_fraction'] = result['nel_failure_fraction'].astype("category")
-    result['nel_success_fraction'] = result['nel_success_fraction'].astype("category")
-    result['nel_max_age'] = result['nel_max_age'].astype("category")
-
-    # Save the result
-    output_dir = Path(f"{output_dir}/nel_resource_config_variability")
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    result.to_parquet(os.path.join(output_dir.absolute(), f"{date}.parquet"))
+    _run_single_metric(input_file, ResourceConfigVariabilityMetric(date), output_dir)
 
 
 def nel_monitored_resource_types(input_file: Path, date: str, output_dir: str):
     """PREPARES DATA FOR: c8"""
-    data = pd.read_parquet(input_file, columns=['url_domain', 'type'])
+    _run_single_metric(input_file, MonitoredResourceTypesMetric(date), output_dir)
+
+
+def _run_single_metric(input_file: Path, metric: MetricAccumulator | DomainMetric, output_dir: str):
+    if isinstance(metric, DomainMetric):
+        domain_table_builder = DomainTable(metric.date, input_file)
+        scan_month(input_file, [domain_table_builder])
+        metric.compute(domain_table_builder.result)
+    elif not (isinstance(metric, NelDeploymentMetric) and metric.compute_from_month_totals(input_file)):
+        scan_month(input_file, [metric])
 
-    data['date'] = date
-    data['tmp'] = 1  # Prepare temporary column for counting instances of a monitored type per url_domain
-    result = data.groupby(['date', 'url_domain', 'type'], as_index=False, observed=True).agg(count=('tmp', 'count'))
+    metric.save(output_dir)
 
-    del data
+    del metric
     gc.collect()
 
-    # Cast to convenient types
-    result['date'] = result['date'].astype("category")
-    result['url_domain'] = result['url_domain'].astype("category")
-    result['type'] = result['type'].astype("category")
-    result['count'] = result['count'].astype("UInt32")
 
-    # Save the result
-    output_dir = Path(f"{output_dir}/nel_monitored_resource_types")
+def _save_result(result: DataFrame, output_dir: str, metric_dir: str, file_name: str):
+    output_dir = Path(f"{output_dir}/{metric_dir}")
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    result.to_parquet(os.path.join(output_dir.absolute(), f"{date}.parquet"))
+    result.to_parquet(os.path.join(output_dir.absolute(), file_name))
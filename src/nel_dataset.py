@@ -0,0 +1,163 @@
+"""
+Hive-partitioned NEL dataset - an optional alternative to the monolithic month data files (nel_data_YYYY_MM.parquet).
+
+Layout:
+    <dataset_dir>/month=YYYY-MM/domain_bucket=N/part-{i}.parquet
+
+All rows of a url_domain are in the same domain bucket (a stable hash of the domain). A month partition directory is
+analyzed the same way a month data file is. Reading the whole dataset (see open_nel_dataset) prunes the months &
+domain buckets not matching the filter of a query (see month_filter, domain_filter).
+"""
+
+import os
+import shutil
+import zlib
+from pathlib import Path
+from typing import Iterable, List
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.month_sort import DOMAIN_SORTED_ROW_GROUP_SIZE
+
+MONTH_PARTITION_KEY = "month"
+DOMAIN_BUCKET_PARTITION_KEY = "domain_bucket"
+
+DOMAIN_BUCKETS = 16
+DOMAIN_BUCKETS_METADATA_KEY = b"nel_domain_buckets"
+
+NEL_DATASET_PARTITIONING = ds.partitioning(pa.schema([
+    (MONTH_PARTITION_KEY, pa.string()),
+    (DOMAIN_BUCKET_PARTITION_KEY, pa.int32()),
+]), flavor="hive")
+
+# Partitioning inside a single month partition directory
+_MONTH_PARTITIONING = ds.partitioning(pa.schema([(DOMAIN_BUCKET_PARTITION_KEY, pa.int32())]), flavor="hive")
+
+# Rows read from the month data file at once while it is being partitioned
+PARTITIONING_BATCH_SIZE = 64 * 1024
+
+
+def domain_buckets(url_domains: pa.Array | pa.ChunkedArray, buckets: int) -> pa.Array:
+    """
+    Get the domain buckets of url_domains (stable across processes & runs, unlike hash())
+
+    :param url_domains: url_domain values (nulls go to bucket 0)
+    :param buckets: Number of domain buckets
+    :return: Domain bucket of every url_domain value
+    """
+    if isinstance(url_domains, pa.ChunkedArray):
+        url_domains = url_domains.combine_chunks()
+    if pa.types.is_dictionary(url_domains.type):
+        url_domains = url_domains.cast(pa.string())
+
+    # Hash only the unique domains
+    encoded_domains = pc.dictionary_encode(url_domains)
+    unique_buckets = pa.array([zlib.crc32(domain.encode("utf-8")) % buckets
+                               for domain in encoded_domains.dictionary.to_pylist()], type=pa.int32())
+
+    return pc.fill_null(pc.take(unique_buckets, encoded_domains.indices), 0)
+
+
+def month_partition_dir(dataset_dir: str | Path, date: str) -> Path:
+    """Directory of a month (YYYY-MM) partition"""
+    return Path(dataset_dir) / f"{MONTH_PARTITION_KEY}={date}"
+
+
+def month_partition_dirs(dataset_dir: str | Path) -> List[Path]:
+    """All the month partition directories of a dataset (ordered by their date)"""
+    return sorted(path for path in Path(dataset_dir).glob(f"{MONTH_PARTITION_KEY}=*")
+                  if path.is_dir() and path.suffix != ".tmp")
+
+
+def is_month_partition(input_path: Path) -> bool:
+    return input_path.is_dir() and input_path.name.startswith(f"{MONTH_PARTITION_KEY}=")
+
+
+def month_date(input_path: Path) -> str:
+    """
+    Get the month (YYYY-MM) of a month data file (nel_data_YYYY_MM.parquet) or a month partition directory
+    (month=YYYY-MM)
+    """
+    if is_month_partition(input_path):
+        return input_path.name.split("=", 1)[1]
+
+    month, year = input_path.stem.split("_")[::-1][:2]  # Reverse and take last 2 values
+    return f"{year}-{month}"
+
+
+def month_data_files(input_path: Path) -> List[Path]:
+    """Data files of a month - the month data file itself or all the files of a month partition"""
+    if input_path.is_dir():
+        return sorted(input_path.rglob("*.parquet"))
+
+    return [input_path]
+
+
+def open_month(input_path: Path) -> ds.Dataset:
+    """Open a month data file or a month partition directory as a dataset"""
+    if input_path.is_dir():
+        return ds.dataset(input_path, format="parquet", partitioning=_MONTH_PARTITIONING)
+
+    return ds.dataset(input_path, format="parquet")
+
+
+def open_nel_dataset(dataset_dir: str | Path) -> ds.Dataset:
+    """Open the whole NEL dataset (all the months) - filter it with month_filter & domain_filter"""
+    return ds.dataset(dataset_dir, format="parquet", partitioning=NEL_DATASET_PARTITIONING)
+
+
+def month_filter(dates: Iterable[str]) -> ds.Expression:
+    """Dataset filter of the months (YYYY-MM) - only the partitions of the months are read"""
+    return ds.field(MONTH_PARTITION_KEY).isin(list(dates))
+
+
+def domain_filter(dataset: ds.Dataset, url_domains: Iterable[str]) -> ds.Expression:
+    """Dataset filter of the url_domains - only the domain buckets the domains are in are read"""
+    url_domains = pa.array(list(url_domains), type=pa.string())
+    buckets = domain_buckets(url_domains, dataset_domain_buckets(dataset))
+
+    return (ds.field(DOMAIN_BUCKET_PARTITION_KEY).isin(pc.unique(buckets).to_pylist())
+            & ds.field('url_domain').cast(pa.string()).isin(url_domains))
+
+
+def dataset_domain_buckets(dataset: ds.Dataset) -> int:
+    """Number of domain buckets the dataset is partitioned into"""
+    return int((dataset.schema.metadata or {}).get(DOMAIN_BUCKETS_METADATA_KEY, DOMAIN_BUCKETS))
+
+
+def write_month_partition(month_file: Path, dataset_dir: str | Path, date: str, buckets: int = DOMAIN_BUCKETS):
+    """
+    Write a month data file into the dataset as the month's partition (an existing partition of the month is replaced).
+    The month data file is read batch by batch, so the order of its rows (e.g. sorted by url_domain) is kept within
+    every domain bucket.
+
+    :param month_file: Month data file to partition
+    :param dataset_dir: Directory of the dataset
+    :param date: Month of the data (YYYY-MM)
+    :param buckets: Number of domain buckets to split the month data into
+    """
+    partition_dir = month_partition_dir(dataset_dir, date)
+    temp_partition_dir = partition_dir.with_name(f"{partition_dir.name}.{os.getpid()}.tmp")
+
+    with pq.ParquetFile(month_file) as parquet:
+        schema = parquet.schema_arrow
+        schema = schema.append(pa.field(DOMAIN_BUCKET_PARTITION_KEY, pa.int32())) \
+            .with_metadata({**(schema.metadata or {}), DOMAIN_BUCKETS_METADATA_KEY: str(buckets).encode("utf-8")})
+
+        batches = (
+            pa.RecordBatch.from_arrays([*batch.columns, domain_buckets(batch['url_domain'], buckets)], schema=schema)
+            for batch in parquet.iter_batches(batch_size=PARTITIONING_BATCH_SIZE)
+        )
+
+        # No threads - the rows have to be written in order
+        ds.write_dataset(batches, temp_partition_dir, schema=schema, format="parquet",
+                         partitioning=_MONTH_PARTITIONING, basename_template="part-{i}.parquet",
+                         min_rows_per_group=DOMAIN_SORTED_ROW_GROUP_SIZE,
+                         max_rows_per_group=DOMAIN_SORTED_ROW_GROUP_SIZE, use_threads=False)
+
+    if partition_dir.exists():
+        shutil.rmtree(partition_dir)
+    os.replace(temp_partition_dir, partition_dir)
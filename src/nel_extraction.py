@@ -0,0 +1,389 @@
+"""
+Local execution of the NEL data query (QUERY_NEL_DATA_BODY, see bq_parametrized_queries) with Arrow kernels.
+
+Takes the HTTP Archive summary_requests rows of a month (all the desktop & mobile tables of the month concatenated, like
+the httparchive_full_month table of the query) and produces the same rows & columns the query does
+(PYARROW_NEL_QUERY_RESULT_SCHEMA). The regular expressions are the ones of the query - the Arrow regex kernels use RE2,
+the same engine BigQuery does.
+The rows are matched in shards by parallel threads - the result does not depend on the number of threads. The result
+can be written as a month data file (see write_month_data_file), so months can be reprocessed from local
+summary_requests samples without querying BigQuery again (see reprocess_httparchive.py).
+
+Differences from BigQuery:
+    * NET.REG_DOMAIN is emulated with a PslResolver (public suffixes resolve to null, like in BigQuery) - without one,
+      only the query's fallback (TLD + second to last domain label) is used
+    * a NEL report_to value that is not a valid regular expression (it is a part of the Report-To regex in the query)
+      fails the whole query in BigQuery - here the Report-To header of such rows is not matched
+"""
+
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.classes.PslResolver import PslResolver
+from src.data_schemas import PYARROW_MERGE_READ_SCHEMA, PYARROW_MERGE_WRITE_SCHEMA_V2, PYARROW_NEL_QUERY_RESULT_SCHEMA
+from src.month_sort import DOMAIN_SORTED_ROW_GROUP_SIZE, sort_by_domain
+from src.month_totals import month_totals_from_table, with_month_totals
+from src.schema_migration import to_schema_v2
+
+# Columns of the HTTP Archive summary_requests tables used by the query
+SUMMARY_REQUESTS_SCHEMA = pa.schema([
+    ('requestid', pa.int64()),
+    ('firstReq', pa.bool_()),
+    ('type', pa.string()),
+    ('ext', pa.string()),
+    ('url', pa.string()),
+    ('status', pa.int64()),
+    ('respOtherHeaders', pa.string()),
+])
+SUMMARY_REQUESTS_COLUMNS = SUMMARY_REQUESTS_SCHEMA.names
+
+# Rows of the requests matched at once by a single thread
+EXTRACTION_SHARD_ROWS = 64 * 1024
+
+URL_DOMAIN_PATTERN = r"http[s]?:[\/][\/](?P<value>[^\/:]+)"
+
+NEL_HEADER_PRESENT_PATTERN = r"(?:^|.*[\s,]+)(nel\s*[=]\s*)"
+NEL_HEADER_PATTERN = r"(?:^|.*[\s,]+)nel\s*[=]\s*(?P<value>{.*?})"
+
+NEL_MAX_AGE_PATTERN = r".*max_age[\"\']\s*:\s*(?P<value>[0-9]+)"
+NEL_FAILURE_FRACTION_PATTERN = r".*failure[_]fraction[\"\']\s*:\s*(?P<value>[0-9\.]+)"
+NEL_SUCCESS_FRACTION_PATTERN = r".*success[_]fraction[\"\']\s*:\s*(?P<value>[0-9\.]+)"
+NEL_INCLUDE_SUBDOMAINS_PATTERN = r".*include[_]subdomains[\"\']\s*:\s*(?P<value>\w+)"
+NEL_REPORT_TO_PATTERN = r".*report_to[\"\']\s*:\s*[\"\'](?P<value>.+?)[\"\']"
+
+# The Report-To group named by the NEL report_to value is inserted (as is) between the prefix & the suffix
+RT_HEADER_PATTERN_PREFIX = (r"report[-]to\s*?[=].*(?P<value>[{]"
+                            r"(?:(?:[^\{]*?endpoints.*?[\[][^\[]*?[\]][^\}]*?)|(?:[^\{]*?endpoints.*?[\{][^\{]*?[\}]))?"
+                            r"[^\]\}]*?group[\'\"][:]\s*?[\'\"]")
+RT_HEADER_PATTERN_SUFFIX = (r"(?:(?:[^\}]*?endpoints[^\}]*?[\[][^\[]*?[\]][^\{]*?)|(?:[^\}]*?endpoints.*?[\{][^\{]*?[\}]))?"
+                            r".*?[}])")
+
+RT_GROUP_PATTERN = r".*group[\"\']\s*:\s*[\"\'](?P<value>.+?)[\"\']"
+RT_COLLECTOR_PATTERN = r"url[\"\']\s*:\s*[\"\']http[s]?:[\\]*?[\/][\\]*?[\/](?P<value>[^\/]+?)[\\]*?[\/\"]"
+
+# Fallback of NET.REG_DOMAIN - TLD + second to last domain label
+REGISTRABLE_DOMAIN_FALLBACK_PATTERN = r"\.(?P<value>\w+\.\w+$)"
+
+
+def extract_nel_data(requests: pa.Table, psl_resolver: PslResolver | None = None, workers: int = 1,
+                     shard_rows: int = EXTRACTION_SHARD_ROWS) -> pa.Table:
+    """
+    Run the NEL data query on the summary_requests rows of a month
+
+    :param requests: summary_requests rows of the month (at least the SUMMARY_REQUESTS_COLUMNS)
+    :param psl_resolver: PSL to emulate NET.REG_DOMAIN with (None = only the query's fallback is used)
+    :param workers: Shards of the rows matched at once
+    :param shard_rows: Rows of a shard
+    :return: The query result (PYARROW_NEL_QUERY_RESULT_SCHEMA), ordered by url_domain
+    """
+    return _extract_nel_data([functools.partial(requests.slice, offset, shard_rows)
+                              for offset in range(0, requests.num_rows, shard_rows)],
+                             psl_resolver, workers, shard_rows)
+
+
+def extract_nel_data_from_files(files: List[str | Path], psl_resolver: PslResolver | None = None, workers: int = 1,
+                                shard_rows: int = EXTRACTION_SHARD_ROWS) -> pa.Table:
+    """
+    Run the NEL data query on summary_requests Parquet files of a month - every row group is a shard read & matched
+    on its own, only the URLs of the requests without NEL are kept in memory (the response headers are dropped)
+
+    :param files: summary_requests Parquet files (or directories of them) of the month
+    :param psl_resolver: PSL to emulate NET.REG_DOMAIN with (None = only the query's fallback is used)
+    :param workers: Shards read & matched at once
+    :param shard_rows: Rows of a shard of the requests with NEL (matched against their Report-To header)
+    :return: The query result (PYARROW_NEL_QUERY_RESULT_SCHEMA), ordered by url_domain
+    """
+    row_groups = [row_group for file in files for fragment in ds.dataset(file, format="parquet").get_fragments()
+                  for row_group in fragment.split_by_row_group()]
+    return _extract_nel_data([functools.partial(row_group.to_table, columns=SUMMARY_REQUESTS_COLUMNS)
+                              for row_group in row_groups],
+                             psl_resolver, workers, shard_rows)
+
+
+def summary_requests_path(tables_dir: str | Path, table_id: str) -> Path:
+    """
+    Local sample of a summary_requests table - <tables_dir>/<table id>.parquet or a directory <tables_dir>/<table id>/
+    of Parquet shards
+
+    :raise FileNotFoundError: The table has no local sample
+    """
+    table_path = Path(tables_dir) / f"{table_id}.parquet"
+    if not table_path.is_file():
+        table_path = Path(tables_dir) / table_id
+    if not table_path.exists():
+        raise FileNotFoundError(f"Table {table_id} has no local sample in {tables_dir}")
+
+    return table_path
+
+
+def write_month_data_file(result: pa.Table, output_file: str | Path, row_group_size: int = DOMAIN_SORTED_ROW_GROUP_SIZE,
+                          compression: str = "snappy"):
+    """
+    Write the query result of a month as a month data file - the same file query_and_store produces from the blobs
+    exported by BigQuery (PYARROW_MERGE_WRITE_SCHEMA_V2, sorted by url_domain, month totals in the footer).
+    The file is written under a temporary name first, an existing file is replaced only once the new one is complete.
+
+    :param result: The query result of the month (see extract_nel_data)
+    :param output_file: The month data file
+    :param row_group_size: Rows per row group of the file
+    :param compression: Compression codec of the file
+    """
+    month_data = sort_by_domain(to_schema_v2(result.cast(PYARROW_MERGE_READ_SCHEMA)))
+    schema = with_month_totals(PYARROW_MERGE_WRITE_SCHEMA_V2, month_totals_from_table(month_data))
+
+    temp_file_path = f"{output_file}.tmp"
+    pq.write_table(month_data.cast(schema), temp_file_path, row_group_size=row_group_size, compression=compression)
+    os.replace(temp_file_path, output_file)
+
+
+def _extract_nel_data(shards: List[Callable[[], pa.Table]], psl_resolver: PslResolver | None, workers: int,
+                      shard_rows: int) -> pa.Table:
+    # Arrow kernels release the GIL - the shards are matched in parallel threads
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        scanned_shards = list(executor.map(lambda load_shard: _scan_requests(load_shard()), shards))
+
+        urls = pa.chunked_array([urls for urls, _, _ in scanned_shards], type=pa.string())
+        url_domains = pa.chunked_array([url_domains for _, url_domains, _ in scanned_shards], type=pa.string())
+        nel = pa.concat_tables([_nel_rows_schema_table()] + [nel for _, _, nel in scanned_shards])
+
+        # unique_total_counting_table (COUNT(*) of SELECT DISTINCT / GROUP BY counts the null value too)
+        total_crawled_resources = pc.count_distinct(urls, mode='all').as_py()
+        total_crawled_domains = pc.count_distinct(url_domains, mode='all').as_py()
+        nel = nel.append_column('url_domain_hosted_resources',
+                                _count_distinct_per_domain(urls, url_domains, nel['url_domain']))
+        del urls, url_domains, scanned_shards
+
+        # unique_nel_resources_table - the latest request of every URL
+        url_groups = pc.dictionary_encode(nel['url'].combine_chunks(), null_encoding='encode').indices
+        latest_request_ids = pa.table({'url_group': url_groups, 'requestId': nel['requestId']}) \
+            .group_by('url_group').aggregate([('requestId', 'max')])['requestId_max']
+        nel = nel.filter(pc.is_in(nel['requestId'], value_set=latest_request_ids))
+
+        # unique_nel_total_counting_table & nel_url_domain_hosted_nel_resources_counting_table
+        total_crawled_resources_with_nel = nel.num_rows
+        total_crawled_domains_with_nel = pc.count_distinct(nel['url_domain'], mode='all').as_py()
+        nel = nel.append_column('url_domain_hosted_resources_with_nel',
+                                _count_distinct_per_domain(nel['url'], nel['url_domain'], nel['url_domain']))
+
+        # rt_header_extracting_table & rt_field_extracting_table
+        rt_values = list(executor.map(lambda offset: _extract_report_to_header(
+            nel['resp_headers'].slice(offset, shard_rows), nel['nel_report_to'].slice(offset, shard_rows)),
+                                      range(0, nel.num_rows, shard_rows)))
+        nel = nel.append_column('rt_value', pa.chunked_array(rt_values, type=pa.string()))
+        rt_group = _extract(nel['rt_value'], RT_GROUP_PATTERN)
+
+        # final_modifications_table - NEL.report-to must equal Report-To.group
+        nel = nel.filter(pc.equal(nel['nel_report_to'], rt_group))
+
+        rt_collectors = pa.chunked_array(list(executor.map(
+            lambda offset: _extract_all(nel['rt_value'].slice(offset, shard_rows), RT_COLLECTOR_PATTERN),
+            range(0, nel.num_rows, shard_rows))), type=pa.list_(pa.string())).combine_chunks()
+
+    result = pa.table({
+        'requestId': nel['requestId'],
+        'firstReq': nel['firstReq'],
+        'type': nel['type'],
+        'ext': nel['ext'],
+        'status': nel['status'],
+        'url': nel['url'],
+        'url_domain': nel['url_domain'],
+        'url_domain_registrable': _registrable_domains(nel['url_domain'], psl_resolver),
+        'url_domain_hosted_resources': nel['url_domain_hosted_resources'],
+        'url_domain_hosted_resources_with_nel': nel['url_domain_hosted_resources_with_nel'],
+        'url_domain_monitored_resources_ratio': pc.round(
+            pc.multiply(pc.divide(pc.cast(nel['url_domain_hosted_resources_with_nel'], pa.float64()),
+                                  pc.cast(nel['url_domain_hosted_resources'], pa.float64())), 100),
+            ndigits=2, round_mode='half_towards_infinity'),
+        'total_crawled_resources': _constant(total_crawled_resources, nel.num_rows),
+        'total_crawled_domains': _constant(total_crawled_domains, nel.num_rows),
+        'total_crawled_resources_with_nel': _constant(total_crawled_resources_with_nel, nel.num_rows),
+        'total_crawled_domains_with_nel': _constant(total_crawled_domains_with_nel, nel.num_rows),
+        'total_crawled_resources_with_correct_nel': _constant(pc.count(nel['url']).as_py(), nel.num_rows),
+        'total_crawled_domains_with_correct_nel': _constant(pc.count_distinct(nel['url_domain']).as_py(),
+                                                            nel.num_rows),
+        'nel_max_age': nel['nel_max_age'],
+        'nel_failure_fraction': _normalize_fraction(nel['nel_failure_fraction'], default='1.0'),
+        'nel_success_fraction': _normalize_fraction(nel['nel_success_fraction'], default='0.0'),
+        'nel_include_subdomains': pc.fill_null(nel['nel_include_subdomains'], 'false'),
+        'nel_report_to': nel['nel_report_to'],
+        'rt_collectors': rt_collectors,
+        'rt_collectors_registrable': _registrable_collectors(rt_collectors, psl_resolver),
+    })
+
+    # ORDER BY url_domain ASC (nulls first)
+    result = result.take(pc.sort_indices(result['url_domain'], null_placement='at_start'))
+    return result.cast(PYARROW_NEL_QUERY_RESULT_SCHEMA)
+
+
+def _scan_requests(requests: pa.Table) -> Tuple[pa.Array, pa.Array, pa.Table]:
+    """
+    The row-wise part of the query for a shard of the requests - url_domain of every request and the NEL fields of
+    the requests with NEL (nel_header_extracting_table & nel_field_extracting_table)
+
+    :return: URLs & their url_domain (all the requests) and the requests with NEL
+    """
+    requests = requests.select(SUMMARY_REQUESTS_COLUMNS).cast(SUMMARY_REQUESTS_SCHEMA).combine_chunks()
+    url_domain = _extract(requests['url'], URL_DOMAIN_PATTERN)
+
+    resp_headers = pc.utf8_lower(requests['respOtherHeaders'])
+    contains_nel = pc.match_substring_regex(resp_headers, NEL_HEADER_PRESENT_PATTERN)
+
+    nel = pa.table({
+        'requestId': requests['requestid'],
+        'firstReq': requests['firstReq'],
+        'type': requests['type'],
+        'ext': requests['ext'],
+        'status': requests['status'],
+        'resp_headers': resp_headers,
+        'url': requests['url'],
+        'url_domain': url_domain,
+    }).filter(contains_nel)
+
+    nel_value = _extract(nel['resp_headers'], NEL_HEADER_PATTERN)
+    for column, pattern in [('nel_max_age', NEL_MAX_AGE_PATTERN),
+                            ('nel_failure_fraction', NEL_FAILURE_FRACTION_PATTERN),
+                            ('nel_success_fraction', NEL_SUCCESS_FRACTION_PATTERN),
+                            ('nel_include_subdomains', NEL_INCLUDE_SUBDOMAINS_PATTERN),
+                            ('nel_report_to', NEL_REPORT_TO_PATTERN)]:
+        nel = nel.append_column(column, _extract(nel_value, pattern))
+
+    return requests['url'].chunk(0), url_domain, nel
+
+
+def _nel_rows_schema_table() -> pa.Table:
+    """An empty table of the requests with NEL (see _scan_requests) - makes the concatenation of no shards work"""
+    return _scan_requests(SUMMARY_REQUESTS_SCHEMA.empty_table())[2]
+
+
+def _extract(values: pa.Array | pa.ChunkedArray, pattern: str) -> pa.Array:
+    """REGEXP_EXTRACT - the "value" group of the first match (null if there is no match)"""
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+
+    return pc.struct_field(pc.extract_regex(values, pattern), [0])
+
+
+def _extract_all(values: pa.Array | pa.ChunkedArray, pattern: str) -> pa.ListArray:
+    """
+    REGEXP_EXTRACT_ALL - the "value" group of all the (non-overlapping) matches, in their order (empty list for a null)
+
+    Arrow has no kernel extracting all the matches - every pass extracts the first match of each row & the rest of
+    the row after it, and the next pass continues with the rows that matched (as many passes as the most matches in
+    a single row)
+    """
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+
+    first_match_pattern = f"(?s)^.*?{pattern}(?P<rest>.*)$"
+
+    matched_rows, matched_values = [np.empty(0, dtype=np.int64)], [pa.array([], type=values.type)]
+    remaining_rows, remaining_values = np.arange(len(values)), values
+    while len(remaining_values) > 0:
+        matches = pc.extract_regex(remaining_values, first_match_pattern)
+        matched = pc.is_valid(matches)
+
+        remaining_rows = remaining_rows[matched.to_numpy(zero_copy_only=False)]
+        matches = matches.filter(matched)
+
+        matched_rows.append(remaining_rows)
+        matched_values.append(pc.struct_field(matches, [0]))
+        remaining_values = pc.struct_field(matches, [1])
+
+    # Matches of the later passes go behind the earlier matches of the same row
+    rows = np.concatenate(matched_rows)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(values)))])
+
+    return pa.ListArray.from_arrays(pa.array(offsets, type=pa.int32()),
+                                    pa.concat_arrays(matched_values).take(np.argsort(rows, kind='stable')))
+
+
+def _constant(value: int, rows: int) -> pa.Array:
+    return pa.array(np.full(rows, value, dtype=np.int64))
+
+
+def _count_distinct_per_domain(urls: pa.ChunkedArray, url_domains: pa.ChunkedArray,
+                               domains_to_count: pa.ChunkedArray) -> pa.Array:
+    """
+    COUNT(DISTINCT url) OVER (PARTITION BY url_domain) - rows without url_domain make up a partition as well
+
+    :param urls: URLs to count
+    :param url_domains: url_domain of every URL
+    :param domains_to_count: url_domain of every row the count is wanted for
+    """
+    counts = pa.table({'url_domain': url_domains, 'url': urls}) \
+        .group_by('url_domain').aggregate([('url', 'count_distinct')])
+
+    counts_idx = pc.index_in(domains_to_count, value_set=counts['url_domain'].combine_chunks(), skip_nulls=False)
+    return pc.take(counts['url_count_distinct'], counts_idx).combine_chunks()
+
+
+def _extract_report_to_header(resp_headers: pa.ChunkedArray, nel_report_to: pa.ChunkedArray) -> pa.Array:
+    """
+    The Report-To header value of the group named by NEL report_to - the regex differs per report_to value, so the
+    rows are matched one report_to value at a time
+    """
+    nel_report_to = pc.dictionary_encode(nel_report_to.combine_chunks())
+    rt_values = np.full(len(nel_report_to), None, dtype=object)
+
+    for group_idx, report_to in enumerate(nel_report_to.dictionary.to_pylist()):
+        rows = np.flatnonzero(pc.fill_null(pc.equal(nel_report_to.indices, group_idx), False)
+                              .to_numpy(zero_copy_only=False))
+        try:
+            rt_values[rows] = _extract(pc.take(resp_headers, rows),
+                                       RT_HEADER_PATTERN_PREFIX + report_to + RT_HEADER_PATTERN_SUFFIX) \
+                .to_numpy(zero_copy_only=False)
+        except pa.ArrowInvalid:
+            # Not a valid regular expression
+            pass
+
+    return pa.array(rt_values, type=pa.string())
+
+
+def _reg_domains(domains: pa.Array, psl_resolver: PslResolver | None) -> pa.Array:
+    """NET.REG_DOMAIN - null for public suffixes (and for all the domains without a PSL)"""
+    if psl_resolver is None:
+        return pa.nulls(len(domains), type=pa.string())
+
+    def reg_domain(domain: str | None) -> str | None:
+        registrable = psl_resolver.resolve(domain)
+        # A public suffix resolves to itself - and so does any subdomain of it (e.g. "_.co.uk")
+        if registrable is None or psl_resolver.resolve(f"_.{registrable}") != registrable:
+            return None
+        return registrable
+
+    encoded_domains = pc.dictionary_encode(domains)
+    return pc.take(pa.array([reg_domain(domain) for domain in encoded_domains.dictionary.to_pylist()],
+                            type=pa.string()),
+                   encoded_domains.indices)
+
+
+def _registrable_domains(domains: pa.Array | pa.ChunkedArray, psl_resolver: PslResolver | None) -> pa.Array:
+    """IFNULL(NET.REG_DOMAIN(domain), REGEXP_EXTRACT(domain, TLD + second to last domain label))"""
+    if isinstance(domains, pa.ChunkedArray):
+        domains = domains.combine_chunks()
+
+    return pc.coalesce(_reg_domains(domains, psl_resolver), _extract(domains, REGISTRABLE_DOMAIN_FALLBACK_PATTERN))
+
+
+def _registrable_collectors(rt_collectors: pa.ListArray, psl_resolver: PslResolver | None) -> pa.ListArray:
+    """Registrable domains of the collectors - falling back to the collector itself and then to an empty string"""
+    collectors = rt_collectors.flatten()
+    registrable = pc.coalesce(_registrable_domains(collectors, psl_resolver), collectors, "")
+
+    return pa.ListArray.from_arrays(rt_collectors.offsets, registrable)
+
+
+def _normalize_fraction(fraction: pa.ChunkedArray, default: str) -> pa.ChunkedArray:
+    """Make 0 and 1 (both end-values) always of length 3, null values get the default value"""
+    fraction = pc.replace_substring_regex(fraction, r"^0$", "0.0")
+    fraction = pc.replace_substring_regex(fraction, r"^1$", "1.0")
+    return pc.fill_null(fraction, default)
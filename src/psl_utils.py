@@ -1,10 +1,13 @@
 import logging
 import re
 import sys
+from io import StringIO
 from pathlib import Path
 from typing import List
 
-import publicsuffix2 as psl2
+from src.classes.AnalysisManifest import AnalysisManifest
+from src.classes.PslResolver import PslResolver
+from src.classes.RegistrableDomainMemo import RegistrableDomainMemo
 
 
 PATTERN_MULTIPLE_NEWLINES = r"\n+"
@@ -17,19 +20,19 @@ logging.basicConfig(stream=sys.stdout, level=logging.INFO,
 logger = logging.getLogger(__name__)
 
 
-def get_sld_from_custom_psl(domain, custom_psl):
-    """
-    Get the SLD of a given domain. In terms of a PSL, SLD - Second Level Domain - represents eTLD+1
+def get_psl_by_path(psl_file: Path):
+    return _read_current_psl(psl_file)
 
-    :param domain: The domain to parse SLD from
-    :param custom_psl: A parsed psl file's contents
-    :return: SLD of the given domain (eTLD+1)
-    """
-    return psl2.get_sld(domain, custom_psl, wildcard=True, idna=True, strict=False)  # Using defaults here
 
+def get_psl_files_for_specific_date(year: str, month: str, psl_dir: str, psl_files: List[Path]) -> List[Path]:
+    """Get the PSL files that make up the PSL for a specific date (see get_psl_for_specific_date)"""
+    current_psl_path = Path(f"{psl_dir}/psl_current.dat")
+    historic_psl_path = Path(f"{psl_dir}/psl_{year}_{month}.dat")
 
-def get_psl_by_path(psl_file: Path):
-    return _read_current_psl(psl_file)
+    if historic_psl_path in psl_files:
+        return [historic_psl_path, current_psl_path]
+    else:
+        return [current_psl_path]
 
 
 def get_psl_for_specific_date(year: str, month: str, psl_dir: str, psl_files: List[Path]) -> str:
@@ -43,6 +46,37 @@ def get_psl_for_specific_date(year: str, month: str, psl_dir: str, psl_files: Li
         return _read_current_psl(current_psl_path)
 
 
+def load_psl_resolver_for_specific_date(year: str, month: str, psl_dir: str, psl_files: List[Path],
+                                        cache_dir: str) -> PslResolver:
+    """
+    Get the compiled PSL for a specific date (see get_psl_for_specific_date).
+
+    Merging & compiling the PSL files is done only once for each combination of the historic & the current PSL file.
+    The compiled PSL is cached in the cache directory, keyed by the hashes of the files' contents. The domains resolved
+    with the compiled PSL are memoized in the cache directory as well (see RegistrableDomainMemo).
+
+    :param cache_dir: Directory of the compiled PSLs
+    :return: Compiled PSL
+    """
+    current_psl_hash = AnalysisManifest.file_sha256(Path(f"{psl_dir}/psl_current.dat"))
+    historic_psl_path = Path(f"{psl_dir}/psl_{year}_{month}.dat")
+    historic_psl_hash = AnalysisManifest.file_sha256(historic_psl_path) if historic_psl_path in psl_files else "none"
+
+    snapshot_id = f"v{PslResolver.FORMAT_VERSION}_{historic_psl_hash[:16]}_{current_psl_hash[:16]}"
+
+    cached_psl_path = Path(cache_dir) / f"psl_{snapshot_id}.arrow"
+    if cached_psl_path.is_file():
+        psl_resolver = PslResolver.load(cached_psl_path)
+    else:
+        psl_resolver = PslResolver(StringIO(get_psl_for_specific_date(year, month, psl_dir, psl_files)))
+        psl_resolver.save(cached_psl_path)
+
+    psl_resolver.memo = RegistrableDomainMemo.load(Path(cache_dir) / f"registrable_domains_{snapshot_id}.parquet",
+                                                   snapshot_id)
+
+    return psl_resolver
+
+
 def _read_current_psl(current_psl_path: Path) -> str:
     with open(current_psl_path, "r", encoding="utf-8") as current_psl_file:
         current_psl = _parse_psl_content(current_psl_file.read())
@@ -0,0 +1,113 @@
+"""
+Conversion of the HTTP Archive month data files (nel_data_YYYY_MM.parquet) to the v2 data schema.
+
+The previous schema (PYARROW_MERGE_WRITE_SCHEMA) stores counts, HTTP status and NEL field values as dictionary encoded
+strings - every reader has to parse them. The v2 schema (PYARROW_MERGE_WRITE_SCHEMA_V2) stores them as numbers
+(and include_subdomains as a bool). Malformed values (e.g. a failure_fraction of "1.0.0" or an out of range max_age)
+are converted to nulls.
+"""
+
+import os
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src.data_schemas import PYARROW_MERGE_WRITE_SCHEMA_V2, NEL_DATA_SCHEMA_VERSION_METADATA_KEY
+from src.month_totals import month_totals_from_table, with_month_totals
+
+
+def is_schema_v2(schema: pa.Schema) -> bool:
+    """Check whether a month data file's schema is the v2 one"""
+    return (schema.metadata or {}).get(NEL_DATA_SCHEMA_VERSION_METADATA_KEY) == \
+        PYARROW_MERGE_WRITE_SCHEMA_V2.metadata[NEL_DATA_SCHEMA_VERSION_METADATA_KEY]
+
+
+def to_schema_v2(table: pa.Table) -> pa.Table:
+    """
+    Convert month data to the v2 schema
+
+    :param table: Month data read with PYARROW_MERGE_READ_SCHEMA or PYARROW_MERGE_WRITE_SCHEMA
+    :return: The same data in PYARROW_MERGE_WRITE_SCHEMA_V2
+    """
+    columns = []
+    for field in PYARROW_MERGE_WRITE_SCHEMA_V2:
+        column = table.column(field.name)
+        columns.append(pa.chunked_array([_convert_array(chunk, field.type) for chunk in column.chunks],
+                                        type=field.type))
+
+    return pa.table(columns, schema=PYARROW_MERGE_WRITE_SCHEMA_V2)
+
+
+def migrate_month_file(input_file: str | Path, output_file: str | Path | None = None) -> bool:
+    """
+    Rewrite a month data file in the v2 schema - one row group at a time (the whole file is never loaded at once).
+    The month totals are kept in (or added to) the footer of the migrated file.
+
+    :param input_file: Month data file to migrate
+    :param output_file: Where to write the migrated file (default = replace the input file)
+    :return: False if the file already is in the v2 schema (nothing is written)
+    """
+    output_file = Path(output_file if output_file is not None else input_file)
+    temp_file_path = output_file.with_name(f"{output_file.name}.{os.getpid()}.tmp")
+
+    with pq.ParquetFile(input_file) as parquet:
+        if is_schema_v2(parquet.schema_arrow):
+            return False
+
+        writer = None
+        try:
+            for row_group in range(parquet.num_row_groups):
+                table = to_schema_v2(parquet.read_row_group(row_group))
+
+                if writer is None:
+                    # Writer is opened with the first non-empty row group - the month totals are needed in its schema
+                    month_totals = month_totals_from_table(table)
+                    if month_totals is not None or row_group == parquet.num_row_groups - 1:
+                        writer = pq.ParquetWriter(temp_file_path,
+                                                  schema=with_month_totals(PYARROW_MERGE_WRITE_SCHEMA_V2, month_totals))
+
+                if writer is not None:
+                    writer.write_table(table)
+
+            if writer is None:
+                writer = pq.ParquetWriter(temp_file_path, schema=PYARROW_MERGE_WRITE_SCHEMA_V2)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    os.replace(temp_file_path, output_file)
+    return True
+
+
+def _convert_array(array: pa.Array, target_type: pa.DataType) -> pa.Array:
+    if array.type == target_type:
+        return array
+
+    if pa.types.is_dictionary(target_type) or not (pa.types.is_dictionary(array.type)
+                                                   or pa.types.is_string(array.type)):
+        return pc.cast(array, target_type)
+
+    # Parse only the unique values (the dictionary) of a string column
+    if not pa.types.is_dictionary(array.type):
+        array = pc.dictionary_encode(array)
+
+    return pc.take(_parse_values(array.dictionary, target_type), array.indices)
+
+
+def _parse_values(values: pa.Array, target_type: pa.DataType) -> pa.Array:
+    try:
+        return pc.cast(values, target_type)
+    except pa.ArrowInvalid:
+        # Malformed values present - parse value by value
+        pass
+
+    parsed_values = []
+    for value in values:
+        try:
+            parsed_values.append(value.cast(target_type).as_py())
+        except pa.ArrowInvalid:
+            parsed_values.append(None)
+
+    return pa.array(parsed_values, type=target_type)
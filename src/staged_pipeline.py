@@ -0,0 +1,45 @@
+"""
+Two-stage pipeline overlapping the stages of consecutive items.
+
+The first stage of the items runs in a background thread (one item at a time, in order) while the calling thread runs
+the second stage of the items (in order as well). The first stage can run ahead of the second one by at most `depth`
+items - e.g. the next month is queried & exported in BigQuery while the current month is being downloaded & merged.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Iterable, Tuple
+
+
+def run_overlapped(items: Iterable[Any], first_stage: Callable[[Any], Any], second_stage: Callable[[Any, Any], None],
+                   depth: int = 1):
+    """
+    Run both stages for every item, overlapping the first stage of the next items with the second stage of an item
+
+    :param items: Items to process
+    :param first_stage: Called with an item (in a background thread) - its result is passed to the second stage
+    :param second_stage: Called with an item and the result of its first stage (in the calling thread)
+    :param depth: Max. number of items the first stage can run ahead of the second stage (0 = no overlap)
+    """
+    if depth < 0:
+        raise ValueError(f"Pipeline depth must not be negative (got {depth})")
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending: Deque[Tuple[Any, Future]] = deque()
+
+        try:
+            for item in items:
+                pending.append((item, executor.submit(first_stage, item)))
+
+                if len(pending) > depth:
+                    item, first_stage_job = pending.popleft()
+                    second_stage(item, first_stage_job.result())
+
+            while len(pending) > 0:
+                item, first_stage_job = pending.popleft()
+                second_stage(item, first_stage_job.result())
+
+        finally:
+            # Do not start the first stage of any other item after a failure
+            for _, first_stage_job in pending:
+                first_stage_job.cancel()
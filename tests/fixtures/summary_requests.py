@@ -0,0 +1,25 @@
+import pyarrow as pa
+
+from src.nel_extraction import SUMMARY_REQUESTS_SCHEMA
+
+NEL_HEADER = 'nel = {"report_to":"default","max_age":86400,"include_subdomains":true, "failure_fraction": 1}'
+REPORT_TO_HEADER = 'report-to = {"group":"default","max_age":86400,"endpoints":[' \
+                   '{"url":"https://nel.example-cdn.com/report"},{"url":"https:\\/\\/b.report-uri.co.uk\\/x"}]}'
+
+
+def summary_requests() -> pa.Table:
+    """summary_requests rows of a month - 2 resources with a correct NEL, 1 with an incorrect one, 2 without NEL"""
+    rows = [
+        (1, True, 'html', 'html', 'https://www.example.com/', 200,
+         f'Content-Type = text/html, {NEL_HEADER}, {REPORT_TO_HEADER}'),
+        (2, False, 'script', 'js', 'https://www.example.com/a.js', 200, f'X = y, {NEL_HEADER}, {REPORT_TO_HEADER}'),
+        # Latest request of the same URL
+        (3, False, 'script', 'js', 'https://www.example.com/a.js', 200, f'{NEL_HEADER}, {REPORT_TO_HEADER}'),
+        (4, False, 'css', 'css', 'https://static.other.org/s.css', 200, 'content-type = text/css'),
+        # NEL report_to does not name any Report-To group
+        (5, False, 'image', 'png', 'http://bad.org:8080/i.png', 404,
+         'NEL = {"report_to":"missing"}, report-to = {"group":"other"}'),
+        (6, True, 'html', 'html', 'https://www.example.com/b', 200, None),
+    ]
+
+    return pa.table(list(zip(*rows)), schema=SUMMARY_REQUESTS_SCHEMA)
@@ -0,0 +1,72 @@
+import os
+
+from src.classes.AnalysisManifest import AnalysisManifest
+
+
+class TestAnalysisManifest:
+
+    @staticmethod
+    def setup_month(tmp_path):
+        input_file = tmp_path / "nel_data_2024_01.parquet"
+        input_file.write_bytes(b"month data")
+
+        output_file = tmp_path / "nel_deployment" / "2024-01.parquet"
+        output_file.parent.mkdir()
+        output_file.write_bytes(b"result")
+
+        return input_file, output_file
+
+    def test_is_stale__unknown_metric(self, tmp_path):
+        input_file, output_file = self.setup_month(tmp_path)
+        manifest = AnalysisManifest(tmp_path / "manifest.json")
+
+        assert manifest.is_stale("2024-01", "nel_deployment", 1, manifest.fingerprint(input_file), None, [output_file])
+
+    def test_is_stale__recorded_metric_is_up_to_date_after_reload(self, tmp_path):
+        input_file, output_file = self.setup_month(tmp_path)
+        manifest = AnalysisManifest(tmp_path / "manifest.json")
+        fingerprint = manifest.fingerprint(input_file)
+
+        manifest.record("2024-01", "nel_deployment", 1, fingerprint, [], None)
+        manifest.save()
+
+        reloaded = AnalysisManifest.load(tmp_path / "manifest.json")
+        assert not reloaded.is_stale("2024-01", "nel_deployment", 1, reloaded.fingerprint(input_file), None,
+                                     [output_file])
+
+    def test_is_stale__changed_version_psl_or_missing_output(self, tmp_path):
+        input_file, output_file = self.setup_month(tmp_path)
+        manifest = AnalysisManifest(tmp_path / "manifest.json")
+        fingerprint = manifest.fingerprint(input_file)
+
+        manifest.record("2024-01", "nel_collector_provider_usage", 1, fingerprint, [], "psl-digest")
+
+        assert manifest.is_stale("2024-01", "nel_collector_provider_usage", 2, fingerprint, "psl-digest",
+                                 [output_file])
+        assert manifest.is_stale("2024-01", "nel_collector_provider_usage", 1, fingerprint, "other-psl-digest",
+                                 [output_file])
+        assert manifest.is_stale("2024-01", "nel_collector_provider_usage", 1, fingerprint, "psl-digest",
+                                 [tmp_path / "missing.parquet"])
+
+    def test_is_stale__touched_input_stays_up_to_date_changed_input_does_not(self, tmp_path):
+        input_file, output_file = self.setup_month(tmp_path)
+        manifest = AnalysisManifest(tmp_path / "manifest.json")
+        manifest.record("2024-01", "nel_deployment", 1, manifest.fingerprint(input_file), [], None)
+
+        stat = input_file.stat()
+        os.utime(input_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert not manifest.is_stale("2024-01", "nel_deployment", 1, manifest.fingerprint(input_file), None,
+                                     [output_file])
+
+        input_file.write_bytes(b"re-downloaded month data")
+        assert manifest.is_stale("2024-01", "nel_deployment", 1, manifest.fingerprint(input_file), None,
+                                 [output_file])
+
+    def test_get_state(self, tmp_path):
+        input_file, _ = self.setup_month(tmp_path)
+        manifest = AnalysisManifest(tmp_path / "manifest.json")
+        manifest.record("2024-01", "nel_collector_provider_usage", 1, manifest.fingerprint(input_file), [], None,
+                        new_providers=["example.com"])
+
+        assert manifest.get_state("2024-01", "nel_collector_provider_usage", "new_providers") == ["example.com"]
+        assert manifest.get_state("2024-02", "nel_collector_provider_usage", "new_providers", []) == []
@@ -0,0 +1,236 @@
+import asyncio
+
+import pytest
+
+from src.classes.BrowserPool import BrowserPool
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+class StandInContext:
+
+    def __init__(self):
+        self.handlers = {}
+        self.closed = False
+
+    def on(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    async def new_page(self):
+        for handler in self.handlers.get("page", []):
+            handler(object())
+
+    async def close(self):
+        self.closed = True
+
+
+class StandInBrowser:
+
+    def __init__(self, idx):
+        self.idx = idx
+        self.contexts = []
+        self.closed = False
+        self.connected = True
+        self.failing_close = False
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self, **_):
+        if not self.connected:
+            raise RuntimeError("Browser has been closed")
+
+        self.contexts.append(StandInContext())
+        return self.contexts[-1]
+
+    async def close(self):
+        if self.failing_close:
+            raise RuntimeError("Browser failed to close")
+
+        self.closed = True
+
+
+class StandInProcess:
+
+    def __init__(self, pid, parent_pid):
+        self.pid = pid
+        self.parent_pid = parent_pid
+
+    def __eq__(self, other):
+        return self.pid == other.pid
+
+    def __hash__(self):
+        return self.pid
+
+    def ppid(self):
+        return self.parent_pid
+
+
+class StandInLauncher:
+
+    def __init__(self):
+        self.browsers = []
+        self.failing = False
+
+    async def launch(self):
+        await asyncio.sleep(0)
+        if self.failing:
+            raise RuntimeError("Browser failed to launch")
+
+        self.browsers.append(StandInBrowser(len(self.browsers)))
+        return self.browsers[-1]
+
+
+class TestBrowserPool:
+
+    @pytest.mark.asyncio
+    async def test_context__fresh_context_of_a_pooled_browser(self):
+        launcher = StandInLauncher()
+
+        async with BrowserPool(launcher.launch, 2) as pool:
+            for _ in range(5):
+                async with pool.context() as ctx:
+                    assert not ctx.closed
+
+            assert len(launcher.browsers) == 2
+            assert sum(len(browser.contexts) for browser in launcher.browsers) == 5
+            assert all(ctx.closed for browser in launcher.browsers for ctx in browser.contexts)
+
+        assert all(browser.closed for browser in launcher.browsers)
+
+    @pytest.mark.asyncio
+    async def test_context__least_busy_browser(self):
+        launcher = StandInLauncher()
+
+        async with BrowserPool(launcher.launch, 2) as pool:
+            async with pool.context(), pool.context(), pool.context():
+                assert sorted(len(browser.contexts) for browser in launcher.browsers) == [1, 2]
+
+    @pytest.mark.asyncio
+    async def test_context__recycled_by_page_count(self):
+        launcher = StandInLauncher()
+
+        async with BrowserPool(launcher.launch, 1, max_pages=3) as pool:
+            async with pool.context() as ctx:
+                await ctx.new_page()
+                await ctx.new_page()
+            assert len(launcher.browsers) == 1
+
+            async with pool.context() as ctx:
+                await ctx.new_page()
+
+            assert len(launcher.browsers) == 2
+            assert launcher.browsers[0].closed
+            assert not launcher.browsers[1].closed
+
+    @pytest.mark.asyncio
+    async def test_context__retired_browser_closed_after_its_last_context(self):
+        launcher = StandInLauncher()
+
+        async with BrowserPool(launcher.launch, 1, max_pages=1) as pool:
+            async with pool.context() as long_ctx:
+                async with pool.context() as ctx:
+                    await ctx.new_page()
+
+                # Recycled, but a context of the browser is still open
+                assert len(launcher.browsers) == 2
+                assert not launcher.browsers[0].closed
+
+                async with pool.context():
+                    assert len(launcher.browsers[1].contexts) == 1
+
+                assert not long_ctx.closed
+
+            assert launcher.browsers[0].closed
+            assert not launcher.browsers[1].closed
+
+    @pytest.mark.asyncio
+    async def test_context__recycled_by_rss(self, monkeypatch):
+        launcher = StandInLauncher()
+        browser_rss = {}
+        monkeypatch.setattr("src.classes.BrowserPool._descendant_processes", lambda: set())
+        monkeypatch.setattr(BrowserPool, "_browser_rss",
+                            staticmethod(lambda pooled_browser: browser_rss[pooled_browser.browser.idx]))
+
+        async with BrowserPool(launcher.launch, 1, max_rss=100) as pool:
+            browser_rss[0] = 100
+            async with pool.context():
+                pass
+            assert len(launcher.browsers) == 1
+
+            browser_rss[0] = 101
+            async with pool.context():
+                pass
+            assert len(launcher.browsers) == 2
+            assert launcher.browsers[0].closed
+
+    @pytest.mark.asyncio
+    async def test_start__root_processes_of_the_launched_browser(self, monkeypatch):
+        launcher = StandInLauncher()
+
+        def descendant_processes():
+            processes = {StandInProcess(10, 1)}  # The driver
+            if len(launcher.browsers) >= 1:
+                processes |= {StandInProcess(20, 10), StandInProcess(21, 20)}
+            if len(launcher.browsers) >= 2:
+                # The first browser starts a renderer while the second one is launched
+                processes |= {StandInProcess(22, 20), StandInProcess(30, 10), StandInProcess(31, 30)}
+            return processes
+
+        monkeypatch.setattr("src.classes.BrowserPool._descendant_processes", descendant_processes)
+
+        async with BrowserPool(launcher.launch, 2, max_rss=100) as pool:
+            assert sorted([process.pid for process in pooled_browser.processes]
+                          for pooled_browser in pool._browsers) == [[20], [30]]
+
+    @pytest.mark.asyncio
+    async def test_close__browsers_closed_despite_a_failed_close(self):
+        launcher = StandInLauncher()
+
+        async with BrowserPool(launcher.launch, 3) as pool:
+            launcher.browsers[0].failing_close = True
+
+        assert pool._browsers == []
+        assert not launcher.browsers[0].closed
+        assert launcher.browsers[1].closed and launcher.browsers[2].closed
+
+    @pytest.mark.asyncio
+    async def test_context__disconnected_browser_replaced(self):
+        launcher = StandInLauncher()
+
+        async with BrowserPool(launcher.launch, 1) as pool:
+            async with pool.context():
+                pass
+
+            launcher.browsers[0].connected = False  # Crashed
+
+            async with pool.context(), pool.context():
+                assert len(launcher.browsers) == 2
+                assert len(launcher.browsers[1].contexts) == 2
+
+            assert launcher.browsers[0].closed
+
+    @pytest.mark.asyncio
+    async def test_context__failed_recycling_launch(self):
+        launcher = StandInLauncher()
+
+        async with BrowserPool(launcher.launch, 1, max_pages=1) as pool:
+            launcher.failing = True
+
+            # The crawl's own error is not replaced by the failed launch of the replacement
+            with pytest.raises(ValueError):
+                async with pool.context() as ctx:
+                    await ctx.new_page()
+                    raise ValueError("Crawl failed")
+
+            # The browser is still used & its recycling is retried
+            launcher.failing = False
+            async with pool.context():
+                assert len(launcher.browsers[0].contexts) == 2
+
+            assert len(launcher.browsers) == 2
+            assert launcher.browsers[0].closed
+
+    def test_init__empty_pool(self):
+        with pytest.raises(ValueError):
+            BrowserPool(StandInLauncher().launch, 0)
@@ -0,0 +1,89 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.classes.CollectorProviderIndex import CollectorProviderIndex
+
+
+class TestCollectorProviderIndex:
+
+    def test_providers_before__ordered_by_first_occurrence(self):
+        index = CollectorProviderIndex()
+        index.register_month("2024-01", ["b.com", "a.com", "b.com"])
+        index.register_month("2024-02", ["a.com", "c.com", None])
+        index.register_month("2024-03", ["d.com"])
+
+        assert index.providers_before("2024-01").tolist() == []
+        assert index.providers_before("2024-02").tolist() == ["b.com", "a.com"]
+        assert index.providers_before("2024-03").tolist() == ["b.com", "a.com", "c.com"]
+        assert index.providers_before("2024-04").tolist() == ["b.com", "a.com", "c.com", "d.com"]
+
+    def test_save_and_load(self, tmp_path):
+        index = CollectorProviderIndex()
+        index.register_month("2024-01", ["b.com", "a.com"])
+        index.register_month("2024-02", [])
+        index.save(tmp_path / "index.parquet")
+
+        loaded = CollectorProviderIndex.load(tmp_path / "index.parquet")
+
+        assert loaded.get_registered_months() == ["2024-01", "2024-02"]
+        assert loaded.providers_before("2024-03").tolist() == ["b.com", "a.com"]
+        assert loaded.providers_before_digest("2024-03") == index.providers_before_digest("2024-03")
+
+    def test_load__missing_file(self, tmp_path):
+        index = CollectorProviderIndex.load(tmp_path / "missing.parquet")
+
+        assert index.get_registered_months() == []
+        assert index.providers_before("2024-01").tolist() == []
+
+    def test_register_month__out_of_order_registration_moves_first_occurrence(self):
+        index = CollectorProviderIndex()
+        index.register_month("2024-01", ["a.com"])
+        index.register_month("2024-03", ["c.com", "b.com"])
+
+        # Re-analyzed (or newly added) earlier month containing a provider seen later
+        new_providers = index.register_month("2024-02", ["b.com", "a.com"])
+
+        assert new_providers == ["b.com"]
+        assert index.providers_before("2024-04").tolist() == ["a.com", "b.com", "c.com"]
+
+    def test_register_month__re_registration_replaces_month(self):
+        index = CollectorProviderIndex()
+        index.register_month("2024-01", ["a.com", "b.com"])
+        index.register_month("2024-01", ["c.com"])
+
+        assert index.providers_before("2024-02").tolist() == ["c.com"]
+
+    def test_register_month__provider_dropped_from_first_month_kept_from_later_month(self):
+        index = CollectorProviderIndex()
+        index.register_month("2024-01", ["a.com", "p.com"])
+        index.register_month("2024-02", ["b.com"])
+        index.register_month("2024-03", ["p.com", "c.com"])
+
+        # Re-analyzed first month (e.g. a --months run) no longer containing p.com
+        index.register_month("2024-01", ["a.com"])
+
+        assert index.providers_before("2024-03").tolist() == ["a.com", "b.com"]
+        assert index.providers_before("2024-04").tolist() == ["a.com", "b.com", "p.com", "c.com"]
+
+    def test_load__first_occurrences_index(self, tmp_path):
+        pq.write_table(pa.table({
+            'provider': ["b.com", "a.com"],
+            'first_seen': ["2024-01", "2024-02"],
+            'position': pa.array([0, 0], type=pa.uint32()),
+        }), tmp_path / "index.parquet")
+
+        index = CollectorProviderIndex.load(tmp_path / "index.parquet")
+
+        assert index.providers_before("2024-03").tolist() == ["b.com", "a.com"]
+
+    def test_unregister_month(self):
+        index = CollectorProviderIndex()
+        index.register_month("2024-01", ["a.com"])
+        index.register_month("2024-02", ["b.com"])
+        digest_before = index.providers_before_digest("2024-03")
+
+        index.unregister_month("2024-01")
+
+        assert not index.is_registered("2024-01")
+        assert index.providers_before("2024-03").tolist() == ["b.com"]
+        assert index.providers_before_digest("2024-03") != digest_before
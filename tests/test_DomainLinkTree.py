@@ -258,3 +258,49 @@ class TestDomainLinkRegistry:
             next_link = link_tree.get_next()
 
         assert link_tree.get_visited_links_count() == 7 + 1  # 7 from explicit input + 1 base domain link
+
+    def test_get_next__links_added_while_traversing_keep_breadth_first_order(self):
+        link_tree = DomainLinkTree("test.com", ['events', 'events/123'])
+
+        assert link_tree.get_next() == "https://test.com"
+        assert link_tree.get_next() == "https://test.com/events"
+
+        # A shallower link added later still goes before the deeper ones
+        link_tree.add(['news', 'events/123', 'events/XYZ'])
+
+        assert link_tree.get_next() == "https://test.com/news"
+        assert link_tree.get_next() == "https://test.com/events/123"
+        assert link_tree.get_next() == "https://test.com/events/XYZ"
+        assert link_tree.get_next() is None
+        assert link_tree.get_visited_links_count() == 5
+
+    def test_get_next__structure_node_converted_to_link_node_moves_after_its_siblings(self):
+        link_tree = DomainLinkTree("test.com", ['a/x', 'b', 'b/y'])
+        link_tree.add(['a'])
+
+        link_order = []
+        next_link = link_tree.get_next()
+        while next_link is not None:
+            link_order.append(next_link)
+            next_link = link_tree.get_next()
+
+        assert link_order == [
+            "https://test.com",
+            "https://test.com/b",
+            "https://test.com/a",
+            "https://test.com/b/y",
+            "https://test.com/a/x",
+        ]
+
+    def test_add__compact_nodes(self):
+        link_tree = DomainLinkTree("test.com", ["news/2024/1", "sport/2024/2", "about"])
+
+        news_2024_node = link_tree.get_root().get_child_by_label('news').get_child_by_label('2024')
+        sport_2024_node = link_tree.get_root().get_child_by_label('sport').get_child_by_label('2024')
+        about_node = link_tree.get_root().get_child_by_label('about')
+
+        # Slotted nodes (no per-instance __dict__), a single copy of every label, no children dict for leaf nodes
+        assert not hasattr(news_2024_node, '__dict__') and not hasattr(about_node, '__dict__')
+        assert news_2024_node.label is sport_2024_node.label
+        assert len(about_node.children) == 0
+        assert about_node.children is news_2024_node.get_child_by_label('1').children
@@ -1,3 +1,4 @@
+import pandas as pd
 from pandas import DataFrame
 
 from tests.fixtures.nel_data import (
@@ -9,6 +10,8 @@ from tests.fixtures.nel_data import (
     crawled_domain_resources_with_inconsistently_correct_nel
 )
 from src.classes.DomainNelDataRegistry import DomainNelDataRegistry
+from src.crawling_utils import ResponseData
+from src.month_totals import read_month_totals
 
 
 class TestCrawledDomainNelRegistry:
@@ -77,3 +80,54 @@ class TestCrawledDomainNelRegistry:
         registry = self.setup_registry(crawled_domain_resources_with_inconsistently_correct_nel)
 
         assert 2 == registry._calculate_total_crawled_domains_with_correct_nel()
+
+    def test_save__month_totals_in_footer(self, tmp_path):
+        registry = DomainNelDataRegistry()
+        registry.insert("example.com", ResponseData("https://example.com/", 200, {
+            "nel": '{"report_to": "default", "max_age": 86400}',
+            "report-to": '{"group": "default", "max_age": 86400, "endpoints": [{"url": "https://report.domain"}]}',
+        }))
+        registry.insert("example.com", ResponseData("https://example.com/about", 200, {}))
+        registry.insert("test.com", ResponseData("https://test.com/", 200, {}))
+        registry.count_totals()
+
+        registry.save(tmp_path / "nel_data.parquet")
+
+        month_totals = read_month_totals(tmp_path / "nel_data.parquet")
+        saved = pd.read_parquet(tmp_path / "nel_data.parquet")
+        assert month_totals.iloc[0].tolist() == [3, 2, 1, 1, 1, 1]
+        assert month_totals.iloc[0].tolist() == saved[month_totals.columns].iloc[0].tolist()
+        assert month_totals.dtypes.tolist() == saved[month_totals.columns].dtypes.tolist()
+
+    def test_insert__duplicate_urls_skipped(self):
+        registry = DomainNelDataRegistry()
+        registry.insert("example.com", ResponseData("https://example.com/", 200, {}))
+        registry.insert("example.com", ResponseData("https://example.com/about", 200, {}))
+        registry.insert("example.com", ResponseData("https://example.com", 404, {}))
+        registry.insert("example.com", ResponseData("https://example.com/about/", 200, {}))
+
+        assert registry._data['url'].tolist() == ["https://example.com", "https://example.com/about"]
+        assert registry._data['status'].tolist() == [200, 200]
+        assert registry._total_crawled_resources == 2
+
+        # Rows inserted after the data was built are appended to it
+        registry.insert("example.com", ResponseData("https://example.com/news", 200, {}))
+        registry.insert("example.com", ResponseData("https://example.com/about", 200, {}))
+
+        assert registry._data['url'].tolist() == ["https://example.com", "https://example.com/about",
+                                                  "https://example.com/news"]
+        assert registry._data.dtypes.astype(str).to_dict() == DomainNelDataRegistry.DF_SCHEMA
+
+    def test_concat_content__rows_in_order(self, tmp_path):
+        registry = DomainNelDataRegistry()
+        registry.insert("example.com", ResponseData("https://example.com/", 200, {}))
+        registry.save_raw(tmp_path / "example.com.parquet")
+
+        merged = DomainNelDataRegistry()
+        merged.insert("test.com", ResponseData("https://test.com/", 200, {}))
+        merged.concat_content(DomainNelDataRegistry.read_raw(tmp_path / "example.com.parquet"))
+        merged.insert("test.com", ResponseData("https://test.com/about", 200, {}))
+        merged.insert("example.com", ResponseData("https://example.com", 200, {}))
+
+        assert merged._data['url'].tolist() == ["https://test.com", "https://example.com", "https://test.com/about"]
+        assert merged._total_crawled_resources == 3
@@ -0,0 +1,110 @@
+import io
+from pathlib import Path
+
+import numpy as np
+import publicsuffix2 as psl2
+import pyarrow as pa
+
+from src import psl_utils
+from src.classes.PslResolver import PslResolver
+
+PSL_DIR = Path(__file__).parents[1] / "resources" / "public_suffix_lists"
+
+DOMAINS = [
+    "",
+    ".",
+    "com",
+    "example.com",
+    "nel.Example.COM.",
+    "report.eu.example.co.uk",
+    "co.uk",
+    "a..b.com",
+    "www.ck",
+    "x.www.ck",
+    "foo.ck",
+    "a.foo.ck",
+    "city.kobe.jp",
+    "x.city.kobe.jp",
+    "foo.bar.kobe.jp",
+    "bucket.s3.amazonaws.com",
+    "x.y.compute.amazonaws.com",
+    "blog.blogspot.com",
+    "this.local",
+    "local",
+    "xn--80ak6aa92e.xn--p1ai",
+]
+
+
+class TestPslResolver:
+
+    @staticmethod
+    def load_psl() -> io.StringIO:
+        psl = psl_utils.get_psl_for_specific_date("2022", "02", str(PSL_DIR), [PSL_DIR / "psl_2022_02.dat"])
+        return io.StringIO(psl)
+
+    def test_resolve__same_as_publicsuffix2(self):
+        psl = self.load_psl()
+        expected_psl = psl2.PublicSuffixList(psl, idna=True)
+        resolver = PslResolver.from_psl_io(psl)
+
+        for domain in DOMAINS:
+            assert resolver.resolve(domain) == expected_psl.get_sld(domain, wildcard=True, strict=False), domain
+
+    def test_resolve__rules_given_directly(self):
+        resolver = PslResolver(["com", "*.ck", "!www.ck", "// comment", "", "a.b.c"])
+
+        assert resolver.resolve("nel.example.com") == "example.com"
+        assert resolver.resolve("x.foo.ck") == "x.foo.ck"
+        assert resolver.resolve("x.www.ck") == "www.ck"
+        assert resolver.resolve("x.y.b.c") == "y.b.c"
+        assert resolver.resolve("x.unknown") == "unknown"
+        assert resolver.resolve(None) is None
+
+    def test_resolve_many(self):
+        resolver = PslResolver.from_psl_io(self.load_psl())
+        domains = ["a.example.com", None, "b.example.com", "a.example.com", "www.ck"]
+        expected = [resolver.resolve(domain) for domain in domains]
+
+        assert resolver.resolve_many(pa.array(domains)).to_pylist() == expected
+        assert resolver.resolve_many(pa.chunked_array([domains[:2], domains[2:]])).to_pylist() == expected
+        assert resolver.resolve_many(np.array(domains, dtype=object)).to_pylist() == expected
+        assert resolver.resolve_many([]).to_pylist() == []
+
+    def test_save_and_load(self, tmp_path):
+        resolver = PslResolver.from_psl_io(self.load_psl())
+        resolver.save(tmp_path / "psl.arrow")
+
+        loaded = PslResolver.load(tmp_path / "psl.arrow")
+
+        for domain in DOMAINS:
+            assert loaded.resolve(domain) == resolver.resolve(domain), domain
+
+    def test_load__nodes_decoded_on_lookup(self, tmp_path):
+        PslResolver.from_psl_io(self.load_psl()).save(tmp_path / "psl.arrow")
+
+        loaded = PslResolver.load(tmp_path / "psl.arrow")
+        assert loaded._children == {}
+
+        loaded.resolve("www.example.co.uk")
+        assert 0 < len(loaded._children) <= len("www.example.co.uk".split('.')) + 1
+
+        # Saving a loaded PSL decodes all of its nodes - the saved file is the same
+        loaded.save(tmp_path / "resaved.arrow")
+        assert (tmp_path / "resaved.arrow").read_bytes() == (tmp_path / "psl.arrow").read_bytes()
+
+    def test_load_psl_resolver_for_specific_date__cached(self, tmp_path):
+        psl_files = [PSL_DIR / "psl_2022_02.dat", PSL_DIR / "psl_current.dat"]
+
+        resolver = psl_utils.load_psl_resolver_for_specific_date("2022", "02", str(PSL_DIR), psl_files, str(tmp_path))
+        cached_psl_files = list(tmp_path.glob("*.arrow"))
+        cached_resolver = psl_utils.load_psl_resolver_for_specific_date("2022", "02", str(PSL_DIR), psl_files,
+                                                                        str(tmp_path))
+
+        assert len(cached_psl_files) == 1
+        assert list(tmp_path.glob("*.arrow")) == cached_psl_files
+        for domain in DOMAINS:
+            assert cached_resolver.resolve(domain) == resolver.resolve(domain), domain
+
+        # Month without a historic PSL -> compiled from the current PSL only
+        psl_utils.load_psl_resolver_for_specific_date("2031", "01", str(PSL_DIR), psl_files, str(tmp_path))
+        assert len(list(tmp_path.glob("*.arrow"))) == 2
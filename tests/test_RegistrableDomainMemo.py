@@ -0,0 +1,43 @@
+import pyarrow as pa
+
+from src.classes.PslResolver import PslResolver
+from src.classes.RegistrableDomainMemo import RegistrableDomainMemo
+
+
+class TestRegistrableDomainMemo:
+
+    def test_get_or_resolve__resolves_only_missing_hostnames(self, tmp_path):
+        resolver = PslResolver(["com", "co.uk"])
+        resolved = []
+
+        def resolve(hostname):
+            resolved.append(hostname)
+            return resolver.resolve(hostname)
+
+        memo = RegistrableDomainMemo.load(tmp_path / "memo.parquet", "snapshot")
+        result = memo.get_or_resolve(pa.array(["a.example.com", "b.example.co.uk", None]), resolve)
+
+        assert result.to_pylist() == ["example.com", "example.co.uk", None]
+        assert resolved == ["a.example.com", "b.example.co.uk"]
+
+        reloaded = RegistrableDomainMemo.load(tmp_path / "memo.parquet", "snapshot")
+        result = reloaded.get_or_resolve(pa.array(["c.example.com", "a.example.com"]), resolve)
+
+        assert result.to_pylist() == ["example.com", "example.com"]
+        assert resolved == ["a.example.com", "b.example.co.uk", "c.example.com"]
+        assert len(RegistrableDomainMemo.load(tmp_path / "memo.parquet", "snapshot")) == 3
+
+    def test_load__other_snapshot_is_not_used(self, tmp_path):
+        memo = RegistrableDomainMemo.load(tmp_path / "memo.parquet", "snapshot")
+        memo.get_or_resolve(pa.array(["a.example.com"]), PslResolver(["com"]).resolve)
+
+        assert len(RegistrableDomainMemo.load(tmp_path / "memo.parquet", "other-snapshot")) == 0
+
+    def test_resolver_with_memo(self, tmp_path):
+        resolver = PslResolver(["com"])
+        resolver.memo = RegistrableDomainMemo.load(tmp_path / "memo.parquet", "snapshot")
+
+        domains = pa.array(["x.a.com", "y.b.com", "x.a.com", None])
+
+        assert resolver.resolve_many(domains).to_pylist() == ["a.com", "b.com", "a.com", None]
+        assert len(resolver.memo) == 2
@@ -0,0 +1,72 @@
+from src.blob_download import download_blobs, file_md5_hash, is_blob_downloaded
+from src.classes.LocalDirectoryBucket import LocalDirectoryBucket
+
+
+def make_bucket(tmp_path) -> LocalDirectoryBucket:
+    bucket_dir = tmp_path / "bucket"
+    bucket_dir.mkdir()
+    for blob_idx in range(5):
+        (bucket_dir / f"nel_data_2024_01-{blob_idx:08}.parquet.snappy").write_bytes(bytes([blob_idx]) * 1000)
+    (bucket_dir / "nel_data_2024_02-00000000.parquet.snappy").write_bytes(b"other month")
+
+    return LocalDirectoryBucket(bucket_dir)
+
+
+class TestBlobDownload:
+
+    def test_download_blobs(self, tmp_path):
+        bucket = make_bucket(tmp_path)
+        destination_dir = tmp_path / "blobs"
+
+        report = download_blobs(bucket, "nel_data_2024_01", destination_dir, workers=3)
+
+        assert (report.downloaded_blobs, report.skipped_blobs, report.downloaded_bytes) == (5, 0, 5000)
+        assert report.throughput > 0
+        assert sorted(path.name for path in destination_dir.iterdir()) == \
+            [blob.name for blob in bucket.list_blobs("nel_data_2024_01")]
+        for blob in bucket.list_blobs("nel_data_2024_01"):
+            assert is_blob_downloaded(blob, destination_dir / blob.name)
+
+    def test_download_blobs__resumed(self, tmp_path):
+        bucket = make_bucket(tmp_path)
+        destination_dir = tmp_path / "blobs"
+        download_blobs(bucket, "nel_data_2024_01", destination_dir)
+
+        # Interrupted download: a missing blob, a corrupted blob, a partial download & a blob no longer in the bucket
+        (destination_dir / "nel_data_2024_01-00000001.parquet.snappy").unlink()
+        (destination_dir / "nel_data_2024_01-00000002.parquet.snappy").write_bytes(b"\xff" * 1000)
+        (destination_dir / "nel_data_2024_01-00000003.parquet.snappy.part").write_bytes(b"\x03" * 10)
+        (destination_dir / "nel_data_2024_01-00000099.parquet.snappy").write_bytes(b"stale")
+
+        report = download_blobs(bucket, "nel_data_2024_01", destination_dir)
+
+        assert (report.downloaded_blobs, report.skipped_blobs, report.downloaded_bytes) == (2, 3, 2000)
+        assert sorted(path.name for path in destination_dir.iterdir()) == \
+            [blob.name for blob in bucket.list_blobs("nel_data_2024_01")]
+        assert (destination_dir / "nel_data_2024_01-00000002.parquet.snappy").read_bytes() == b"\x02" * 1000
+
+    def test_file_md5_hash(self, tmp_path):
+        file_path = tmp_path / "blob"
+        file_path.write_bytes(b"")
+
+        # MD5 of an empty file, base64 encoded (as reported by Google Cloud Storage)
+        assert file_md5_hash(file_path) == "1B2M2Y8AsgTpgAmY7PhCfg=="
+
+    def test_download_blobs__on_downloaded(self, tmp_path):
+        bucket = make_bucket(tmp_path)
+        destination_dir = tmp_path / "blobs"
+        download_blobs(bucket, "nel_data_2024_01-00000000", destination_dir)
+
+        processed = []
+
+        def on_downloaded(blob_file):
+            # The blob is complete by the time it is handed over
+            assert blob_file.read_bytes() == bytes([int(blob_file.name[17:25])]) * 1000
+            processed.append(blob_file.name)
+            blob_file.unlink()
+
+        download_blobs(bucket, "nel_data_2024_01", destination_dir, workers=2, on_downloaded=on_downloaded)
+
+        # Every blob (incl. the already downloaded one) is handed over exactly once
+        assert sorted(processed) == [blob.name for blob in bucket.list_blobs("nel_data_2024_01")]
+        assert list(destination_dir.iterdir()) == []
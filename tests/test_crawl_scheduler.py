@@ -0,0 +1,132 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+
+from src.classes.WorkerRecyclingPolicy import WorkerRecyclingPolicy
+from src.crawl_scheduler import crawl_domains
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+class StandInSessions:
+    """Opens numbered sessions & records which domains each of them crawled"""
+
+    def __init__(self, delays=None, failing=(), failing_opens=(), failing_closes=()):
+        self.delays = delays or {}
+        self.failing = failing
+        self.failing_opens = failing_opens
+        self.failing_closes = failing_closes
+        self.crawled = {}
+        self.open_sessions = 0
+        self.opens = 0
+
+    @asynccontextmanager
+    async def open(self):
+        self.opens += 1
+        if self.opens in self.failing_opens:
+            raise RuntimeError(f"Session {self.opens} failed to open")
+
+        session = len(self.crawled)
+        self.crawled[session] = []
+        self.open_sessions += 1
+        try:
+            yield session
+        finally:
+            self.open_sessions -= 1
+            if session in self.failing_closes:
+                raise RuntimeError(f"Session {session} failed to close")
+
+    async def crawl(self, session, domain):
+        await asyncio.sleep(self.delays.get(domain, 0))
+        self.crawled[session].append(domain)
+        if domain in self.failing:
+            raise RuntimeError(f"{domain} failed")
+
+    def crawled_domains(self):
+        return sorted(domain for domains in self.crawled.values() for domain in domains)
+
+
+class TestCrawlScheduler:
+
+    @pytest.mark.asyncio
+    async def test_crawl_domains__every_domain_crawled_once(self):
+        sessions = StandInSessions()
+        domains = [f"{idx}.example.com" for idx in range(10)]
+
+        await crawl_domains(domains, 3, sessions.open, sessions.crawl)
+
+        assert sessions.crawled_domains() == sorted(domains)
+        assert len(sessions.crawled) == 3
+        assert sessions.open_sessions == 0
+
+    @pytest.mark.asyncio
+    async def test_crawl_domains__slow_domain_does_not_hold_up_others(self):
+        # With fixed chunks of 3 domains, 0 & 1 would follow the slow domain in its chunk (0.3 + 2 * 0.05 seconds)
+        delays = {"slow.example.com": 0.3} | {f"{idx}.example.com": 0.05 for idx in range(8)}
+        sessions = StandInSessions(delays)
+        domains = ["slow.example.com"] + [f"{idx}.example.com" for idx in range(8)]
+
+        start_time = time.monotonic()
+        await crawl_domains(domains, 3, sessions.open, sessions.crawl)
+
+        assert time.monotonic() - start_time < 0.38
+        assert [session_domains for session_domains in sessions.crawled.values()
+                if "slow.example.com" in session_domains] == [["slow.example.com"]]
+
+    @pytest.mark.asyncio
+    async def test_crawl_domains__sessions_recycled(self):
+        sessions = StandInSessions()
+        domains = [f"{idx}.example.com" for idx in range(5)]
+
+        await crawl_domains(domains, 1, sessions.open, sessions.crawl, WorkerRecyclingPolicy(max_domains=2))
+
+        assert list(sessions.crawled.values()) == [domains[0:2], domains[2:4], domains[4:]]
+        assert sessions.open_sessions == 0
+
+    @pytest.mark.asyncio
+    async def test_crawl_domains__failed_domain_skipped(self):
+        sessions = StandInSessions(failing=["1.example.com"])
+        domains = [f"{idx}.example.com" for idx in range(4)]
+
+        await crawl_domains(domains, 1, sessions.open, sessions.crawl)
+
+        assert sessions.crawled_domains() == domains
+
+    @pytest.mark.asyncio
+    async def test_crawl_domains__failed_session_open_skips_its_domain(self):
+        sessions = StandInSessions(failing_opens=[3])
+        domains = [f"{idx}.example.com" for idx in range(6)]
+
+        await crawl_domains(domains, 2, sessions.open, sessions.crawl, WorkerRecyclingPolicy(max_domains=1))
+
+        # The domain the third session was opened for is skipped, the workers crawl the rest
+        assert sessions.crawled_domains() == sorted(domains[:2] + domains[3:])
+        assert sessions.open_sessions == 0
+
+    @pytest.mark.asyncio
+    async def test_crawl_domains__failed_session_close_does_not_stop_the_crawl(self):
+        sessions = StandInSessions(failing_closes=[0, 1, 2, 3])
+        domains = [f"{idx}.example.com" for idx in range(4)]
+
+        await crawl_domains(domains, 2, sessions.open, sessions.crawl, WorkerRecyclingPolicy(max_domains=1))
+
+        assert sessions.crawled_domains() == domains
+        assert sessions.open_sessions == 0
+
+    @pytest.mark.asyncio
+    async def test_crawl_domains__no_domains(self):
+        sessions = StandInSessions()
+
+        await crawl_domains([], 3, sessions.open, sessions.crawl)
+
+        assert sessions.crawled == {}
+
+    def test_worker_recycling_policy(self):
+        assert not WorkerRecyclingPolicy().should_recycle(10 ** 6)
+        assert not WorkerRecyclingPolicy(max_domains=2).should_recycle(1)
+        assert WorkerRecyclingPolicy(max_domains=2).should_recycle(2)
+
+        with pytest.raises(ValueError):
+            WorkerRecyclingPolicy(max_domains=0)
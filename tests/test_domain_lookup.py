@@ -0,0 +1,50 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.domain_lookup import lookup_domains, _matching_row_groups
+from src.month_sort import sort_by_domain
+
+SCHEMA = pa.schema([
+    ('url_domain', pa.dictionary(pa.int32(), pa.string())),
+    ('status', pa.uint16()),
+])
+
+
+def write_month(file_path, domains: list, row_group_size: int = 2):
+    table = pa.table({'url_domain': domains, 'status': [200 + row for row in range(len(domains))]}).cast(SCHEMA)
+    pq.write_table(sort_by_domain(table), file_path, row_group_size=row_group_size)
+
+
+class TestDomainLookup:
+
+    def test_matching_row_groups__pruned_by_statistics(self, tmp_path):
+        write_month(tmp_path / "nel_data_2024_01.parquet", ['a.com', 'b.com', 'c.com', 'd.com', 'e.com', 'f.com'])
+        metadata = pq.read_metadata(tmp_path / "nel_data_2024_01.parquet")
+
+        assert _matching_row_groups(metadata, ['b.com']) == [0]
+        assert _matching_row_groups(metadata, ['b.com', 'f.com']) == [0, 2]
+        assert _matching_row_groups(metadata, ['bb.com']) == []
+
+    def test_lookup_domains(self, tmp_path):
+        write_month(tmp_path / "nel_data_2024_01.parquet", ['a.com', 'b.com', 'c.com', 'b.com'])
+        write_month(tmp_path / "nel_data_2024_02.parquet", ['b.com', 'd.com'])
+        write_month(tmp_path / "nel_data_2024_03.parquet", ['c.com'])
+
+        result = lookup_domains(['b.com', 'd.com', 'x.com'], None, tmp_path)
+
+        assert result['date'].tolist() == ['2024-01', '2024-01', '2024-02', '2024-02']
+        assert result['url_domain'].astype(str).tolist() == ['b.com', 'b.com', 'b.com', 'd.com']
+        assert result['status'].tolist() == [201, 203, 200, 201]
+
+        result = lookup_domains(['b.com'], ['2024-02', '2024-03'], tmp_path, columns=['status'])
+
+        assert result.columns.tolist() == ['date', 'status']
+        assert result['status'].tolist() == [200]
+
+    def test_lookup_domains__missing_month_skipped(self, tmp_path, caplog):
+        write_month(tmp_path / "nel_data_2024_01.parquet", ['a.com', 'b.com'])
+
+        result = lookup_domains(['b.com'], ['2024-01', '2024-02'], tmp_path, columns=['status'])
+
+        assert result['date'].tolist() == ['2024-01']
+        assert "nel_data_2024_02.parquet" in caplog.text
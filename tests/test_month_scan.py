@@ -0,0 +1,151 @@
+from typing import List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame
+
+from src.month_scan import FirstValuesPerDomain, MetricAccumulator, StreamingGroupCount, scan_month
+
+
+class RecordingMetric(MetricAccumulator):
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+        self.batches: List[DataFrame] = []
+        self.finalized = False
+
+    def consume(self, batch: DataFrame):
+        self.batches.append(batch)
+
+    def finalize(self):
+        self.finalized = True
+
+    def save(self, output_dir: str):
+        pass
+
+
+class TestMonthScan:
+
+    def test_first_values_per_domain__same_as_groupby_first(self):
+        data = DataFrame({
+            'url_domain': ['a.com', 'b.com', 'a.com', 'c.com', 'b.com', 'a.com'],
+            'nel_max_age': [None, '60', '3600', None, '120', '7200'],
+            'nel_failure_fraction': ['1.0', None, '0.5', None, '0.1', '0.2'],
+        }).astype('category')
+
+        first_values = FirstValuesPerDomain(['nel_max_age', 'nel_failure_fraction'])
+        # Split the data into batches so that the first non-null values are found in different batches
+        first_values.update(data.iloc[0:2])
+        first_values.update(data.iloc[2:4])
+        first_values.update(data.iloc[4:])
+
+        result = first_values.result()
+        expected = data.groupby('url_domain', observed=True, sort=False).first()
+
+        assert list(result.index) == ['a.com', 'b.com', 'c.com']
+        assert result['nel_max_age'].tolist() == expected['nel_max_age'].tolist()
+        assert result['nel_failure_fraction'].tolist() == expected['nel_failure_fraction'].tolist()
+        assert result.loc['c.com'].isna().all()
+
+    def test_first_values_per_domain__no_data(self):
+        result = FirstValuesPerDomain(['nel_max_age']).result()
+
+        assert result.empty
+        assert list(result.columns) == ['nel_max_age']
+
+    def test_streaming_group_count__same_as_groupby_size_with_spilling(self, tmp_path):
+        data = DataFrame({
+            'url_domain': [f'{domain_idx % 97}.com' for domain_idx in range(1000)],
+            'nel_max_age': [['60', '3600', None][row_idx % 3] for row_idx in range(1000)],
+            'nel_failure_fraction': [['1.0', '0.5'][row_idx % 2] for row_idx in range(1000)],
+        }).astype('category')
+        key_columns = ['url_domain', 'nel_max_age', 'nel_failure_fraction']
+
+        # Same categories in every batch - the keys stay categorical
+        expected = data.groupby(key_columns, observed=True).size().reset_index(name='resources')
+
+        # Tiny memory budget - the partial counts are spilled to disk after almost every batch
+        group_count = StreamingGroupCount(key_columns, 'resources', memory_budget=1024, spill_partitions=4,
+                                          spill_dir=str(tmp_path))
+        for batch_start in range(0, len(data), 64):
+            group_count.update(data.iloc[batch_start:batch_start + 64])
+
+        result = group_count.result()
+
+        assert result.equals(expected)
+        # Spill files are removed once the result is computed
+        assert list(tmp_path.iterdir()) == []
+
+    def test_streaming_group_count__different_categories_per_batch(self):
+        first_batch = DataFrame({
+            'url_domain': pd.Categorical(['b.com', 'a.com'], categories=['b.com', 'a.com']),
+            'nel_max_age': pd.Categorical(['60', '60'], categories=['60', '3600']),
+        })
+        second_batch = DataFrame({
+            'url_domain': pd.Categorical(['c.com', 'b.com'], categories=['c.com', 'b.com']),
+            'nel_max_age': pd.Categorical(['3600', '60'], categories=['3600', '60']),
+        })
+
+        group_count = StreamingGroupCount(['url_domain', 'nel_max_age'], 'resources')
+        group_count.update(first_batch)
+        group_count.update(second_batch)
+
+        result = group_count.result()
+
+        # Same as grouping the concatenated per-batch counts
+        assert result['url_domain'].dtype == object
+        assert result['nel_max_age'].cat.categories.tolist() == ['60', '3600']
+        assert result.values.tolist() == [['a.com', '60', 1], ['b.com', '60', 2], ['c.com', '3600', 1]]
+
+    def test_streaming_group_count__result_batches(self, tmp_path):
+        data = DataFrame({
+            'url_domain': [f'{domain_idx % 97}.com' for domain_idx in range(1000)],
+            'nel_max_age': [['60', '3600', None][row_idx % 3] for row_idx in range(1000)],
+        })
+        key_columns = ['url_domain', 'nel_max_age']
+
+        group_count = StreamingGroupCount(key_columns, 'resources', memory_budget=1024, spill_partitions=4,
+                                          spill_dir=str(tmp_path), category_columns=['nel_max_age'])
+        for batch_start in range(0, len(data), 64):
+            # Categories of the batch's values only - different in every batch
+            group_count.update(data.iloc[batch_start:batch_start + 64].astype('category'))
+
+        batches = list(group_count.result_batches(batch_rows=16))
+
+        # At most a batch of every sorted partition at once
+        assert all(len(batch) <= 4 * 16 for batch in batches) and len(batches) > 1
+        result = pd.concat(batches, ignore_index=True)
+        expected = data.groupby(key_columns).size().reset_index(name='resources')
+        assert result.astype({'nel_max_age': object}).equals(expected)
+        assert result['nel_max_age'].cat.categories.tolist() == ['3600', '60']
+        assert list(tmp_path.iterdir()) == []
+
+    def test_streaming_group_count__no_data(self):
+        group_count = StreamingGroupCount(['url_domain', 'nel_max_age'], 'resources')
+        group_count.update(DataFrame({'url_domain': [], 'nel_max_age': []}))
+
+        result = group_count.result()
+
+        assert result.empty
+        assert list(result.columns) == ['url_domain', 'nel_max_age', 'resources']
+
+    def test_scan_month__single_pass_feeds_every_accumulator(self, tmp_path):
+        input_file = tmp_path / "nel_data_2024_01.parquet"
+        pq.write_table(pa.table({
+            'url_domain': ['a.com', 'b.com', 'a.com', 'c.com', 'b.com'],
+            'type': ['html', 'script', 'image', 'html', 'font'],
+            'nel_max_age': ['60', '60', '60', '3600', '60'],
+        }), input_file)
+
+        types_metric = RecordingMetric(['url_domain', 'type'])
+        config_metric = RecordingMetric(['url_domain', 'nel_max_age'])
+
+        scan_month(input_file, [types_metric, config_metric], batch_size=2)
+
+        assert types_metric.finalized and config_metric.finalized
+        assert [len(batch) for batch in types_metric.batches] == [2, 2, 1]
+
+        # Each accumulator only sees the columns it asked for
+        assert all(list(batch.columns) == ['url_domain', 'type'] for batch in types_metric.batches)
+        assert all(list(batch.columns) == ['url_domain', 'nel_max_age'] for batch in config_metric.batches)
+        assert pd.concat(config_metric.batches)['nel_max_age'].tolist() == ['60', '60', '60', '3600', '60']
@@ -0,0 +1,92 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.month_sort import merge_sorted_runs, sort_by_domain, sorted_run_segments, write_sorted_run
+
+SCHEMA = pa.schema([
+    ('url_domain', pa.dictionary(pa.int32(), pa.string())),
+    ('url', pa.string()),
+])
+
+
+def month_data(domains: list) -> pa.Table:
+    return pa.table({
+        'url_domain': domains,
+        'url': [f"https://{domain}/{row}" for row, domain in enumerate(domains)],
+    }).cast(SCHEMA)
+
+
+class TestMonthSort:
+
+    def test_sort_by_domain__stable_and_nulls_last(self):
+        table = sort_by_domain(month_data(['b.com', None, 'a.com', 'b.com']))
+
+        assert table['url_domain'].to_pylist() == ['a.com', 'b.com', 'b.com', None]
+        assert table['url'].to_pylist() == ["https://a.com/2", "https://b.com/0", "https://b.com/3", "https://None/1"]
+
+    def test_merge_sorted_runs(self, tmp_path):
+        runs_domains = [
+            ['c.com', 'a.com', 'e.com', 'a.com', 'g.com'],
+            ['b.com', 'a.com', None, 'f.com'],
+            [],
+            ['h.com', 'd.com', 'b.com', 'a.com', 'c.com', 'i.com'],
+        ]
+        runs = []
+        for run_idx, domains in enumerate(runs_domains):
+            runs.append(tmp_path / f"run_{run_idx}.parquet")
+            pq.write_table(sort_by_domain(month_data(domains)), runs[-1])
+
+        merge_sorted_runs(runs, tmp_path / "merged.parquet", SCHEMA, row_group_size=4, batch_size=2)
+
+        merged = pq.ParquetFile(tmp_path / "merged.parquet")
+        all_domains = [domain for domains in runs_domains for domain in domains]
+        assert merged.read()['url_domain'].to_pylist() == [*sorted(filter(None, all_domains)), None]
+        assert [merged.metadata.row_group(row_group).num_rows for row_group in range(merged.num_row_groups)] == \
+               [4, 4, 4, 3]
+
+    def test_merge_sorted_runs__compression(self, tmp_path):
+        run = tmp_path / "run.parquet"
+        pq.write_table(sort_by_domain(month_data(['b.com', 'a.com'])), run)
+
+        merge_sorted_runs([run], tmp_path / "merged.parquet", SCHEMA, compression="zstd")
+
+        merged = pq.ParquetFile(tmp_path / "merged.parquet")
+        assert merged.metadata.row_group(0).column(0).compression == "ZSTD"
+        assert merged.read()['url_domain'].to_pylist() == ['a.com', 'b.com']
+
+    def test_merge_sorted_runs__segments_removed_once_merged(self, tmp_path, monkeypatch):
+        runs_domains = [
+            ['c.com', 'a.com', 'e.com', 'a.com', 'g.com'],
+            ['h.com', 'd.com', None, 'b.com', 'a.com'],
+        ]
+        runs = []
+        for run_idx, domains in enumerate(runs_domains):
+            runs.append(tmp_path / f"run_{run_idx}.sorted")
+            write_sorted_run(sort_by_domain(month_data(domains)).replace_schema_metadata({"run": str(run_idx)}),
+                             runs[-1], segment_rows=2)
+
+        segments = sorted_run_segments(runs[0])
+        assert [segment.name for segment in segments] == \
+               ["segment_000000.parquet", "segment_000001.parquet", "segment_000002.parquet"]
+        # The metadata is stored in the first segment only
+        assert [(pq.read_schema(segment).metadata or {}).get(b"run") for segment in segments] == [b"0", None, None]
+
+        # Segments left on the disk whenever a row group of the merged file is written
+        segments_left = []
+        original_write_table = pq.ParquetWriter.write_table
+
+        def write_table(writer, table, *args, **kwargs):
+            segments_left.append(sum(len(sorted_run_segments(run)) for run in runs))
+            original_write_table(writer, table, *args, **kwargs)
+
+        monkeypatch.setattr(pq.ParquetWriter, "write_table", write_table)
+        merge_sorted_runs(runs, tmp_path / "merged.parquet", SCHEMA, row_group_size=2, batch_size=2,
+                          remove_merged=True)
+        monkeypatch.undo()
+
+        all_domains = [domain for domains in runs_domains for domain in domains]
+        assert pq.read_table(tmp_path / "merged.parquet")['url_domain'].to_pylist() == \
+               [*sorted(filter(None, all_domains)), None]
+        # The merged segments are removed while the merged file is being written
+        assert segments_left == sorted(segments_left, reverse=True) and segments_left[-1] <= 2
+        assert not any(run.exists() for run in runs)
@@ -0,0 +1,46 @@
+import json
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.month_totals import MONTH_TOTALS_COLUMNS, MONTH_TOTALS_METADATA_KEY, month_totals_from_table, \
+    read_all_month_totals, read_month_totals, with_month_totals
+
+
+def write_month(file_path, totals, totals_type: pa.DataType):
+    table = pa.table({
+        'url_domain': ['a.com', 'b.com'],
+        **{column: pa.array([total, total], type=totals_type) for total, column in zip(totals, MONTH_TOTALS_COLUMNS)},
+    })
+    table = table.replace_schema_metadata(with_month_totals(table.schema, month_totals_from_table(table)).metadata)
+    pq.write_table(table, file_path)
+
+
+class TestMonthTotals:
+
+    def test_month_totals_from_table__v1_totals_cast_to_integers(self, tmp_path):
+        write_month(tmp_path / "nel_data_2019_01.parquet", ["10", "11", "12", "13", None, "15"],
+                    pa.dictionary(pa.int64(), pa.string()))
+
+        metadata = pq.read_schema(tmp_path / "nel_data_2019_01.parquet").metadata[MONTH_TOTALS_METADATA_KEY]
+        assert json.loads(metadata) == dict(zip(MONTH_TOTALS_COLUMNS, [10, 11, 12, 13, None, 15]))
+
+        # Typed the same as when read from the row data
+        month_totals = read_month_totals(tmp_path / "nel_data_2019_01.parquet")
+        row_data = pq.read_table(tmp_path / "nel_data_2019_01.parquet").to_pandas()[MONTH_TOTALS_COLUMNS].head(1)
+        assert month_totals.dtypes.tolist() == row_data.dtypes.tolist()
+        assert month_totals.astype(object).equals(row_data.astype(object))
+
+    def test_read_all_month_totals__from_footers(self, tmp_path):
+        write_month(tmp_path / "nel_data_2024_01.parquet", list(range(20, 26)), pa.uint32())
+        write_month(tmp_path / "nel_data_2019_01.parquet", ["10", "11", "12", "13", None, "15"],
+                    pa.dictionary(pa.int64(), pa.string()))
+        pq.write_table(pa.table({'url_domain': ['a.com']}), tmp_path / "nel_data_2020_01.parquet")  # No totals
+
+        month_totals = read_all_month_totals(tmp_path)
+
+        assert month_totals['date'].tolist() == ["2019-01", "2024-01"]
+        assert month_totals[MONTH_TOTALS_COLUMNS].iloc[0].tolist() == [10, 11, 12, 13, pd.NA, 15]
+        assert month_totals[MONTH_TOTALS_COLUMNS].iloc[1].tolist() == [20, 21, 22, 23, 24, 25]
+        assert all(str(dtype) == "Int64" for dtype in month_totals[MONTH_TOTALS_COLUMNS].dtypes)
@@ -0,0 +1,175 @@
+import io
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame
+
+from src.month_scan import scan_month
+from src.month_totals import MONTH_TOTALS_COLUMNS, with_month_totals
+from src.nel_analyis import CollectorProviderUsageMetric, DomainTable, NelConfigMetric, NelDeploymentMetric, \
+    analyze_month_independent_metrics
+
+TEST_PSL = """
+// ===BEGIN ICANN DOMAINS===
+com
+co.uk
+// ===END ICANN DOMAINS===
+"""
+
+
+class TestCollectorProviderUsageMetric:
+
+    @staticmethod
+    def compute(data: DataFrame, used_psl=None, aggregated_providers=np.empty(0, dtype=str)) -> DataFrame:
+        metric = CollectorProviderUsageMetric("2024-01", aggregated_providers, used_psl)
+        metric.compute(data.groupby('url_domain', sort=False).first())
+        metric._assemble_result()
+
+        return metric.result.set_index('providers')
+
+    def test_primary_secondary_and_fallback_usage(self):
+        data = DataFrame({
+            'url_domain': ['a.com', 'b.com', 'c.com', 'd.com', 'a.com'],
+            'rt_collectors_registrable': [
+                ['p1.com', 'p2.com', 'p3.com', 'p4.com'],
+                ['p2.com', 'p1.com'],
+                ['p1.com'],
+                [],
+                ['p4.com'],  # Only the first collectors found for a domain count
+            ],
+        })
+
+        result = self.compute(data, aggregated_providers=np.array(['p0.com'], dtype=object))
+
+        assert sorted(result.index.tolist()) == ['p0.com', 'p1.com', 'p2.com', 'p3.com', 'p4.com']
+        assert result.loc['p1.com', 'as_primary'] == 2
+        assert result.loc['p2.com', 'as_primary'] == 1
+        assert result.loc['p1.com', 'share_as_primary'] == 2 / 4 * 100
+        assert result.loc['p1.com', 'as_secondary'] == 1
+        assert result.loc['p2.com', 'as_secondary'] == 1
+        assert result.loc['p3.com', 'among_fallback'] == 1
+        assert result.loc['p4.com', 'among_fallback'] == 1
+        assert result.loc['p0.com', 'as_primary'] == 0
+
+    def test_collectors_mapped_to_registrable_domains(self):
+        data = DataFrame({
+            'url_domain': ['a.com', 'b.com'],
+            'rt_collectors': [
+                ['nel.p1.com', 'report.p2.co.uk'],
+                ['eu.p1.com', 'us.p1.com'],
+            ],
+        })
+
+        result = self.compute(data, used_psl=io.StringIO(TEST_PSL))
+
+        assert result.index.tolist() == ['p1.com', 'p2.co.uk']
+        assert result.loc['p1.com', 'as_primary'] == 2
+        assert result.loc['p1.com', 'as_secondary'] == 1
+        assert result.loc['p2.co.uk', 'as_secondary'] == 1
+
+    def test_no_collectors(self):
+        data = DataFrame({'url_domain': [], 'rt_collectors_registrable': []})
+
+        result = self.compute(data)
+
+        assert len(result) == 0
+
+
+class TestDomainTable:
+
+    @staticmethod
+    def write_month(input_file: Path, max_age: str = '60'):
+        pq.write_table(pa.table({
+            'url_domain': ['a.com', 'b.com', 'a.com'],
+            'url_domain_hosted_resources': ['2', '1', '2'],
+            'url_domain_hosted_resources_with_nel': ['2', '1', '2'],
+            'url_domain_monitored_resources_ratio': [1.0, 1.0, 1.0],
+            'nel_max_age': [None, max_age, '3600'],
+            'nel_failure_fraction': ['1.0', '0.5', '1.0'],
+            'nel_success_fraction': ['0.0', '0.0', '0.0'],
+            'nel_include_subdomains': ['true', 'false', 'true'],
+            'rt_collectors': [['nel.p1.com'], ['nel.p2.com', 'nel.p1.com'], ['nel.p3.com']],
+        }), input_file)
+
+    def test_domain_table__first_values_per_domain_of_available_columns(self, tmp_path):
+        input_file = tmp_path / "nel_data_2024_01.parquet"
+        self.write_month(input_file)
+
+        domain_table_builder = DomainTable("2024-01", input_file)
+        scan_month(input_file, [domain_table_builder])
+        domain_table = domain_table_builder.result
+
+        assert 'rt_collectors_registrable' not in domain_table.columns
+        assert list(domain_table.index) == ['a.com', 'b.com']
+        assert domain_table.loc['a.com', 'nel_max_age'] == '3600'
+        assert list(domain_table.loc['a.com', 'rt_collectors']) == ['nel.p1.com']
+
+    def test_load__reused_only_for_the_same_month_data_file(self, tmp_path):
+        input_file = tmp_path / "nel_data_2024_01.parquet"
+        self.write_month(input_file)
+
+        domain_table_builder = DomainTable("2024-01", input_file)
+        scan_month(input_file, [domain_table_builder])
+        domain_table_builder.save(str(tmp_path / "domain_tables"))
+
+        loaded = DomainTable.load(str(tmp_path / "domain_tables"), "2024-01", input_file)
+        assert loaded['nel_max_age'].tolist() == domain_table_builder.result['nel_max_age'].tolist()
+
+        self.write_month(input_file, max_age='86400')
+        assert DomainTable.load(str(tmp_path / "domain_tables"), "2024-01", input_file) is None
+
+    def test_analyze_month_independent_metrics__domain_metrics_from_saved_domain_table(self, tmp_path, monkeypatch):
+        input_file = tmp_path / "nel_data_2024_01.parquet"
+        self.write_month(input_file)
+        domain_table_dir = str(tmp_path / "domain_tables")
+        output_dir = str(tmp_path / "metrics")
+
+        analyze_month_independent_metrics(input_file, "2024-01", None, output_dir, [NelConfigMetric.name],
+                                          domain_table_dir)
+        expected = pd.read_parquet(tmp_path / "metrics" / "nel_config" / "max_age_2024-01.parquet")
+
+        def scan_month_not_expected(*_):
+            raise AssertionError("The month data file should not be scanned again")
+
+        monkeypatch.setattr("src.nel_analyis.scan_month", scan_month_not_expected)
+        analyze_month_independent_metrics(input_file, "2024-01", None, output_dir, [NelConfigMetric.name],
+                                          domain_table_dir)
+
+        assert pd.read_parquet(tmp_path / "metrics" / "nel_config" / "max_age_2024-01.parquet").equals(expected)
+
+
+class TestNelDeploymentMetric:
+
+    @staticmethod
+    def write_month(input_file: Path, with_footer_totals: bool):
+        table = pa.table({
+            'url_domain': ['a.com', 'b.com'],
+            **{column: pa.array([total, total], type=pa.uint32())
+               for total, column in enumerate(MONTH_TOTALS_COLUMNS, start=10)},
+        })
+        if with_footer_totals:
+            month_totals = {column: table.column(column)[0].as_py() for column in MONTH_TOTALS_COLUMNS}
+            table = table.replace_schema_metadata(with_month_totals(table.schema, month_totals).metadata)
+
+        pq.write_table(table, input_file)
+
+    def test_compute_from_month_totals__same_as_scanned(self, tmp_path, monkeypatch):
+        self.write_month(tmp_path / "without_totals.parquet", with_footer_totals=False)
+        self.write_month(tmp_path / "with_totals.parquet", with_footer_totals=True)
+
+        scanned = NelDeploymentMetric("2024-01")
+        assert not scanned.compute_from_month_totals(tmp_path / "without_totals.parquet")
+        scan_month(tmp_path / "without_totals.parquet", [scanned])
+
+        def scan_month_not_expected(*_):
+            raise AssertionError("The month data file should not be scanned")
+
+        monkeypatch.setattr("src.nel_analyis.scan_month", scan_month_not_expected)
+        analyze_month_independent_metrics(tmp_path / "with_totals.parquet", "2024-01", None, str(tmp_path),
+                                          [NelDeploymentMetric.name])
+
+        result = pd.read_parquet(tmp_path / "nel_deployment" / "2024-01.parquet")
+        assert result.equals(scanned.result.reset_index(drop=True))
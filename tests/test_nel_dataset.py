@@ -0,0 +1,93 @@
+import zlib
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.classes.AnalysisManifest import AnalysisManifest
+from src.domain_lookup import lookup_domains
+from src.month_scan import FirstValuesPerDomain, scan_month
+from src.month_totals import MONTH_TOTALS_COLUMNS, month_totals_from_table, read_month_totals, with_month_totals
+from src.nel_dataset import domain_buckets, month_date, month_filter, month_partition_dir, month_partition_dirs, \
+    open_nel_dataset, write_month_partition
+
+DOMAINS = [f"d{domain}.com" for domain in range(20)]
+
+
+class DomainAccumulator:
+    columns = ['url_domain', 'status']
+
+    def __init__(self):
+        self._domains = FirstValuesPerDomain(['status'])
+        self.result = None
+
+    def consume(self, batch):
+        self._domains.update(batch)
+
+    def finalize(self):
+        self.result = self._domains.result()
+
+
+def write_month(file_path, status: int = 200):
+    table = pa.table({
+        'url_domain': pa.array(sorted(DOMAINS * 2)).dictionary_encode(),
+        'status': pa.array([status + row for row in range(len(DOMAINS) * 2)], type=pa.uint16()),
+        **{column: pa.array([len(DOMAINS)] * len(DOMAINS) * 2, type=pa.uint32()) for column in MONTH_TOTALS_COLUMNS},
+    })
+    table = table.replace_schema_metadata(with_month_totals(table.schema, month_totals_from_table(table)).metadata)
+    pq.write_table(table, file_path)
+
+
+class TestNelDataset:
+
+    def test_domain_buckets__stable(self):
+        buckets = domain_buckets(pa.array(["a.com", "example.com", None, "a.com"]).dictionary_encode(), 8)
+
+        # CRC32 of the domain modulo the number of buckets (nulls go to bucket 0)
+        assert buckets.to_pylist() == [zlib.crc32(b"a.com") % 8, zlib.crc32(b"example.com") % 8, 0,
+                                       zlib.crc32(b"a.com") % 8]
+
+    def test_write_month_partition__same_data_as_month_file(self, tmp_path):
+        write_month(tmp_path / "nel_data_2024_01.parquet")
+        write_month_partition(tmp_path / "nel_data_2024_01.parquet", tmp_path / "dataset", "2024-01", buckets=4)
+
+        partition_dir = month_partition_dir(tmp_path / "dataset", "2024-01")
+        assert month_partition_dirs(tmp_path / "dataset") == [partition_dir]
+        assert month_date(partition_dir) == month_date(tmp_path / "nel_data_2024_01.parquet") == "2024-01"
+        assert read_month_totals(partition_dir)['total_crawled_domains'].tolist() == [len(DOMAINS)]
+
+        from_file, from_partition = DomainAccumulator(), DomainAccumulator()
+        scan_month(tmp_path / "nel_data_2024_01.parquet", [from_file])
+        scan_month(partition_dir, [from_partition], batch_size=7)
+
+        assert from_partition.result.sort_index().equals(from_file.result.sort_index())
+
+    def test_write_month_partition__replaces_the_month(self, tmp_path):
+        write_month(tmp_path / "nel_data_2024_01.parquet")
+        write_month_partition(tmp_path / "nel_data_2024_01.parquet", tmp_path / "dataset", "2024-01", buckets=4)
+        fingerprint = AnalysisManifest(tmp_path / "manifest.json").fingerprint(
+            month_partition_dir(tmp_path / "dataset", "2024-01"))
+
+        write_month(tmp_path / "nel_data_2024_01.parquet", status=300)
+        write_month_partition(tmp_path / "nel_data_2024_01.parquet", tmp_path / "dataset", "2024-01", buckets=2)
+        write_month_partition(tmp_path / "nel_data_2024_01.parquet", tmp_path / "dataset", "2024-02", buckets=2)
+
+        dataset = open_nel_dataset(tmp_path / "dataset")
+        january = dataset.to_table(filter=month_filter(["2024-01"]))
+        assert january.num_rows == len(DOMAINS) * 2
+        assert min(january['status'].to_pylist()) == 300
+        assert AnalysisManifest(tmp_path / "manifest.json").fingerprint(
+            month_partition_dir(tmp_path / "dataset", "2024-01")).sha256 != fingerprint.sha256
+
+    def test_lookup_domains__in_dataset(self, tmp_path):
+        write_month(tmp_path / "nel_data_2024_01.parquet")
+        for date in ["2024-01", "2024-02"]:
+            write_month_partition(tmp_path / "nel_data_2024_01.parquet", tmp_path / "dataset", date, buckets=4)
+
+        result = lookup_domains(["d3.com", "x.com"], None, tmp_path / "dataset", columns=['url_domain', 'status'])
+
+        assert result['date'].tolist() == ["2024-01", "2024-01", "2024-02", "2024-02"]
+        assert result['url_domain'].astype(str).tolist() == ["d3.com"] * 4
+
+        result = lookup_domains(["d3.com"], ["2024-02"], tmp_path / "dataset")
+        assert result['date'].tolist() == ["2024-02", "2024-02"]
+        assert 'domain_bucket' not in result.columns
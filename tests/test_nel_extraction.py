@@ -0,0 +1,102 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.classes.PslResolver import PslResolver
+from src.data_schemas import PYARROW_MERGE_WRITE_SCHEMA_V2, PYARROW_NEL_QUERY_RESULT_SCHEMA
+from src.month_totals import read_month_totals
+from src.nel_extraction import RT_COLLECTOR_PATTERN, _extract_all, extract_nel_data, extract_nel_data_from_files, \
+    write_month_data_file
+from src.schema_migration import is_schema_v2
+from tests.fixtures.summary_requests import summary_requests
+
+
+class TestNelExtraction:
+
+    def test_extract_nel_data(self):
+        result = extract_nel_data(summary_requests())
+
+        assert result.schema.equals(PYARROW_NEL_QUERY_RESULT_SCHEMA)
+        assert result['requestId'].to_pylist() == [1, 3]
+
+        row = result.slice(0, 1).to_pylist()[0]
+        assert row == {
+            'requestId': 1, 'firstReq': True, 'type': 'html', 'ext': 'html', 'status': 200,
+            'url': 'https://www.example.com/',
+            'url_domain': 'www.example.com',
+            'url_domain_registrable': 'example.com',
+            'url_domain_hosted_resources': 3,
+            'url_domain_hosted_resources_with_nel': 2,
+            'url_domain_monitored_resources_ratio': 66.67,
+            'total_crawled_resources': 5,
+            'total_crawled_domains': 3,
+            'total_crawled_resources_with_nel': 3,
+            'total_crawled_domains_with_nel': 2,
+            'total_crawled_resources_with_correct_nel': 2,
+            'total_crawled_domains_with_correct_nel': 1,
+            'nel_max_age': '86400',
+            'nel_failure_fraction': '1.0',
+            'nel_success_fraction': '0.0',
+            'nel_include_subdomains': 'true',
+            'nel_report_to': 'default',
+            'rt_collectors': ['nel.example-cdn.com', 'b.report-uri.co.uk'],
+            # Without a PSL - TLD + second to last label, or the collector itself ("-" is not matched by \w)
+            'rt_collectors_registrable': ['nel.example-cdn.com', 'co.uk'],
+        }
+
+    def test_extract_nel_data__psl(self):
+        result = extract_nel_data(summary_requests(), PslResolver(["com", "uk", "co.uk"]))
+
+        assert result['rt_collectors_registrable'].to_pylist()[0] == ['example-cdn.com', 'report-uri.co.uk']
+        assert result['url_domain_registrable'].to_pylist() == ['example.com', 'example.com']
+
+    def test_extract_nel_data__no_nel(self):
+        requests = summary_requests().filter(pa.array([False, False, False, True, False, True]))
+
+        result = extract_nel_data(requests)
+
+        assert result.num_rows == 0
+        assert result.schema.equals(PYARROW_NEL_QUERY_RESULT_SCHEMA)
+
+    def test_extract_nel_data__workers(self):
+        # Shards of 2 rows - the NEL rows of a URL, of a domain and the Report-To groups span several shards
+        result = extract_nel_data(summary_requests(), workers=3, shard_rows=2)
+
+        assert result.equals(extract_nel_data(summary_requests()))
+
+    def test_extract_all__rt_collectors(self):
+        rt_values = pa.array([
+            '{"group":"default","endpoints":[{"url":"https://a.com/r"},{"url":"http:\\/\\/b.org\\/r"}]}',
+            '{"group":"default","endpoints":[{"url":"https://only.com"}]}',
+            '{"group":"default","endpoints":[]}',
+            None,
+            '{"endpoints":[{"url":"https://a.com/1"},{"url":"https://c.com/2"},\n{"url": "https://a.com/3"}]}',
+        ])
+
+        # The same as REGEXP_EXTRACT_ALL - the matches of a row in their order
+        assert _extract_all(rt_values, RT_COLLECTOR_PATTERN).to_pylist() == [
+            ['a.com', 'b.org'], ['only.com'], [], [], ['a.com', 'c.com', 'a.com'],
+        ]
+        assert _extract_all(pa.array([], type=pa.string()), RT_COLLECTOR_PATTERN).to_pylist() == []
+
+    def test_extract_nel_data_from_files(self, tmp_path):
+        requests = summary_requests()
+        pq.write_table(requests.slice(0, 4), tmp_path / "desktop.parquet", row_group_size=3)
+        (tmp_path / "mobile").mkdir()
+        pq.write_table(requests.slice(4), tmp_path / "mobile" / "000000000000.parquet")
+
+        result = extract_nel_data_from_files([tmp_path / "desktop.parquet", tmp_path / "mobile"], workers=2)
+
+        assert result.equals(extract_nel_data(requests))
+
+    def test_write_month_data_file(self, tmp_path):
+        output_file = tmp_path / "nel_data_2024_01.parquet"
+
+        write_month_data_file(extract_nel_data(summary_requests()), output_file)
+
+        month_data = pq.read_table(output_file)
+        assert is_schema_v2(month_data.schema)
+        assert month_data.schema.remove_metadata().equals(PYARROW_MERGE_WRITE_SCHEMA_V2.remove_metadata())
+        assert month_data['requestId'].to_pylist() == [1, 3]
+        assert month_data['nel_include_subdomains'].to_pylist() == [True, True]
+        assert read_month_totals(output_file).iloc[0].tolist() == [5, 3, 3, 2, 2, 1]
+        assert list(tmp_path.iterdir()) == [output_file]
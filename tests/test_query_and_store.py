@@ -0,0 +1,184 @@
+import json
+
+import google.api_core.exceptions
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pytest
+
+import query_and_store
+from src.classes.LocalDirectoryBucket import LocalDirectoryBucket
+from src.month_sort import sort_by_domain
+from src.month_totals import read_month_totals
+from src.schema_migration import to_schema_v2
+from tests.fixtures.summary_requests import summary_requests
+from tests.test_schema_migration import month_data_v1
+
+
+def _table_id(table) -> str:
+    return table if isinstance(table, str) else f"{table.project}.{table.dataset_id}.{table.table_id}"
+
+
+class StandInBigQueryClient(object):
+    """Keeps the temporary tables in memory - the result of a query is the month data registered for it"""
+
+    project = query_and_store.GC_PROJECT_NAME
+
+    def __init__(self, bucket_dir, query_results: dict):
+        self.tables = {}
+        self._bucket_dir = bucket_dir
+        self._query_results = query_results
+
+    def create_table(self, table):
+        if _table_id(table) in self.tables:
+            raise google.api_core.exceptions.Conflict("Already exists")
+        self.tables[_table_id(table)] = None
+        return table
+
+    def delete_table(self, table, not_found_ok: bool = False):
+        if self.tables.pop(_table_id(table), "missing") == "missing" and not not_found_ok:
+            raise google.api_core.exceptions.NotFound("Not found")
+
+    def query_and_wait(self, query: str, job_config=None):
+        self.tables[_table_id(job_config.destination)] = self._query_results[query]
+
+    def extract_table(self, table_ref, destination_uri: str, **_):
+        table = self.tables[_table_id(table_ref)]
+        blob_name_pattern = destination_uri.split("/")[-1]
+
+        # Every month is exported as 2 blobs
+        half = table.num_rows // 2
+        for blob_idx, blob_rows in enumerate([table.slice(0, half), table.slice(half)]):
+            pq.write_table(blob_rows, self._bucket_dir / blob_name_pattern.replace("*", f"{blob_idx:012}"))
+
+        return self
+
+    def result(self):
+        pass
+
+
+class StandInStorageClient(object):
+
+    def __init__(self, bucket_dir):
+        self._bucket_dir = bucket_dir
+
+    def get_bucket(self, _):
+        return LocalDirectoryBucket(self._bucket_dir)
+
+
+class TestQueryAndStore:
+
+    @pytest.mark.parametrize("depth", [0, 1])
+    def test_query_and_store_months(self, tmp_path, monkeypatch, depth):
+        monkeypatch.setattr(query_and_store, "DOWNLOAD_OUTPUT_DIR_PATH", str(tmp_path / "raw"))
+        monkeypatch.setattr(query_and_store, "DOWNLOAD_TEMP_BLOBS_DIR_PATH", str(tmp_path / "raw" / "blobs"))
+        (tmp_path / "bucket").mkdir()
+
+        months = {f"nel_data_2024_0{month}": month_data_v1(month + 4) for month in range(1, 4)}
+        query_client = StandInBigQueryClient(tmp_path / "bucket", {f"QUERY {name}": table
+                                                                   for name, table in months.items()})
+        download_entries = [(name, f"QUERY {name}") for name in months]
+
+        query_and_store.query_and_store_months(download_entries, query_client,
+                                               StandInStorageClient(tmp_path / "bucket"), depth=depth)
+
+        for name, table in months.items():
+            output_file = tmp_path / "raw" / f"{name}.parquet"
+            assert pq.read_table(output_file).equals(sort_by_domain(to_schema_v2(table)))
+            assert read_month_totals(output_file).iloc[0].tolist() == list(range(10, 16))
+
+        # Temporary tables & blobs cleaned up
+        assert query_client.tables == {}
+        assert list((tmp_path / "bucket").iterdir()) == []
+        assert list((tmp_path / "raw" / "blobs").iterdir()) == []
+
+    def test_query_and_store_months__exported_months_not_queried_again(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(query_and_store, "DOWNLOAD_OUTPUT_DIR_PATH", str(tmp_path / "raw"))
+        monkeypatch.setattr(query_and_store, "DOWNLOAD_TEMP_BLOBS_DIR_PATH", str(tmp_path / "raw" / "blobs"))
+        (tmp_path / "bucket").mkdir()
+
+        months = {f"nel_data_2024_0{month}": month_data_v1(month + 4) for month in range(1, 3)}
+        query_client = StandInBigQueryClient(tmp_path / "bucket", {f"QUERY {name}": table
+                                                                   for name, table in months.items()})
+        storage_client = StandInStorageClient(tmp_path / "bucket")
+
+        # Interrupted run - the first month exported & a month no longer to download left in the bucket
+        query_and_store.populate_temp_table_with_query_results(query_client, "QUERY nel_data_2024_01",
+                                                               "nel_data_2024_01")
+        query_and_store.export_temp_table_to_storage_bucket_blobs(query_client, "nel_data_2024_01")
+        (tmp_path / "bucket" / "nel_data_2023_12-000000000000.parquet.snappy").write_bytes(b"stale")
+
+        query_and_store.clean_stale_exports(storage_client, list(months))
+        assert sorted(path.name for path in (tmp_path / "bucket").iterdir()) == \
+            [f"nel_data_2024_01-{blob_idx:012}.parquet.snappy" for blob_idx in range(2)]
+
+        queried = []
+        monkeypatch.setattr(query_and_store, "populate_temp_table_with_query_results",
+                            lambda client, query, output_filename: queried.append(output_filename))
+        monkeypatch.setattr(query_client, "extract_table", lambda table_ref, destination_uri, **_: query_client)
+        query_and_store.query_and_store_months([(name, f"QUERY {name}") for name in months], query_client,
+                                               storage_client)
+
+        assert queried == ["nel_data_2024_02"]
+        output_file = tmp_path / "raw" / "nel_data_2024_01.parquet"
+        assert pq.read_table(output_file).equals(sort_by_domain(to_schema_v2(months["nel_data_2024_01"])))
+
+    def test_download_blobs_from_storage_bucket__sorted_blobs_not_downloaded_again(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(query_and_store, "DOWNLOAD_OUTPUT_DIR_PATH", str(tmp_path / "raw"))
+        monkeypatch.setattr(query_and_store, "DOWNLOAD_TEMP_BLOBS_DIR_PATH", str(tmp_path / "raw" / "blobs"))
+        (tmp_path / "raw").mkdir()
+        (tmp_path / "bucket").mkdir()
+
+        month = month_data_v1(5)
+        query_client = StandInBigQueryClient(tmp_path / "bucket", {"QUERY": month})
+        query_and_store.populate_temp_table_with_query_results(query_client, "QUERY", "nel_data_2024_01")
+        query_and_store.export_temp_table_to_storage_bucket_blobs(query_client, "nel_data_2024_01")
+        storage_client = StandInStorageClient(tmp_path / "bucket")
+
+        # Interrupted before the merge - only the sorted runs are left of the blobs
+        query_and_store.download_blobs_from_storage_bucket(storage_client, "nel_data_2024_01")
+        blob_files = sorted(path.name for path in (tmp_path / "raw" / "blobs").iterdir())
+        assert blob_files == [f"nel_data_2024_01-{blob_idx:012}.parquet.snappy.sorted" for blob_idx in range(2)]
+
+        sorted_blobs = []
+        monkeypatch.setattr(query_and_store, "sort_downloaded_blob", sorted_blobs.append)
+        query_and_store.download_blobs_from_storage_bucket(storage_client, "nel_data_2024_01")
+        assert sorted_blobs == []
+
+        query_and_store.merge_downloaded_blobs_into_single_file("nel_data_2024_01")
+        assert pq.read_table(tmp_path / "raw" / "nel_data_2024_01.parquet").equals(sort_by_domain(to_schema_v2(month)))
+
+    def test_main__local_backend(self, tmp_path, monkeypatch):
+        for name, value in [("GC_BACKEND", "local"),
+                            ("LOCAL_BACKEND_TABLES_DIR_PATH", str(tmp_path / "tables")),
+                            ("LOCAL_BACKEND_STORAGE_DIR_PATH", str(tmp_path / "storage")),
+                            ("LOCAL_BACKEND_PSL_FILE_PATH", str(tmp_path / "no_psl.dat")),
+                            ("LOCAL_BACKEND_LATENCY", 0.0),
+                            ("LOCAL_BACKEND_BANDWIDTH", None),
+                            ("LOCAL_BACKEND_EXPORT_BLOB_ROWS", 1),
+                            ("DOWNLOAD_OUTPUT_DIR_PATH", str(tmp_path / "raw")),
+                            ("DOWNLOAD_TEMP_BLOBS_DIR_PATH", str(tmp_path / "raw" / "blobs")),
+                            ("DOWNLOAD_CONFIG_PATH", str(tmp_path / "download_config.json"))]:
+            monkeypatch.setattr(query_and_store, name, value)
+
+        (tmp_path / "tables").mkdir()
+        desktop = summary_requests()
+        mobile = desktop.set_column(0, 'requestid', pc.add(desktop['requestid'], 100))
+        pq.write_table(desktop, tmp_path / "tables" / "httparchive.summary_requests.2024_01_01_desktop.parquet")
+        pq.write_table(mobile, tmp_path / "tables" / "httparchive.summary_requests.2024_01_01_mobile.parquet")
+        (tmp_path / "download_config.json").write_text(json.dumps([{
+            "input_desktop": ["httparchive.summary_requests.2024_01_01_desktop"],
+            "input_mobile": ["httparchive.summary_requests.2024_01_01_mobile"],
+            "processed_output": "nel_data_2024_01",
+        }]))
+
+        query_and_store.main()
+
+        # The latest requests (the mobile ones) of the 2 resources with a correct NEL
+        output_file = tmp_path / "raw" / "nel_data_2024_01.parquet"
+        month_data = pq.read_table(output_file)
+        assert sorted(month_data['requestId'].to_pylist()) == [101, 103]
+        assert month_data['rt_collectors'].to_pylist() == [['nel.example-cdn.com', 'b.report-uri.co.uk']] * 2
+        assert read_month_totals(output_file).iloc[0].tolist() == [5, 3, 3, 2, 2, 1]
+
+        assert list((tmp_path / "storage" / query_and_store.DATA_EXPORT_BUCKET_NAME).iterdir()) == []
@@ -0,0 +1,77 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data_schemas import PYARROW_MERGE_WRITE_SCHEMA, PYARROW_MERGE_WRITE_SCHEMA_V2
+from src.month_totals import MONTH_TOTALS_COLUMNS, read_month_totals
+from src.schema_migration import is_schema_v2, migrate_month_file, to_schema_v2
+
+
+def month_data_v1(rows: int = 4) -> pa.Table:
+    string_values = {
+        'status': '200',
+        'url_domain_hosted_resources': '4',
+        'url_domain_hosted_resources_with_nel': '3',
+        'nel_report_to': 'default',
+        **{column: str(total) for total, column in enumerate(MONTH_TOTALS_COLUMNS, start=10)},
+    }
+    columns = {
+        'requestId': list(range(rows)),
+        'firstReq': [True] * rows,
+        'type': ['html'] * rows,
+        'ext': ['html'] * rows,
+        'url': [f"https://example.com/{row}" for row in range(rows)],
+        'url_domain': ['example.com'] * rows,
+        'url_domain_registrable': ['example.com'] * rows,
+        'url_domain_monitored_resources_ratio': [0.75] * rows,
+        'nel_max_age': (['86400', None, '99999999999', '3600'] * rows)[:rows],
+        'nel_failure_fraction': (['1.0', '0.05', '1.0.0', '.5'] * rows)[:rows],
+        'nel_success_fraction': ['0.0'] * rows,
+        'nel_include_subdomains': (['true', 'False', 'yes', None] * rows)[:rows],
+        'rt_collectors': [['nel.example.com']] * rows,
+        'rt_collectors_registrable': [['example.com']] * rows,
+        **{column: [value] * rows for column, value in string_values.items()},
+    }
+
+    return pa.table({field.name: columns[field.name] for field in PYARROW_MERGE_WRITE_SCHEMA}) \
+        .cast(PYARROW_MERGE_WRITE_SCHEMA)
+
+
+class TestSchemaMigration:
+
+    def test_to_schema_v2__values_parsed(self):
+        table = to_schema_v2(month_data_v1())
+
+        assert table.schema.equals(PYARROW_MERGE_WRITE_SCHEMA_V2)
+        assert table['status'].to_pylist() == [200] * 4
+        assert table['total_crawled_domains'].to_pylist() == [11] * 4
+        assert table['nel_report_to'].to_pylist() == ['default'] * 4
+        assert table['nel_success_fraction'].to_pylist() == [0.0] * 4
+
+        # Malformed & out of range values -> null
+        assert table['nel_max_age'].to_pylist() == [86400, None, None, 3600]
+        assert table['nel_failure_fraction'].to_pylist() == [1.0, pa.scalar(0.05, pa.float32()).as_py(), None, 0.5]
+        assert table['nel_include_subdomains'].to_pylist() == [True, False, None, None]
+
+    def test_to_schema_v2__from_downloaded_blob_strings(self):
+        table = month_data_v1()
+        table = pa.table({name: table[name].cast(table[name].type.value_type)
+                          if pa.types.is_dictionary(table[name].type) else table[name]
+                          for name in table.column_names})
+
+        assert to_schema_v2(table).equals(to_schema_v2(month_data_v1()))
+
+    def test_migrate_month_file(self, tmp_path):
+        input_file = tmp_path / "nel_data_2024_01.parquet"
+        pq.write_table(month_data_v1(10), input_file, row_group_size=3)
+
+        assert migrate_month_file(input_file)
+
+        migrated = pq.ParquetFile(input_file)
+        assert is_schema_v2(migrated.schema_arrow)
+        assert migrated.num_row_groups == 4
+        assert migrated.read().equals(to_schema_v2(month_data_v1(10)))
+        assert read_month_totals(input_file).iloc[0].tolist() == list(range(10, 16))
+
+        # Already migrated -> left untouched
+        assert not migrate_month_file(input_file)
+        assert list(tmp_path.iterdir()) == [input_file]
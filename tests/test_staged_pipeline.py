@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from src.staged_pipeline import run_overlapped
+
+
+class TestStagedPipeline:
+
+    @pytest.mark.parametrize("depth", [0, 1, 2])
+    def test_run_overlapped__order_and_depth(self, depth):
+        first_stage_started = []
+        second_stage_runs = []
+
+        def first_stage(item):
+            first_stage_started.append(item)
+            return item * 10
+
+        def second_stage(item, first_stage_result):
+            # The first stage never runs more than depth items ahead
+            assert max(first_stage_started) <= item + depth
+            second_stage_runs.append((item, first_stage_result))
+
+        run_overlapped(range(5), first_stage, second_stage, depth=depth)
+
+        assert first_stage_started == list(range(5))
+        assert second_stage_runs == [(item, item * 10) for item in range(5)]
+
+    def test_run_overlapped__stages_overlap(self):
+        next_item_queried = threading.Event()
+
+        def first_stage(item):
+            if item == 1:
+                next_item_queried.set()
+
+        def second_stage(item, _):
+            # Waits for the first stage of the next item - would time out without the overlap
+            if item == 0:
+                assert next_item_queried.wait(timeout=5)
+
+        run_overlapped(range(2), first_stage, second_stage, depth=1)
+
+    def test_run_overlapped__first_stage_failure(self):
+        second_stage_runs = []
+
+        def first_stage(item):
+            if item == 1:
+                raise RuntimeError("Query failed")
+
+        with pytest.raises(RuntimeError, match="Query failed"):
+            run_overlapped(range(4), first_stage, lambda item, _: second_stage_runs.append(item), depth=1)
+
+        assert second_stage_runs == [0]